@@ -639,8 +639,16 @@ class AcqirisDigitizer():
 
     def getRoundRobinData(self, nSample, nSegment, nAverage, 
                           bConfig=True, bArm=True, bMeasure=True,
-                          funcStop=None, funcProgress=None):
-        """Get round-robin type data by continuous segmented acquisition"""
+                          funcStop=None, funcProgress=None,
+                          demodulator=None, bDemodRef=False,
+                          funcDemodConfig=None):
+        """Get round-robin type data by continuous segmented acquisition
+
+        If a demodulator is given, all single records of Ch1 are demodulated
+        after each call, with Ch2 as phase reference if bDemodRef. The
+        demodulator is configured by funcDemodConfig(dt), called with the
+        sample time of the first data read.
+        """
 #        import logging
 #        lg = logging.getLogger('LabberDriver')
         # total number of segments*nSample is 1024*8192
@@ -683,11 +691,14 @@ class AcqirisDigitizer():
             return
         # allocate memory
         lData = [np.zeros((nSegment, nSample)) for n in range(2)]
+        if demodulator is not None:
+            demodulator.reset(nCall * nSegCall)
         n1 = 0
         while n1 < nCall:
             # wait to acquire data for one buffer
             if not self.waitForEndOfAcquisition(timeout=600E3, funcStop=funcStop):
                 return (lData, 1.0)
+            lBlock = [np.array([]), np.array([])]
             for n2, channel in enumerate(lChannel):
                 # get data as numpy array
                 (dataArray, descriptor, segDesc) = self.readData(channel, self.readPar)
@@ -709,6 +720,20 @@ class AcqirisDigitizer():
                 # add data to corresponding segment
                 if len(vData)>0:
                     lData[n2] += np.sum(vData.reshape(nAvCall, nSegment, nSample), 0)
+                lBlock[n2] = vData
+                # configure demodulation with the time step of the data
+                if n1==0 and n2==0 and demodulator is not None and \
+                        funcDemodConfig is not None:
+                    funcDemodConfig(descriptor.sampTime)
+                    demodulator.reset(nCall * nSegCall)
+            # demodulate single records of this call
+            if demodulator is not None and demodulator.enabled and \
+                    len(lBlock[0]) == nSegCall * nSample:
+                vRef = None
+                if bDemodRef and len(lBlock[1]) == nSegCall * nSample:
+                    vRef = lBlock[1].reshape((nSegCall, nSample))
+                demodulator.add(lBlock[0].reshape((nSegCall, nSample)),
+                                n1 * nSegCall, ref=vRef)
             # free data bank and continue with next values
             self.freeBank()
             n1 += 1
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import AcqirisWrapper as Aq
+import demodulation
+from demodulation import Demodulator
 import InstrumentDriver
 from InstrumentConfig import InstrumentQuantity
 import numpy as np
@@ -22,6 +24,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
         self.lTrace = [np.array([]), np.array([]), 0.0, np.array([], dtype=complex)]
         self.lSignalNames = ['Ch1 - Data', 'Ch2 - Data', 'Signal', 'Signal - Single shot']
         self.dt = 1.0
+        # demodulated values of single records
+        self.demodulator = Demodulator()
         try:
             # open connection
             self.dig = Aq.AcqirisDigitizer()
@@ -290,14 +294,23 @@ class Driver(InstrumentDriver.InstrumentWorker):
             nAverage = int(self.getValue('Number of averages'))
             bDemodulation = bool(self.getValue('Enable demodulation'))
             self.lTrace = [np.array([]), np.array([]), 0.0, np.zeros(n_seq, dtype=complex)]
+            # demodulate single records during the acquisition, with the time
+            # step of the acquired data
+            self.configureDemodulation(False, 1.0, nSample)
+            funcDemodConfig = lambda dt: self.configureDemodulation(
+                bDemodulation, dt, nSample)
             # show status before starting acquisition
             self.reportStatus('Digitizer - Waiting for signal')
             ((self.lTrace[0], self.lTrace[1]), self.dt) = \
                  self.dig.getRoundRobinData(nSample, n_seq, nAverage,
                  bConfig=False, bArm=False, bMeasure=True,
                  funcStop=self.isStopped,
-                 funcProgress=self._callbackProgress)
-            # temporary, calculate I/Q signal here
+                 funcProgress=self._callbackProgress,
+                 demodulator=self.demodulator,
+                 bDemodRef=bool(self.getValue('Use Ch2 as reference')),
+                 funcDemodConfig=funcDemodConfig)
+            # signal from averaged traces, single records are kept by the
+            # demodulator
             if bDemodulation and self.dt>0:
                 self.lTrace[3] = self.getIQAmplitudes(n_seq)
         # after getting data, pick values to return
@@ -308,7 +321,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
         elif quant.name in ('Signal'):
             value = self.lTrace[3][seq_no]
         else:
-            value = self.lTrace[3]
+            # single records of this sequence step
+            value = self.demodulator.get_values(0, seq_no, n_seq)
         return value
 
 
@@ -358,38 +372,33 @@ class Driver(InstrumentDriver.InstrumentWorker):
             self.lTrace[2] = 0.0 + 0j
 
 
+    def configureDemodulation(self, bDemodulation, dt, nSample):
+        """Configure demodulation of single records, return False if disabled"""
+        lFreq = [self.getValue('Modulation frequency')] if bDemodulation else []
+        return self.demodulator.configure(lFreq, dt, self.getValue('Skip start'),
+                                          self.getValue('Length'), nSample)
+
+
     def getIQAmplitudes(self, nSegment=1):
         """Calculate complex signal from data and reference"""
-        # get parameters
-        dFreq = self.getValue('Modulation frequency')
-        skipStart = self.getValue('Skip start')
-        skipIndex = int(round(skipStart/self.dt))
         nTotLength = self.lTrace[0].size
-        length = 1 + int(round(self.getValue('Length')/self.dt))
-        length = int(min(length, nTotLength//nSegment-skipIndex))
+        nSample = nTotLength//nSegment
+        (skipIndex, length) = demodulation.get_window(
+            self.dt, self.getValue('Skip start'), self.getValue('Length'),
+            nSample)
+        if length <= 1:
+            return np.zeros(nSegment, dtype=complex)
         bUseRef = bool(self.getValue('Use Ch2 as reference'))
         # define data to use, put in 2d array of segments
-        vData = np.reshape(self.lTrace[0], (nSegment, int(nTotLength//nSegment)))
-        # calculate cos/sin vectors, allow segmenting
-        vTime = self.dt * (skipIndex + np.arange(length, dtype=float))
-        vCos = np.cos(2*np.pi * vTime * dFreq)
-        vSin = np.sin(2*np.pi * vTime * dFreq)
-        # calc I/Q
-        dI = 2. * np.trapz(vCos * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        dQ = 2. * np.trapz(vSin * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        signal = dI + 1j*dQ
+        vData = np.reshape(self.lTrace[0], (nSegment, nSample))
+        vRef = None
         if bUseRef:
-            vRef = np.reshape(self.lTrace[1], (nSegment, int(nTotLength//nSegment)))
-            dIref = 2. * np.trapz(vCos * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            dQref = 2. * np.trapz(vSin * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            # subtract the reference angle
-            dAngleRef = np.arctan2(dQref, dIref)
-            signal /= (np.cos(dAngleRef) + 1j*np.sin(dAngleRef))
-#        elif nSegment>1:
-#            # return absolute value if segmenting without reference
-#            signal = np.abs(signal)
-#        signal = np.mean(signal)
-        return signal
+            vRef = np.reshape(self.lTrace[1], (nSegment, nSample))
+        # demodulate all segments, in blocks, without changing the single
+        # records kept by the demodulator
+        return demodulation.demodulate(
+            vData, self.dt, [self.getValue('Modulation frequency')],
+            skipIndex, length, ref=vRef)[0]
 
 
 
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""Demodulation kernels, shared by all drivers that demodulate signals.
+
+The same module is copied to each driver folder that uses it.
+
+Records are integrated against complex weights w(t) exp(2 pi i f t) for all
+frequencies at once, as one matrix product. With the default trapezoidal
+window, the weights are normalized to the length of the window, and the
+complex amplitude of a real signal at frequency f is 2 * weights . data.
+The weights are cached by time step, frequencies, window start and length.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# max number of samples per block of records, to limit temporary arrays
+BLOCK_SIZE = 2**20
+# number of weight matrices kept in the cache
+CACHE_SIZE = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_window(dt, skip, length, n_points):
+    """First index and number of samples of the integration window.
+
+    skip and length are in seconds, the window is limited to n_points.
+    """
+    # avoid exceptions if no time step is given
+    if dt == 0:
+        dt = 1.0
+    n0 = int(round(skip / dt))
+    length = 1 + int(round(length / dt))
+    return (n0, min(length, int(n_points) - n0))
+
+
+def get_weights(dt, frequencies, n0, length, window='trapz', dtype=np.float64,
+                real=False):
+    """Get cached demodulation weights for all frequencies.
+
+    Parameters
+    ----------
+    dt : float
+        Time step of the data.
+    frequencies : list of float
+        Demodulation frequencies.
+    n0 : int
+        Index of first sample, sets the time of the first weight.
+    length : int
+        Number of samples to integrate.
+    window : str
+        'trapz' for trapezoidal integration weights, 'mean' for a plain
+        average, 'none' for unit weights.
+    dtype : numpy dtype
+        float64 or float32, precision of the weights.
+    real : bool
+        If True, return the real matrix with the cos rows for all
+        frequencies followed by the sin rows, for real data.
+
+    Returns
+    -------
+    weights : numpy array
+        Read-only array of shape (n_freq, length), complex, or
+        (2 * n_freq, length), real.
+
+    """
+    frequencies = tuple(float(f) for f in np.atleast_1d(frequencies))
+    dtype = np.dtype(dtype)
+    key = (dt, frequencies, int(n0), int(length), window, dtype.str, real)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    if window == 'trapz':
+        # trapezoidal integration weights, normalized to length
+        vWeight = np.ones(length) / float(max(length - 1, 1))
+        vWeight[[0, -1]] /= 2
+    elif window == 'mean':
+        vWeight = np.ones(length) / float(length)
+    elif window == 'none':
+        vWeight = np.ones(length)
+    else:
+        raise ValueError('Unknown window: %s' % window)
+    vTime = dt * (n0 + np.arange(length, dtype=float))
+    mPhase = 2 * np.pi * np.outer(frequencies, vTime)
+    if real:
+        weights = vWeight * np.vstack((np.cos(mPhase), np.sin(mPhase)))
+        weights = weights.astype(dtype)
+    else:
+        weights = vWeight * np.exp(1j * mPhase)
+        weights = weights.astype(np.result_type(dtype, np.complex64))
+    weights.flags.writeable = False
+    with _cache_lock:
+        _cache[key] = weights
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return weights
+
+
+def integrate(data, weights, n_freq, scale=1.0, zero=0.0):
+    """Integrate records, the rows of data, against weights.
+
+    With real weights from get_weights, the result is the complex amplitude
+    of real data, with raw samples converted to volts as scale*(data-zero).
+    With complex weights the result is weights . data, for complex data.
+    """
+    if np.iscomplexobj(weights):
+        values = np.dot(weights, data.astype(weights.dtype, copy=False).T)
+        if zero != 0.0:
+            values -= zero * weights.sum(1)[:, np.newaxis]
+    else:
+        mIQ = np.dot(weights, data.astype(weights.dtype, copy=False).T)
+        values = 2 * (mIQ[:n_freq] + 1j * mIQ[n_freq:])
+        if zero != 0.0:
+            kernel_sum = 2 * weights.sum(1)
+            values -= zero * (kernel_sum[:n_freq] +
+                              1j * kernel_sum[n_freq:])[:, np.newaxis]
+    if scale != 1.0:
+        values *= scale
+    return values
+
+
+def demodulate(data, dt, frequencies, n0=0, length=None, ref=None,
+               window='trapz', dtype=np.float64, block_size=BLOCK_SIZE,
+               n_threads=1):
+    """Demodulate records at several frequencies.
+
+    Parameters
+    ----------
+    data : numpy array
+        Records, 2D array of shape (n_records, n_points), or one record.
+        Real data gives the complex amplitude, 2 * weights . data, complex
+        data gives weights . data.
+    dt : float
+        Time step of the data.
+    frequencies : list of float
+        Demodulation frequencies.
+    n0 : int
+        Index of first sample to integrate.
+    length : int
+        Number of samples to integrate, default is the rest of the record.
+    ref : numpy array
+        Reference records, same shape as data. The values are rotated by
+        the phase of the reference at the same frequency.
+    window : str
+        Integration window, see get_weights.
+    dtype : numpy dtype
+        float64 or float32, precision of the calculation.
+    block_size : int
+        Max number of samples per block of records.
+    n_threads : int
+        Number of threads for evaluating blocks in parallel.
+
+    Returns
+    -------
+    values : complex numpy array
+        Demodulated values, shape (n_freq, n_records).
+
+    """
+    if data.ndim == 1:
+        data = data[np.newaxis, :]
+        ref = None if ref is None else ref[np.newaxis, :]
+    if length is None:
+        length = data.shape[1] - n0
+    n_freq = len(np.atleast_1d(frequencies))
+    weights = get_weights(dt, frequencies, n0, length, window, dtype,
+                          real=not np.iscomplexobj(data))
+    weights_ref = None
+    if ref is not None:
+        weights_ref = get_weights(dt, frequencies, n0, length, window, dtype,
+                                  real=not np.iscomplexobj(ref))
+    n_records = data.shape[0]
+    values = np.zeros((n_freq, n_records),
+                      dtype=np.result_type(dtype, np.complex64))
+
+    def process(n1):
+        n2 = min(n1 + n_block, n_records)
+        values[:, n1:n2] = integrate(data[n1:n2, n0:(n0 + length)],
+                                     weights, n_freq)
+        if ref is not None:
+            # subtract the reference angle
+            values_ref = integrate(ref[n1:n2, n0:(n0 + length)],
+                                   weights_ref, n_freq)
+            values[:, n1:n2] *= np.exp(-1j * np.angle(values_ref))
+
+    n_block = max(1, block_size // max(length, 1))
+    blocks = range(0, n_records, n_block)
+    if n_threads > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(process, blocks))
+    else:
+        for n1 in blocks:
+            process(n1)
+    return values
+
+
+class Demodulator(object):
+    """Demodulate digitizer records as they are acquired.
+
+    Blocks of raw records are demodulated as they arrive and only the
+    complex values are kept, with shape (number of frequencies, records).
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
+        self.weights = None
+        self.n_freq = 0
+        self.n0 = 0
+        self.length = 0
+        self.values = np.zeros((0, 0), dtype=complex)
+        self.n_records = 0
+
+    def configure(self, frequencies, dt, skip, length, n_points):
+        """Set demodulation parameters for records of n_points samples.
+
+        Returns False if the integration window is too short.
+        """
+        (self.n0, self.length) = get_window(dt, skip, length, n_points)
+        self.n_freq = len(frequencies)
+        if self.length <= 1 or self.n_freq == 0:
+            self.weights = None
+            return False
+        self.weights = get_weights(dt if dt != 0 else 1.0, frequencies,
+                                   self.n0, self.length, dtype=self.dtype,
+                                   real=True)
+        return True
+
+    @property
+    def enabled(self):
+        return self.weights is not None
+
+    def reset(self, n_records):
+        """Clear values, for a new acquisition of n_records records"""
+        shape = (self.n_freq, int(n_records))
+        if self.values.shape != shape:
+            self.values = np.zeros(shape, dtype=complex)
+        else:
+            self.values.fill(0)
+        self.n_records = 0
+
+    def add(self, data, record, scale=1.0, zero=0.0, ref=None):
+        """Demodulate a block of records, store values from index record.
+
+        data is a 2D array of raw records, or a single record, converted to
+        volts as scale * (data - zero). If ref is given, the values are
+        rotated by the phase of the reference records.
+        """
+        if self.weights is None:
+            return
+        if data.ndim == 1:
+            data = data[np.newaxis, :]
+            ref = None if ref is None else ref[np.newaxis, :]
+        window = slice(self.n0, self.n0 + self.length)
+        n_block = max(1, BLOCK_SIZE // self.length)
+        for n1 in range(0, data.shape[0], n_block):
+            n2 = min(n1 + n_block, data.shape[0])
+            values = integrate(data[n1:n2, window], self.weights,
+                               self.n_freq, scale, zero)
+            if ref is not None:
+                # subtract the reference angle
+                values_ref = integrate(ref[n1:n2, window], self.weights,
+                                       self.n_freq, scale, zero)
+                values *= np.exp(-1j * np.angle(values_ref))
+            self.values[:, (record + n1):(record + n2)] = values
+        self.n_records = max(self.n_records, record + data.shape[0])
+
+    def get_values(self, n_freq=0, seq_no=None, n_seq=1):
+        """Values of all demodulated records for one frequency.
+
+        With seq_no, only the records of that step of a hardware loop of
+        n_seq steps are returned.
+        """
+        if n_freq >= self.values.shape[0]:
+            return np.array([], dtype=complex)
+        values = self.values[n_freq, :self.n_records]
+        if seq_no is not None:
+            values = values[:(len(values) // n_seq) * n_seq]
+            values = values.reshape((-1, n_seq))[:, seq_no]
+        return values
+
+
+if __name__ == '__main__':
+    pass
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import AlazarTech_Digitizer_Wrapper as AlazarDig
+from demodulation import Demodulator
 import InstrumentDriver
 import numpy as np
 
@@ -19,6 +20,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
         self.lTrace = [np.array([]), np.array([])]
         self.lSignalNames = ['Ch1 - Data', 'Ch2 - Data']
         self.dt = 1.0
+        # demodulated values of single records
+        self.demodulator = Demodulator()
         # open connection
         boardId = int(self.comCfg.address)
         timeout = self.dComCfg['Timeout']
@@ -52,7 +55,7 @@ class Driver(InstrumentDriver.InstrumentWorker):
     def performGetValue(self, quant, options={}):
         """Perform the Get Value instrument operation"""
         # only implmeneted for traces
-        if quant.name in self.lSignalNames:
+        if quant.name in self.lSignalNames or quant.name.startswith('Demodulation #'):
             # special case for hardware looping
             if self.isHardwareLoop(options):
                 return self.getSignalHardwareLoop(quant, options)
@@ -60,14 +63,18 @@ class Driver(InstrumentDriver.InstrumentWorker):
             if self.isFirstCall(options):
                 # clear trace buffer
                 self.lTrace = [np.array([]), np.array([])]
+                self.demodulator.reset(0)
                 # read traced to buffer, proceed depending on model
                 if self.getModel() in ('9870',):
                     self.getTracesNonDMA()
                 else:
                     self.getTracesDMA(hardware_trig=self.isHardwareTrig(options))
-            indx = self.lSignalNames.index(quant.name)
             # return correct data
-            value = quant.getTraceDict(self.lTrace[indx], dt=self.dt)
+            if quant.name.startswith('Demodulation #'):
+                value = self.getDemodulatedValue(quant)
+            else:
+                indx = self.lSignalNames.index(quant.name)
+                value = quant.getTraceDict(self.lTrace[indx], dt=self.dt)
         else:
             # just return the quantity value
             value = quant.getValue()
@@ -80,7 +87,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
         if self.getModel() in ('9870',):
             return
         # make sure we are arming for reading traces, if not return
-        signals = [name in self.lSignalNames for name in quant_names]
+        signals = [(name in self.lSignalNames or name.startswith('Demodulation #'))
+                   for name in quant_names]
         if not np.any(signals):
             return
         # get config
@@ -111,9 +119,12 @@ class Driver(InstrumentDriver.InstrumentWorker):
                                    bufferSize=nMemSize, maxBuffers=nMaxBuffer)
 
 
-    def _callbackProgress(self, progress):
+    def _callbackProgress(self, progress, throughput=None):
         """Report progress to server, as text string"""
-        s = 'Acquiring traces (%.0f%%)' % (100*progress)
+        if throughput is None:
+            s = 'Acquiring traces (%.0f%%)' % (100*progress)
+        else:
+            s = 'Acquiring traces (%.0f%%, %.0f MB/s)' % (100*progress, throughput)
         self.reportStatus(s)
 
 
@@ -129,6 +140,7 @@ class Driver(InstrumentDriver.InstrumentWorker):
             nBuffer = int(self.getValue('Records per Buffer'))
             nMemSize = int(self.getValue('Max buffer size'))
             nMaxBuffer = int(self.getValue('Max number of buffers'))
+            demodChannel = self.configureDemodulation(nSample)
             # show status before starting acquisition
             self.reportStatus('Digitizer - Waiting for signal')
             # get data
@@ -139,17 +151,47 @@ class Driver(InstrumentDriver.InstrumentWorker):
                            funcProgress=self._callbackProgress,
                            firstTimeout=self.dComCfg['Timeout']+180.0,
                            bufferSize=nMemSize,
-                           maxBuffers=nMaxBuffer)
+                           maxBuffers=nMaxBuffer,
+                           demodulator=self.demodulator,
+                           demodChannel=demodChannel)
             # re-shape data and place in trace buffer
             self.lTrace[0] = vCh1.reshape((n_seq, nSample))
             self.lTrace[1] = vCh2.reshape((n_seq, nSample))
         # after getting data, pick values to return
+        if quant.name.startswith('Demodulation #'):
+            return self.getDemodulatedValue(quant, seq_no, n_seq)
         indx = self.lSignalNames.index(quant.name)
         value = quant.getTraceDict(self.lTrace[indx][seq_no],
                                                 dt=self.dt)
         return value
 
 
+    def configureDemodulation(self, nSample):
+        """Configure demodulation of single records, return channel number"""
+        if not self.getValue('Demodulation - Enabled'):
+            self.demodulator.configure([], self.dt, 0.0, 0.0, nSample)
+            return None
+        nFreq = self.getValueIndex('Demodulation - Number of frequencies') + 1
+        lFreq = [self.getValue('Demodulation - Frequency #%d' % (n + 1))
+                 for n in range(nFreq)]
+        self.demodulator.configure(lFreq, self.dt,
+                                   self.getValue('Demodulation - Skip'),
+                                   self.getValue('Demodulation - Length'), nSample)
+        return self.getValueIndex('Demodulation - Channel') + 1
+
+
+    def getDemodulatedValue(self, quant, seq_no=None, n_seq=1):
+        """Get average or single-shot demodulated values"""
+        # name is 'Demodulation #n - Value' or 'Demodulation #n - Single shot'
+        nFreq = int(quant.name[len('Demodulation #')]) - 1
+        values = self.demodulator.get_values(nFreq, seq_no, n_seq)
+        if quant.name.endswith('Single shot'):
+            return quant.getTraceDict(values, dt=1)
+        if len(values) == 0:
+            return 0.0j
+        return np.mean(values)
+
+
     def setConfiguration(self):
         """Set digitizer configuration based on driver settings"""
         # clock configuration
@@ -270,13 +312,16 @@ class Driver(InstrumentDriver.InstrumentWorker):
         nMaxBuffer = int(self.getValue('Max number of buffers'))
         # in hardware trig mode, there is no noed to re-arm the card
         bArm = not hardware_trig
+        demodChannel = self.configureDemodulation(nPostSize)
         # get data
         self.lTrace[0], self.lTrace[1] = self.dig.readTracesDMA(bGetCh1, bGetCh2,
                                          nPostSize, nRecord, nBuffer, nAverage,
                                          bConfig=False, bArm=bArm, bMeasure=True,
                                          funcStop=self.isStopped,
                                          bufferSize=nMemSize,
-                                         maxBuffers=nMaxBuffer)
+                                         maxBuffers=nMaxBuffer,
+                                         demodulator=self.demodulator,
+                                         demodChannel=demodChannel)
 
 
     def getTracesNonDMA(self):
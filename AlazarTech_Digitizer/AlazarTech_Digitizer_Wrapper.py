@@ -6,6 +6,9 @@ import numpy as np
 import logging
 log = logging.getLogger('LabberDriver')
 import time
+import threading
+import queue
+from averaging import Averager
 
 # define constants
 ADMA_NPT = 0x200
@@ -95,6 +98,8 @@ class AlazarTechDigitizer():
         #will be overwritten if model is 9870 and AlazarInputControl called
         self.dRange = {1: 0.4, 2: 0.4}
         self.buffers = []
+        # integer accumulator, re-used between calls
+        self.averager = Averager()
         self.timeout = timeout
         # create a session id
         func = getattr(DLL, 'AlazarNumOfSystems')
@@ -263,8 +268,18 @@ class AlazarTechDigitizer():
     def readTracesDMA(self, bGetCh1, bGetCh2, nSamples, nRecord, nBuffer, nAverage=1,
                       bConfig=True, bArm=True, bMeasure=True,
                       funcStop=None, funcProgress=None, timeout=None, bufferSize=512,
-                      firstTimeout=None, maxBuffers=1024):
-        """read traces in NPT AutoDMA mode, convert to float, average to single trace"""
+                      firstTimeout=None, maxBuffers=1024, demodulator=None,
+                      demodChannel=1):
+        """read traces in NPT AutoDMA mode, convert to float, average to single trace
+
+        Filled buffers are handed to a worker thread, which sums the raw
+        sample codes and re-posts the buffer, so waiting for the board is
+        never blocked by the averaging. The sums are converted to voltages
+        once all buffers are done. funcProgress is called after each buffer
+        with the progress and the throughput of that buffer, in MB/s.
+        If a configured demodulator is given, the records of demodChannel are
+        also demodulated one by one, as the buffers arrive.
+        """
         t0 = time.clock()
         lT = []
 
@@ -374,97 +389,147 @@ class AlazarTechDigitizer():
             return
 
         lT.append('Post: %.1f ms' % ((time.clock()-t0)*1000))
+        #initialize data array
+        nPtsOut = samplesPerRecord * nRecord
+        nAvPerBuffer = recordsPerBuffer // nRecord
+        # raw sums of the sample codes, all channels in the order of the
+        # buffer, converted to voltages at the end
+        self.averager.reset(nPtsOut * channelCount)
+        # buffers filled by the board, waiting to be processed by the worker
+        filledBuffers = queue.Queue()
+        # released by the worker each time a buffer is back on the board
+        repostedBuffers = threading.Semaphore(0)
+        # number of processed buffers and errors raised in the worker
+        workerState = {'processed': 0, 'error': None}
+        #range and zero for conversion to voltages
+        codeZero = 2 ** (float(self.bitsPerSample) - 1) - 0.5
+        codeRange = 2 ** (float(self.bitsPerSample) - 1) - 0.5 
+        # range and zero for each channel, combined with bit shifting
+        range1 = self.dRange[1]/codeRange/16.
+        range2 = self.dRange[2]/codeRange/16.
+        offset = 16.*codeZero
+        # position of demodulated channel in buffer, None if not acquired
+        demodIndex = None
+        if demodulator is not None:
+            demodulator.reset(recordsPerAcquisition)
+            if demodulator.enabled and demodChannel == 1 and channels & 1:
+                demodIndex = 0
+            elif demodulator.enabled and demodChannel == 2 and channels & 2:
+                demodIndex = channelCount - 1
+            demodRange = range1 if demodChannel == 1 else range2
+
+        def processBuffers():
+            """Worker, sum raw data of the filled buffers and re-post them"""
+            try:
+                while True:
+                    buf = filledBuffers.get()
+                    if buf is None:
+                        return
+                    # remove extra elements for getting even 256*16 buffer sizes
+                    if bytesPerBuffer == bytesPerBufferMem:
+                        buf_truncated = buf.buffer
+                    else:
+                        buf_truncated = buf.buffer[:(bytesPerBuffer//bytesPerSample)]
+                    # reshape and sum data, without conversion to float
+                    rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut * channelCount))
+                    self.averager.add(rs)
+                    # demodulate single records
+                    if demodIndex is not None:
+                        rs = buf_truncated.reshape((recordsPerBuffer, samplesPerRecord,
+                                                    channelCount))
+                        demodulator.add(rs[:,:,demodIndex],
+                                        workerState['processed'] * recordsPerBuffer,
+                                        demodRange, offset)
+                    workerState['processed'] += 1
+                    # Add the buffer to the end of the list of available buffers.
+                    self.AlazarPostAsyncBuffer(buf.addr, buf.size_bytes)
+                    repostedBuffers.release()
+            except Exception as e:
+                workerState['error'] = e
+                # make sure the wait loop does not block on a missing buffer
+                repostedBuffers.release()
+
+        worker = threading.Thread(target=processBuffers)
+        worker.daemon = True
+        worker.start()
         try:
             lT.append('Start: %.1f ms' % ((time.clock()-t0)*1000))
             buffersCompleted = 0
             bytesTransferred = 0
-            #initialize data array
-            nPtsOut = samplesPerRecord * nRecord
-            nAvPerBuffer = recordsPerBuffer/nRecord
-            vData = [np.zeros(nPtsOut, dtype=float), np.zeros(nPtsOut, dtype=float)]
-            #range and zero for conversion to voltages
-            codeZero = 2 ** (float(self.bitsPerSample) - 1) - 0.5
-            codeRange = 2 ** (float(self.bitsPerSample) - 1) - 0.5 
-            # range and zero for each channel, combined with bit shifting
-            range1 = self.dRange[1]/codeRange/16.
-            range2 = self.dRange[2]/codeRange/16.
-            offset = 16.*codeZero
 
             timeout_ms = int(firstTimeout*1000)
 
             log.info(str(lT))
             lT = []
+            tBuffer = time.clock()
+            tFirst = None
 
             while (buffersCompleted < buffersPerAcquisition):
+                # a buffer must be back on the board before waiting for it
+                if buffersCompleted >= len(self.buffers):
+                    repostedBuffers.acquire()
+                    if workerState['error'] is not None:
+                        break
                 # Wait for the buffer at the head of the list of available
                 # buffers to be filled by the board.
                 buf = self.buffers[buffersCompleted % len(self.buffers)]
                 self.AlazarWaitAsyncBufferComplete(buf.addr, timeout_ms=timeout_ms)
-                # lT.append('Wait: %.1f ms' % ((time.clock()-t0)*1000))
+                # hand over to the worker, which re-posts the buffer when done
+                filledBuffers.put(buf)
 
                 # reset timeout time, can be different than first call
                 timeout_ms = int(timeout*1000)
 
                 buffersCompleted += 1
                 bytesTransferred += buf.size_bytes
-    
+                # throughput of this buffer
+                tNow = time.clock()
+                throughput = bytesPerBuffer / max(tNow - tBuffer, 1E-9) / 1E6
+                tBuffer = tNow
+                if tFirst is None:
+                    tFirst = tNow
+
                 # break if stopped from outside
                 if funcStop is not None and funcStop():
                     break
                 # report progress
                 if funcProgress is not None:
-                    funcProgress(float(buffersCompleted)/float(buffersPerAcquisition))
-
-                # remove extra elements for getting even 256*16 buffer sizes
-                if bytesPerBuffer == bytesPerBufferMem:
-                    buf_truncated = buf.buffer
-                else:
-                    buf_truncated = buf.buffer[:(bytesPerBuffer//bytesPerSample)]
-
-                # reshape, sort and average data
-                if nAverage > 1:
-                    if channels == 1:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut))
-                        vData[0] += range1 * (np.mean(rs, 0)  - offset)
-                    elif channels == 2:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut))
-                        vData[1] += range2 * (np.mean(rs, 0)  - offset)
-                    elif channels == 3:
-                        rs = buf_truncated.reshape((nAvPerBuffer, nPtsOut, 2))
-                        vData[0] += range1 * (np.mean(rs[:,:,0], 0)  - offset)
-                        vData[1] += range2 * (np.mean(rs[:,:,1], 0)  - offset)
-                else:
-                    if channels == 1:
-                        vData[0] = range1 * (buf_truncated  - offset)
-                    elif channels == 2:
-                        vData[1] = range2 * (buf_truncated  - offset)
-                    elif channels == 3:
-                        rs = buf_truncated.reshape((nPtsOut, 2))
-                        vData[0] = range1 * (rs[:,0]  - offset)
-                        vData[1] = range2 * (rs[:,1]  - offset)
-
-                # lT.append('Sort/Avg: %.1f ms' % ((time.clock()-t0)*1000))
-                # log.info(str(lT))
-                # lT = []
+                    funcProgress(float(buffersCompleted)/float(buffersPerAcquisition),
+                                 throughput)
                 #
                 # Sample codes are unsigned by default. As a result:
                 # - 0x00 represents a negative full scale input signal.
                 # - 0x80 represents a ~0V signal.
                 # - 0xFF represents a positive full scale input signal.
-    
-                # Add the buffer to the end of the list of available buffers.
-                self.AlazarPostAsyncBuffer(buf.addr, buf.size_bytes)
         finally:
+            # let the worker finish the buffers already handed over
+            filledBuffers.put(None)
+            worker.join()
             # release resources
             try:
                 self.AlazarAbortAsyncRead()
             except:
                 pass
             lT.append('Abort: %.1f ms' % ((time.clock()-t0)*1000))
-        # normalize        
-        # log.info('Average: %.1f ms' % np.mean(lAvTime))
-        vData[0] /= buffersPerAcquisition
-        vData[1] /= buffersPerAcquisition
+        if workerState['error'] is not None:
+            raise workerState['error']
+        # steady-state throughput, from the first to the last buffer
+        if buffersCompleted > 1 and tBuffer > tFirst:
+            lT.append('Throughput: %.1f MB/s' %
+                      ((buffersCompleted - 1) * bytesPerBuffer / (tBuffer - tFirst) / 1E6))
+        # normalize and convert to voltages, only once for all buffers
+        nAverageTotal = nAvPerBuffer * workerState['processed']
+        vAverage = self.averager.get_average(nAverageTotal, 1.0, offset)
+        # sort channels
+        vData = [np.zeros(nPtsOut, dtype=float), np.zeros(nPtsOut, dtype=float)]
+        if channels == 1:
+            vData[0] = range1 * vAverage
+        elif channels == 2:
+            vData[1] = range2 * vAverage
+        elif channels == 3:
+            rs = vAverage.reshape((nPtsOut, 2))
+            vData[0] = range1 * rs[:,0]
+            vData[1] = range2 * rs[:,1]
         # # log timing information
         lT.append('Done: %.1f ms' % ((time.clock()-t0)*1000))
         log.info(str(lT))
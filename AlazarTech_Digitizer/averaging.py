@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import numpy as np
+
+
+class Averager(object):
+    """Average raw digitizer samples, with integer accumulators.
+
+    Raw 8/16-bit samples are summed into an int64 accumulator, without any
+    conversion to float. The records of a block are first reduced into an
+    int32 scratch buffer, in groups small enough to never overflow. Both
+    buffers are kept between calls to `reset`, and only re-allocated if the
+    trace length changes. Scaling to volts is done once, in `get_average`.
+    """
+
+    # records that can be summed in int32 without overflow, 16-bit samples
+    max_records_int32 = 2**15
+
+    def __init__(self):
+        self.accumulator = np.zeros(0, dtype=np.int64)
+        self.scratch = np.zeros(0, dtype=np.int32)
+
+    def reset(self, n_points):
+        """Clear the accumulator, for a trace of length n_points"""
+        n_points = int(n_points)
+        if len(self.accumulator) != n_points:
+            self.accumulator = np.zeros(n_points, dtype=np.int64)
+            self.scratch = np.zeros(n_points, dtype=np.int32)
+        else:
+            self.accumulator.fill(0)
+
+    def add(self, data, offset=0):
+        """Add raw data to the accumulator, starting at offset.
+
+        data is a single record, or a 2D array of records that are summed
+        along the first axis. Strided views, like one channel of interleaved
+        data, are fine.
+        """
+        n = data.shape[-1]
+        acc = self.accumulator[offset:(offset + n)]
+        if data.ndim == 1:
+            np.add(acc, data, out=acc)
+            return
+        scratch = self.scratch[:n]
+        for n1 in range(0, data.shape[0], self.max_records_int32):
+            block = data[n1:(n1 + self.max_records_int32)]
+            np.add.reduce(block, axis=0, dtype=np.int32, out=scratch)
+            np.add(acc, scratch, out=acc)
+
+    def get_average(self, n_average, scale=1.0, zero=0.0):
+        """Averaged trace in volts, scale * (sum / n_average - zero)"""
+        return (scale / float(max(n_average, 1))) * self.accumulator - scale * zero
+
+
+if __name__ == '__main__':
+    pass
@@ -18,6 +18,16 @@ class Driver(VISA_Driver):
                       'Dual channel (1,2) + markers (3,4)': ([1, 2], [3, 4]),
                       'Four channel': ([1, 2, 3, 4], [])}
 
+    # max number of samples per binary block sent to the AWG
+    CHUNK_SIZE = 2**20
+    # sequence table control bits, each hardware-loop step is a sequence with
+    # a single segment, played once per advancement event
+    SEQ_INIT_MARKER = 2**28
+    SEQ_END_MARKER = 2**30
+    SCENARIO_END_MARKER = 2**29
+    SEQ_ADVANCE_SINGLE = 3 * 2**20
+    # number of sequence table entries per command
+    SEQ_TABLE_BLOCK = 64
     
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
@@ -41,6 +51,9 @@ class Driver(VISA_Driver):
         self.n_prev_seq = -1
         self.is_running = False
         self.data = [np.array([], dtype=np.int8) for n1 in range(self.n_ch)] 
+        # data of segments on the AWG, [sequence][channel]
+        self.data_seq = []
+        self.seq_table_updated = False
         # turn off run mode and delete all old data
         self.writeAndLog(':ABOR')
         self.writeAndLog(':TRAC:DEL:ALL')
@@ -139,10 +152,13 @@ class Driver(VISA_Driver):
                 (seq, n_seq) = self.getHardwareLoopIndex(options)
                 self.reportStatus('Sending waveform (%d/%d)' % (seq+1, n_seq))
                 self.send_waveforms(seq=seq, n_seq=n_seq)
+                # sequence is complete after the final step
+                final_seq = (seq + 1) == n_seq
             else:
                 self.send_waveforms()
+                final_seq = True
             # start if not triggered
-            if not self.isHardwareTrig(options):
+            if final_seq and not self.isHardwareTrig(options):
                 self.start_awg()
         return value
 
@@ -225,26 +241,67 @@ class Driver(VISA_Driver):
         
         # check if sequence mode or normal run mode
         if seq is None:
-            # stop AWG, delete all segments, create empty waveforms
-            self.stop_awg()
-            self.writeAndLog(':TRAC:DEL:ALL')
+            # single segment, only clear old segments if sequence length changed
+            if self.n_prev_seq != 1:
+                self.clear_segments(1)
             # go through and send waveform on  all channels in use
             for ch in channels:
                 self.sendWaveformToAWG(ch)
             # set up segment
+            self.writeAndLog(':FUNC:MODE ARB')
             self.writeAndLog(':TRAC:ADV AUTO')
             self.writeAndLog(':TRAC:SEL 1')
             self.writeAndLog(':TRAC:COUN 1')
         else:
-            # sequence mode, set up sequences
-            pass
+            # sequence mode, one segment per sequence
+            if seq == 0 and n_seq != self.n_prev_seq:
+                self.clear_segments(n_seq)
+            for ch in channels:
+                self.sendWaveformToAWG(ch, seq)
+            # if not final seq call, just return here
+            if (seq + 1) < n_seq:
+                return
+            # final call, sequence table only depends on number of sequences
+            if not self.seq_table_updated:
+                self.send_sequence_table(n_seq)
+            self.writeAndLog(':FUNC:MODE STSC')
+
+
+    def clear_segments(self, n_seq):
+        """Delete all segments on the AWG and create new data buffer"""
+        self.stop_awg()
+        self.writeAndLog(':TRAC:DEL:ALL')
+        self.data_seq = [[np.array([], dtype=np.int8)
+                          for n1 in range(self.n_ch)] for n2 in range(n_seq)]
+        self.n_prev_seq = n_seq
+        self.seq_table_updated = False
+
+
+    def send_sequence_table(self, n_seq):
+        """Create sequence table with one sequence per segment"""
+        self.stop_awg()
+        self.writeAndLog(':STAB:RES')
+        for n1 in range(0, n_seq, self.SEQ_TABLE_BLOCK):
+            entries = []
+            for n in range(n1, min(n1 + self.SEQ_TABLE_BLOCK, n_seq)):
+                control = (self.SEQ_INIT_MARKER | self.SEQ_END_MARKER |
+                           self.SEQ_ADVANCE_SINGLE)
+                # last sequence ends scenario, which then restarts
+                if n == n_seq - 1:
+                    control |= self.SCENARIO_END_MARKER
+                # control, sequence loops, segment loops, segment, start, end
+                entries.append('%d,1,1,%d,0,#hFFFFFFFF' % (control, n + 1))
+            self.writeAndLog(':STAB:DATA %d,%s' % (n1, ','.join(entries)))
+        self.writeAndLog(':STAB:SCEN:SEL 0')
+        self.seq_table_updated = True
 
 
     def sendWaveformToAWG(self, ch, seq=None):
-        """Send waveform to AWG"""
-        # check if sequence
+        """Send waveform to AWG, returns True if data was sent"""
+        # check if sequence, segments are numbered from 1
         if seq is None:
-            seq = 1
+            seq = 0
+        segment = seq + 1
         # get data and markers
         vI8 = self.data[ch - 1]
         markers = self.CHANNEL_MARKER[self.getValue('Channel mode')][1]
@@ -285,16 +342,43 @@ class Driver(VISA_Driver):
             # combine data and marker to one vector
             vI8 = np.reshape(np.c_[vI8, mI8], [2 * self.n_elem,])
 
-        # define trace
-        self.writeAndLog(':TRAC%d:DEF 1,%d' % (ch, self.n_elem))
-        # create binary data as bytes with header
-        start, length = 0, len(vI8)
-        sLen = b'%d' % length
-        sHead = b'#%d%s' % (len(sLen), sLen)
-        # send to AWG
-        sCmd = b':TRAC%d:DATA %d,%d,' % (ch, seq, start)
-        self.write_raw(sCmd + sHead + vI8[start:start+length].tobytes())
-        
+        # compare to data already in segment
+        vOldI8 = self.data_seq[seq][ch - 1]
+        # bytes per sample, two if markers are interleaved
+        n_byte = len(vI8) // self.n_elem
+        if len(vI8) != len(vOldI8):
+            # length changed, remove old segment and define new
+            self.stop_awg()
+            if len(vOldI8) > 0:
+                self.writeAndLog(':TRAC%d:DEL %d' % (ch, segment))
+            self.writeAndLog(':TRAC%d:DEF %d,%d' % (ch, segment, self.n_elem))
+            start, stop = 0, self.n_elem
+        else:
+            vIndx = np.nonzero(vI8 != vOldI8)[0]
+            if len(vIndx) == 0:
+                # nothing changed, don't update
+                return False
+            # some elements changed, send blocks of 256 samples around them
+            self.stop_awg()
+            start = 256 * ((vIndx[0] // n_byte) // 256)
+            stop = min(self.n_elem, 256 * (1 + (vIndx[-1] // n_byte) // 256))
+        # send to AWG in chunks, to allow stopping during long transfers
+        for n1 in range(start, stop, self.CHUNK_SIZE):
+            if self.isStopped():
+                # segment is incomplete, clear all segments at next upload
+                self.n_prev_seq = -1
+                return True
+            n2 = min(n1 + self.CHUNK_SIZE, stop)
+            # create binary data as bytes with header
+            data = vI8[n_byte * n1:n_byte * n2].tobytes()
+            sLen = b'%d' % len(data)
+            sHead = b'#%d%s' % (len(sLen), sLen)
+            sCmd = b':TRAC%d:DATA %d,%d,' % (ch, segment, n1)
+            self.write_raw(sCmd + sHead + data)
+        # store new waveform for next call
+        self.data_seq[seq][ch - 1] = vI8
+        return True
+
 
     def scaleWaveformToI8(self, vData, v_pp, ch):
         """Scales the waveform and returns data in a string of U16"""
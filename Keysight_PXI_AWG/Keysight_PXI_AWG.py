@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import sys
+import hashlib
 from BaseDriver import LabberDriver, Error, IdError
 import numpy as np
 sys.path.append('C:\\Program Files (x86)\\Keysight\\SD1\\Libraries\\Python')
@@ -60,6 +61,7 @@ class Driver(LabberDriver):
         self.waveform_updated = [False] * self.nCh
         self.previous_upload = dict()
         self.waveform_sizes = dict()
+        self.store_use_counter = 0
 
         # get hardware version - changes numbering of channels
         hw_version = self.AWG.getHardwareVersion()
@@ -207,24 +209,30 @@ class Driver(LabberDriver):
             # do different uploading depending on normal or hardware loop
             if self.isHardwareLoop(options):
                 seq_no, n_seq = self.getHardwareLoopIndex(options)
-                # Reset waveform ID counter if this is the first sequence
+                # start new queues if this is the first sequence, waveforms
+                # already on the AWG are kept and reused if content matches
                 if seq_no == 0:
-                    self.waveform_counter = 0  # WaveformID counter
-                    self.clearOldWaveforms()
+                    self.waveform_queued = set()
+                    for ch in awg_channels:
+                        self.AWG.AWGflush(self.getHwCh(ch))
                 # report status
                 self.reportStatus(
                     'Sending waveform (%d/%d)' % (seq_no + 1, n_seq))
 
-                # always upload all channels in use, regardless of updated
-                for ch in awg_channels:
-                    # waveform counter is unique id
-                    self.waveform_counter += 1
-                    self.sendWaveform(ch, self.waveform_counter)
-                    self.queueWaveform(ch, self.waveform_counter)
-                    # configure channel-specific markers
-                    self.configureMarker(ch)
-                    # configure queue to run in cyclic mode
-                    self.AWG.AWGqueueConfig(self.getHwCh(ch), 1)
+                # queue all channels in use, only upload new waveforms
+                try:
+                    self.storeAndQueueWaveforms()
+                except UploadFailed:
+                    # waveforms of previous sequences are already queued
+                    if seq_no > 0:
+                        raise Error('AWG waveform memory is full, ' +
+                                    'increase "Waveform memory" if possible')
+                    # if upload fail, flush and try again (may be out of memory)
+                    self.log('Upload failed, flushing old waveforms!')
+                    self.clearOldWaveforms()
+                    for ch in awg_channels:
+                        self.AWG.AWGflush(self.getHwCh(ch))
+                    self.storeAndQueueWaveforms()
 
             else:
                 # standard, non-hardware loop upload, stop all
@@ -260,6 +268,13 @@ class Driver(LabberDriver):
         self.AWG.waveformFlush()
         self.previous_upload = {(n + 1): np.array([]) for n in range(self.nCh)}
         self.waveform_sizes = dict()
+        # content-addressed store of hardware-loop waveforms, hash -> ID
+        self.waveform_store = dict()
+        self.waveform_store_key = dict()
+        self.waveform_last_use = dict()
+        self.waveform_queued = set()
+        # hardware-loop waveforms use IDs after the fixed channel waveforms
+        self.waveform_counter = self.nCh
         # waveform zero is 1us empty waveform used for delays
         waveform_id = 0
         data_zero = np.zeros(int(round(1E-6 / self.dt)))
@@ -287,6 +302,18 @@ class Driver(LabberDriver):
             self.AWG.AWGqueueConfig(self.getHwCh(ch), 1)
 
 
+    def storeAndQueueWaveforms(self):
+        """Queue waveforms from the waveform store for all channels in use"""
+        awg_channels = self.getAWGChannelsInUse()
+        for ch in awg_channels:
+            waveform_id = self.storeWaveform(ch)
+            self.queueWaveform(ch, waveform_id)
+            # configure channel-specific markers
+            self.configureMarker(ch)
+            # configure queue to run in cyclic mode
+            self.AWG.AWGqueueConfig(self.getHwCh(ch), 1)
+
+
     def getAWGChannelsInUse(self):
         """Get list with all AWG channels in use"""
         awg_channels = []
@@ -305,8 +332,8 @@ class Driver(LabberDriver):
         return int(mask)
 
 
-    def sendWaveform(self, ch, waveform_id):
-        """Send waveform to AWG channel"""
+    def getWaveformData(self, ch):
+        """Get waveform of AWG channel, padded and normalized to range"""
         # get data
         data = self.getValueArray('Ch%d - Waveform' % (ch + 1))
         # make sure we have at least 30 elements
@@ -327,7 +354,12 @@ class Driver(LabberDriver):
         amp = self.getChannelValue(ch, 'Amplitude')
         data_norm = data / amp
         data_norm = np.clip(data_norm, -1.0, 1.0, out=data_norm)
+        return data_norm
+
 
+    def sendWaveform(self, ch, waveform_id):
+        """Send waveform to AWG channel"""
+        data_norm = self.getWaveformData(ch)
         # check if data changed compared to last upload
         if waveform_id in self.previous_upload:
             if np.array_equal(data_norm, self.previous_upload[waveform_id]):
@@ -338,12 +370,63 @@ class Driver(LabberDriver):
             self.previous_upload[waveform_id] = data_norm
         # keep track of waveform lengths
         self.waveform_sizes[waveform_id] = len(data_norm)
+        self.uploadWaveform(data_norm, waveform_id)
+
 
-        # upload waveform
+    def storeWaveform(self, ch):
+        """Add waveform of AWG channel to the waveform store, return the ID
+
+        Waveforms are identified by the hash of their normalized data, so a
+        waveform already on the AWG is reused instead of uploaded again.
+        """
+        data_norm = self.getWaveformData(ch)
+        key = hashlib.sha1(data_norm.tobytes()).hexdigest()
+        if key in self.waveform_store:
+            waveform_id = self.waveform_store[key]
+        else:
+            waveform_id = self.allocateWaveformId(len(data_norm))
+            # overwrite evicted waveform of same size
+            reload = waveform_id in self.waveform_sizes
+            self.uploadWaveform(data_norm, waveform_id, reload)
+            self.waveform_sizes[waveform_id] = len(data_norm)
+            self.waveform_store[key] = waveform_id
+            self.waveform_store_key[waveform_id] = key
+        # keep track of use, waveforms in the queue can not be evicted
+        self.store_use_counter += 1
+        self.waveform_last_use[waveform_id] = self.store_use_counter
+        self.waveform_queued.add(waveform_id)
+        return waveform_id
+
+
+    def allocateWaveformId(self, size):
+        """Get waveform ID for a new waveform of given size in the store"""
+        memory = int(round(1E6 * self.getValue('Waveform memory')))
+        if sum(self.waveform_sizes.values()) + size <= memory:
+            self.waveform_counter += 1
+            return self.waveform_counter
+        # memory is full, evict the least recently used waveform of same size
+        candidates = [(self.waveform_last_use[waveform_id], waveform_id)
+                      for waveform_id in self.waveform_store_key
+                      if waveform_id not in self.waveform_queued and
+                      self.waveform_sizes[waveform_id] == size]
+        if len(candidates) == 0:
+            self.log('Upload error: waveform memory is full')
+            raise UploadFailed()
+        waveform_id = min(candidates)[1]
+        del self.waveform_store[self.waveform_store_key.pop(waveform_id)]
+        return waveform_id
+
+
+    def uploadWaveform(self, data_norm, waveform_id, reload=False):
+        """Upload normalized waveform data to AWG memory"""
         wave = keysightSD1.SD_Wave()
         waveformType = 0
         wave.newFromArrayDouble(waveformType, data_norm)
-        ret = self.AWG.waveformLoad(wave, waveform_id)
+        if reload:
+            # replace waveform already in memory
+            ret = self.AWG.waveformReLoad(wave, waveform_id)
+        else:
+            ret = self.AWG.waveformLoad(wave, waveform_id)
         if ret < 0:
             self.log('Upload error:', keysightSD1.SD_Error.getErrorMessage(ret))
             raise UploadFailed()
@@ -6,6 +6,8 @@ from BaseDriver import LabberDriver, Error, IdError
 import keysightSD1
 
 import numpy as np
+from averaging import Averager
+from demodulation import Demodulator
 
 
 class Driver(LabberDriver):
@@ -50,6 +52,12 @@ class Driver(LabberDriver):
             self.nCh = 4
         # create list of sampled data
         self.lTrace = [np.array([])] * self.nCh
+        # integer accumulators and read buffer, re-used between calls
+        self.averagers = [Averager() for n in range(self.nCh)]
+        self.read_buffer = None
+        # demodulated values of single records
+        self.demodulator = Demodulator()
+        self.demod_ch = None
         self.dig.openWithSlot(AWGPart, self.chassis, int(self.comCfg.address))
         # get hardware version - changes numbering of channels
         hw_version = self.dig.getHardwareVersion()
@@ -128,7 +136,7 @@ class Driver(LabberDriver):
         else:
             ch, name = None, ''
 
-        if name == 'Signal':
+        if name == 'Signal' or quant.name.startswith('Demodulation #'):
             if self.isHardwareLoop(options):
                 return self.getSignalHardwareLoop(ch, quant, options)
             # get traces if first call
@@ -136,7 +144,10 @@ class Driver(LabberDriver):
                 # don't arm if in hardware trig mode
                 self.getTraces(bArm=(not self.isHardwareTrig(options)))
             # return correct data
-            value = quant.getTraceDict(self.lTrace[ch], dt=self.dt)
+            if name == 'Signal':
+                value = quant.getTraceDict(self.lTrace[ch], dt=self.dt)
+            else:
+                value = self.getDemodulatedValue(quant)
         else:
             # for all others, return local value
             value = quant.getValue()
@@ -148,7 +159,8 @@ class Driver(LabberDriver):
         """Perform the instrument arm operation"""
         # make sure we are arming for reading traces, if not return
         signal_names = ['Ch%d - Signal' % (n + 1) for n in range(4)]
-        signal_arm = [name in signal_names for name in quant_names]
+        signal_arm = [(name in signal_names or name.startswith('Demodulation #'))
+                      for name in quant_names]
         if not np.any(signal_arm):
             return
 
@@ -196,6 +208,7 @@ class Driver(LabberDriver):
             for nCh in lCh:
                 # init data
                 self.lTrace[nCh] = np.zeros((nSeg * nPts))
+                self.averagers[nCh].reset(nSeg * nPts)
                 # channel number depens on hardware version
                 ch = self.getHwCh(nCh)
                 # extra config for trig mode
@@ -214,6 +227,8 @@ class Driver(LabberDriver):
                 # config daq and trig mode
                 trigMode = int(self.getCmdStringFromValue('Trig Mode'))
                 self.dig.DAQconfig(ch, nPts, nSeg*nAv, nTrigDelay, trigMode)
+            # prepare demodulation of all records
+            self.configureDemodulation(lCh, nPts, nSeg * nAv)
             # start acquiring data
             self.dig.DAQstartMultiple(iChMask)
         # lT.append('Start %.1f ms' % (1000*(time.clock()-t0)))
@@ -227,6 +242,8 @@ class Driver(LabberDriver):
         lScale = [(self.getRange(ch) / self.bitRange) for ch in range(self.nCh)]
         # keep track of progress in percent
         old_percent = 0
+        # number of averages summed in accumulators
+        nAvDone = 0
 
         # proceed depending on segment or not segment
         if nSeg <= 1:
@@ -253,13 +270,14 @@ class Driver(LabberDriver):
                     if data.size == 0:
                         return
 
-                    # average
-                    data = data.reshape((nCycle, nPts)).mean(0)
-                    # adjust scaling to account for summing averages
-                    scale = lScale[nCh] * (nCycle / nAv)
-                    # convert to voltage, add to total average
-                    self.lTrace[nCh] += data * scale
+                    # sum raw data, conversion to voltage is done at the end
+                    self.averagers[nCh].add(data.reshape((nCycle, nPts)))
+                    # demodulate the records of this block
+                    if nCh == self.demod_ch:
+                        self.demodulator.add(data.reshape((nCycle, nPts)),
+                                             n * nCyclePerCall, lScale[nCh])
 
+                nAvDone += nCycle
                 # break if stopped from outside
                 if self.isStopped():
                     break
@@ -275,9 +293,6 @@ class Driver(LabberDriver):
             else:
                 lCyclesSeg = [nCyclePerCall] * nCallSeg
                 lCyclesSeg[-1] = nCyclePerCall + extra_call
-            # pre-calculate scale, should include scaling for averaging
-            lScale = np.array(lScale, dtype=float) / nAv
-
 
             for n in range(nAv):
                 # report progress, only report integer percent
@@ -301,22 +316,63 @@ class Driver(LabberDriver):
                         # stop if no data
                         if data.size == 0:
                             return
-                        # store all data in one long vector
-                        self.lTrace[nCh][count:(count + data.size)] += \
-                            data * lScale[nCh]
+                        # sum all data in one long vector
+                        self.averagers[nCh].add(data, offset=count)
+                        # demodulate the records of this block
+                        if nCh == self.demod_ch:
+                            self.demodulator.add(data.reshape((nCycle, nPts)),
+                                                 n * nSeg + count // nPts,
+                                                 lScale[nCh])
 
                     count += data.size
 
+                nAvDone += 1
                 # break if stopped from outside
                 if self.isStopped():
                     break
 
                 # lT.append('N: %d, Tot %.1f ms' % (n, 1000 * (time.clock() - t0)))
 
+        # convert to voltage, once for all averages
+        for nCh in lCh:
+            self.lTrace[nCh] = self.averagers[nCh].get_average(
+                nAvDone, lScale[nCh])
+
         # # log timing info
         # self.log(': '.join(lT))
 
 
+    def configureDemodulation(self, lCh, nPts, nRecord):
+        """Configure demodulation of the records of the next acquisition"""
+        self.demod_ch = None
+        if not self.getValue('Demodulation - Enabled'):
+            self.demodulator.reset(0)
+            return
+        nFreq = self.getValueIndex('Demodulation - Number of frequencies') + 1
+        lFreq = [self.getValue('Demodulation - Frequency #%d' % (n + 1))
+                 for n in range(nFreq)]
+        self.demodulator.configure(lFreq, self.dt,
+                                   self.getValue('Demodulation - Skip'),
+                                   self.getValue('Demodulation - Length'), nPts)
+        self.demodulator.reset(nRecord)
+        # only demodulate if the channel is acquired
+        ch = self.getValueIndex('Demodulation - Channel')
+        if ch in lCh:
+            self.demod_ch = ch
+
+
+    def getDemodulatedValue(self, quant, seq_no=None, n_seq=1):
+        """Get average or single-shot demodulated values"""
+        # name is 'Demodulation #n - Value' or 'Demodulation #n - Single shot'
+        nFreq = int(quant.name[len('Demodulation #')]) - 1
+        values = self.demodulator.get_values(nFreq, seq_no, n_seq)
+        if quant.name.endswith('Single shot'):
+            return quant.getTraceDict(values, dt=1)
+        if len(values) == 0:
+            return 0.0j
+        return np.mean(values)
+
+
     def getRange(self, ch):
         """Get channel range, as voltage.  Index start at 0"""
         rang = float(self.getCmdStringFromValue('Ch%d - Range' % (ch + 1)))
@@ -327,7 +383,10 @@ class Driver(LabberDriver):
         """Read data diretly to numpy array"""
         if dig._SD_Object__handle > 0:
             if nPoints > 0:
-                data = (keysightSD1.c_short * nPoints)()
+                # re-use buffer, data is added to the accumulators before next read
+                if self.read_buffer is None or len(self.read_buffer) < nPoints:
+                    self.read_buffer = (keysightSD1.c_short * nPoints)()
+                data = self.read_buffer
                 nPointsOut = dig._SD_Object__core_dll.SD_AIN_DAQread(dig._SD_Object__handle, nDAQ, data, nPoints, timeOut)
                 if nPointsOut > 0:
                     return np.frombuffer(data, dtype=np.int16, count=nPoints)
@@ -356,6 +415,8 @@ class Driver(LabberDriver):
                     trace = trace.reshape((n_seq, nSample))
                 self.reshaped_traces.append(trace)
         # after getting data, pick values to return
+        if quant.name.startswith('Demodulation #'):
+            return self.getDemodulatedValue(quant, seq_no, n_seq)
         return quant.getTraceDict(self.reshaped_traces[ch][seq_no], dt=self.dt)
 
 
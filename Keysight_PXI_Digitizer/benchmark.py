@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Benchmark the integer averaging engine against float averaging.
+
+Uses synthetic buffers with the layouts of the Keysight PXI digitizer
+(int16 blocks of records) and the AlazarTech digitizer (uint16 DMA buffers,
+two channels interleaved). Run from the driver folder:
+
+    python benchmark.py
+
+"""
+import time
+
+import numpy as np
+
+from averaging import Averager
+
+
+def make_buffers(dtype, n_buffers, n_records, n_points, n_channels, seed=0):
+    # a few random buffers, re-used as in a DMA ring
+    rng = np.random.RandomState(seed)
+    info = np.iinfo(dtype)
+    return [rng.randint(info.min, info.max, size=n_records*n_points*n_channels,
+                        dtype=dtype) for n in range(n_buffers)]
+
+
+def average_float(buffers, n_total, n_records, n_points, n_channels, scale):
+    # previous implementation, convert the mean of every buffer to float
+    traces = [np.zeros(n_points) for n in range(n_channels)]
+    for n in range(n_total):
+        rs = buffers[n % len(buffers)].reshape((n_records, n_points, n_channels))
+        for ch in range(n_channels):
+            traces[ch] += scale*np.mean(rs[:, :, ch], 0)
+    return [trace/n_total for trace in traces]
+
+
+def average_int(averager, buffers, n_total, n_records, n_points, n_channels,
+                scale):
+    # sum raw samples of all channels, sort and convert once at the end
+    averager.reset(n_points*n_channels)
+    for n in range(n_total):
+        averager.add(buffers[n % len(buffers)].reshape((n_records, -1)))
+    average = averager.get_average(n_total*n_records, scale)
+    rs = average.reshape((n_points, n_channels))
+    return [rs[:, ch] for ch in range(n_channels)]
+
+
+def run(dtype, n_total, n_records, n_points, n_channels, n_repeat=3):
+    buffers = make_buffers(dtype, 4, n_records, n_points, n_channels)
+    averager = Averager()
+    scale = 1.0/32767
+    args = (buffers, n_total, n_records, n_points, n_channels, scale)
+    # time best of n_repeat, accumulators are re-used between calls
+    result = {}
+    for name, func in [('float', lambda: average_float(*args)),
+                       ('int', lambda: average_int(averager, *args))]:
+        durations = []
+        for n in range(n_repeat):
+            start = time.perf_counter()
+            traces = func()
+            durations.append(time.perf_counter() - start)
+        result[name] = (min(durations), traces)
+    error = max(np.max(np.abs(a - b)) for a, b in
+                zip(result['float'][1], result['int'][1]))
+    return result['float'][0], result['int'][0], error
+
+
+if __name__ == '__main__':
+    print('%-7s %8s %8s %8s %3s %10s %10s %8s %9s' %
+          ('dtype', 'buffers', 'records', 'points', 'ch', 'float (ms)',
+           'int (ms)', 'speed-up', 'max diff'))
+    for (dtype, n_total, n_records, n_points, n_channels) in [
+            (np.int16, 100, 100, 1000, 1),
+            (np.int16, 10, 1000, 256, 1),
+            (np.int16, 1000, 1, 10000, 1),
+            (np.uint16, 100, 100, 1024, 1),
+            (np.uint16, 100, 100, 1024, 2),
+            (np.uint16, 20, 5000, 128, 2)]:
+        t_float, t_int, error = run(dtype, n_total, n_records, n_points,
+                                    n_channels)
+        print('%-7s %8d %8d %8d %3d %10.1f %10.1f %8.1f %9.1e' %
+              (np.dtype(dtype).name, n_total, n_records, n_points, n_channels,
+               1E3*t_float, 1E3*t_int, t_float/t_int, error))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the pulse generator.
+
+Run from the driver folder, using the default values of the driver
+configuration in MultiQubit_PulseGenerator.ini:
+
+    python benchmark.py
+
+"""
+import configparser
+import os
+import random
+import time
+
+import pulse
+from sequence import SequenceToWaveforms
+from sequence_rb import TwoQubit_RB
+
+
+def get_default_config():
+    """Get driver configuration with default values from the ini file.
+
+    Returns
+    -------
+    dict
+        Configuration as defined by Labber driver configuration window.
+
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'MultiQubit_PulseGenerator.ini')
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    parser.optionxform = str
+    parser.read(path)
+    config = dict()
+    for name in parser.sections():
+        section = parser[name]
+        if 'datatype' not in section:
+            continue
+        datatype = section['datatype'].strip().upper()
+        value = section.get('def_value')
+        if datatype == 'DOUBLE':
+            config[name] = 0.0 if value is None else float(value)
+        elif datatype == 'BOOLEAN':
+            config[name] = value is not None and value.strip() in ('1',
+                                                                   'True')
+        elif datatype == 'COMBO':
+            if value is None:
+                value = section.get('combo_def_1', '')
+            config[name] = value.strip()
+        else:
+            config[name] = '' if value is None else value
+    return config
+
+
+def benchmark_2qb_rb(n_cliffords=50, n_rep=5, use_cache=True,
+                     repeat_sequence=False):
+    """Time compilation of a two-qubit RB sequence with CZ pulses.
+
+    Parameters
+    ----------
+    n_cliffords : int
+        Number of Cliffords in the sequence (the default is 50).
+    n_rep : int
+        Number of compilations to average over (the default is 5).
+    use_cache : bool
+        If False, disable the pulse envelope cache (the default is True).
+    repeat_sequence : bool
+        If True, compile the same random sequence every time, else a new
+        random sequence (the default is False).
+
+    Returns
+    -------
+    float
+        Average compile time in seconds, excluding sequence generation.
+
+    """
+    config = get_default_config()
+    config['Sequence'] = '2-QB Randomized Benchmarking'
+    config['Number of qubits'] = 'Two'
+    config['Number of Cliffords'] = n_cliffords
+    config['Pulse type, 2QB'] = 'CZ'
+    config['Width, 2QB'] = 50E-9
+
+    max_size = pulse.envelope_cache.max_size
+    if not use_cache:
+        pulse.envelope_cache.max_size = 0
+    pulse.envelope_cache.clear()
+    try:
+        duration = 0.0
+        for n in range(n_rep):
+            random.seed(0 if repeat_sequence else n)
+            sequence = TwoQubit_RB()
+            sequence.set_parameters(config)
+            sequence_to_waveforms = SequenceToWaveforms()
+            sequence_to_waveforms.set_parameters(config)
+            steps = sequence.get_sequence(config)
+            start = time.perf_counter()
+            sequence_to_waveforms.get_waveforms(steps)
+            duration += time.perf_counter() - start
+    finally:
+        pulse.envelope_cache.max_size = max_size
+    return duration / n_rep
+
+
+if __name__ == '__main__':
+    for repeat_sequence in (False, True):
+        for use_cache in (False, True):
+            print('2-QB RB, 50 Cliffords, %s sequence, envelope cache %s: '
+                  '%.1f ms' % ('same' if repeat_sequence else 'new',
+                               'on' if use_cache else 'off',
+                               1E3 * benchmark_2qb_rb(
+                                   use_cache=use_cache,
+                                   repeat_sequence=repeat_sequence)))
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+import os
+import tempfile
+from enum import Enum
+
+import numpy as np
+
+from gates import (CZ, IdentityGate, SingleQubitRotation, TwoQubitGate,
+                   VirtualZGate)
+
+log = logging.getLogger('LabberDriver')
+
+# Bump when changing the layout of the tables stored on disk
+CACHE_VERSION = 1
+
+# Unitaries are quantized with this scale when creating phase-free keys
+_KEY_SCALE = 2**20
+
+# Largest group for which a full multiplication table is stored
+_MAX_FULL_TABLE = 1024
+
+_PAULI = {'X': np.array([[0, 1], [1, 0]], dtype=complex),
+          'Y': np.array([[0, -1j], [1j, 0]], dtype=complex),
+          'Z': np.array([[1, 0], [0, -1]], dtype=complex)}
+_CZ_MATRIX = np.diag([1, 1, 1, -1]).astype(complex)
+
+# Operations of the gates in the Gate enum, filled on first use
+_enum_operations = {}
+
+
+def gate_to_operation(gate):
+    """Convert a gate into the Clifford operation it implements.
+
+    Parameters
+    ----------
+    gate : :obj:`BaseGate`, :obj:`Gate` or None
+        The gate to convert. None is treated as an identity gate.
+
+    Returns
+    -------
+    str or None
+        'CZ' for two-qubit gates, otherwise the rotation axis followed by the
+        number of quarter turns, e.g. 'X1' for a pi/2 rotation around X.
+        None is returned for gates that act as identity.
+
+    """
+    if isinstance(gate, Enum):
+        if gate not in _enum_operations:
+            _enum_operations[gate] = gate_to_operation(gate.value)
+        return _enum_operations[gate]
+    if gate is None or isinstance(gate, IdentityGate):
+        return None
+    if isinstance(gate, (TwoQubitGate, CZ)):
+        return 'CZ'
+    if isinstance(gate, SingleQubitRotation):
+        axis = gate.axis
+    elif isinstance(gate, VirtualZGate):
+        axis = 'Z'
+    else:
+        raise ValueError('{} is not a Clifford gate.'.format(gate))
+    turns = gate.angle / (np.pi / 2)
+    n_turn = int(round(turns))
+    if abs(turns - n_turn) > 1E-9:
+        raise ValueError(
+            'Rotation angle {} is not a Clifford angle.'.format(gate.angle))
+    n_turn = n_turn % 4
+    if n_turn == 0:
+        return None
+    return axis + str(n_turn)
+
+
+def phase_free_keys(unitaries):
+    """Create hashable keys identifying unitaries up to a global phase.
+
+    The phase is fixed by making the first non-zero element real and
+    positive, after which the elements are quantized to integers.
+
+    Parameters
+    ----------
+    unitaries : numpy array
+        Array of shape (n, ...) with `n` matrices or state vectors.
+
+    Returns
+    -------
+    list of bytes
+        One key per unitary.
+
+    """
+    values = np.reshape(unitaries, (len(unitaries), -1))
+    first = np.argmax(np.abs(values) > 0.1, axis=1)
+    ref = values[np.arange(len(values)), first]
+    values = values * (np.abs(ref) / ref)[:, np.newaxis]
+    quantized = np.rint(
+        np.concatenate((values.real, values.imag), axis=1) * _KEY_SCALE
+    ).astype(np.int64)
+    return [row.tobytes() for row in quantized]
+
+
+class CliffordGroup:
+    """Precomputed tables for the n-qubit Clifford group.
+
+    Each element is identified by its index in the decomposition given by
+    `add_clifford`, and stored as a phase-free unitary. The group is
+    represented by tables giving the result of applying single-qubit
+    rotations or CZ to each element, the inverse of each element and the
+    recovery element returning the ground state. Tables are built once and
+    cached on disk.
+
+    Parameters
+    ----------
+    n_qubit : int
+        Number of qubits, 1 or 2.
+    n_element : int
+        Number of elements in the group.
+    add_clifford : callable
+        Function `add_clifford(index, *gate_seqs)` appending the gates of
+        element `index` to one gate list per qubit.
+    cache_dir : str, optional
+        Directory for the table cache, None uses the system temp directory
+        (the default is None).
+
+    Attributes
+    ----------
+    operations : list of tuple
+        The operations (qubit, name) used for composing elements.
+    operation_table : numpy array
+        Index of the element obtained by applying operation `k` to element
+        `i` is given by `operation_table[k, i]`.
+    inverse_table : numpy array
+        Index of the inverse of each element.
+    recovery_table : numpy array
+        Index of the shortest element bringing the ground state, after
+        applying element `i`, back to the ground state.
+    multiplication_table : numpy array or None
+        Full multiplication table, only available for small groups.
+
+    """
+
+    def __init__(self, n_qubit, n_element, add_clifford, cache_dir=None):
+        self.n_qubit = n_qubit
+        self.n_element = n_element
+        self.cache_dir = cache_dir
+        self.operations = [(q, axis + str(n)) for q in range(n_qubit)
+                           for axis in 'XYZ' for n in (1, 2, 3)]
+        if n_qubit == 2:
+            self.operations.append((None, 'CZ'))
+        self._operation_index = {op: k for k, op in
+                                 enumerate(self.operations)}
+
+        # get the gate decomposition of each element
+        self._gate_seqs = []
+        ops = []
+        self._op_offsets = np.zeros(n_element + 1, dtype=int)
+        self.n_step = np.zeros(n_element, dtype=int)
+        for i in range(n_element):
+            gate_seqs = [[] for q in range(n_qubit)]
+            add_clifford(i, *gate_seqs)
+            self._gate_seqs.append(gate_seqs)
+            ops.extend(self.sequence_to_operations(gate_seqs))
+            self._op_offsets[i + 1] = len(ops)
+            self.n_step[i] = max(len(seq) for seq in gate_seqs)
+        self._ops = np.array(ops, dtype=int)
+
+        if not self._load_tables():
+            self._build_tables()
+            self._save_tables()
+        self.identity = self.index(np.eye(2**n_qubit))
+        if n_element <= _MAX_FULL_TABLE:
+            self.multiplication_table = np.array(
+                [[self._apply(i, j) for j in range(n_element)]
+                 for i in range(n_element)], dtype=np.int32)
+        else:
+            self.multiplication_table = None
+
+    def sequence_to_operations(self, gate_seqs):
+        """Convert gate lists into a list of operation indices.
+
+        Parameters
+        ----------
+        gate_seqs : list of list of :obj:`BaseGate`
+            One gate list per qubit, all with the same length.
+
+        Returns
+        -------
+        list of int
+            Indices of the operations, in the order they are applied.
+
+        """
+        if len(gate_seqs) != self.n_qubit:
+            raise ValueError('Number of gate lists must equal the number of '
+                             'qubits in the Clifford group.')
+        ops = []
+        for step in zip(*gate_seqs):
+            use_cz = False
+            for q, gate in enumerate(step):
+                op = gate_to_operation(gate)
+                if op == 'CZ':
+                    use_cz = True
+                elif op is not None:
+                    ops.append(self._operation_index[(q, op)])
+            if use_cz:
+                if self.n_qubit != 2:
+                    raise ValueError('CZ gates require a two-qubit group.')
+                ops.append(self._operation_index[(None, 'CZ')])
+        return ops
+
+    def index(self, unitary):
+        """Get the index of the element matching a unitary.
+
+        Parameters
+        ----------
+        unitary : numpy array
+            The unitary, the global phase is ignored.
+
+        Returns
+        -------
+        int
+            Element index.
+
+        """
+        key = phase_free_keys(np.asarray(unitary)[np.newaxis])[0]
+        if key not in self._lookup:
+            raise ValueError('Unitary is not an element of the group.')
+        return self._lookup[key]
+
+    def unitary(self, index):
+        """Get the phase-free unitary of an element.
+
+        Parameters
+        ----------
+        index : int
+            Element index.
+
+        Returns
+        -------
+        numpy array
+            The unitary matrix.
+
+        """
+        return self.unitaries[index].copy()
+
+    def index_of_sequence(self, gate_seqs, index=None):
+        """Get the element implemented by a sequence of gates.
+
+        Parameters
+        ----------
+        gate_seqs : list of list of :obj:`BaseGate`
+            One gate list per qubit, all with the same length.
+        index : int, optional
+            Element preceding the sequence, None starts from the identity
+            (the default is None).
+
+        Returns
+        -------
+        int
+            Element index.
+
+        """
+        if index is None:
+            index = self.identity
+        for op in self.sequence_to_operations(gate_seqs):
+            index = self.operation_table[op, index]
+        return int(index)
+
+    def multiply(self, i, j):
+        """Get the product of two elements.
+
+        Parameters
+        ----------
+        i : int
+            Element applied last.
+        j : int
+            Element applied first.
+
+        Returns
+        -------
+        int
+            Index of the element `i` * `j`.
+
+        """
+        if self.multiplication_table is not None:
+            return int(self.multiplication_table[i, j])
+        return self._apply(i, j)
+
+    def inverse(self, index):
+        """Get the inverse of an element.
+
+        Parameters
+        ----------
+        index : int
+            Element index.
+
+        Returns
+        -------
+        int
+            Index of the inverse element.
+
+        """
+        return int(self.inverse_table[index])
+
+    def recovery(self, index):
+        """Get the element returning the ground state after `index`.
+
+        Parameters
+        ----------
+        index : int
+            Element index.
+
+        Returns
+        -------
+        int
+            Index of the shortest recovery element.
+
+        """
+        return int(self.recovery_table[index])
+
+    def get_gates(self, index):
+        """Get the gate decomposition of an element.
+
+        Parameters
+        ----------
+        index : int
+            Element index.
+
+        Returns
+        -------
+        list of list of :obj:`Gate`
+            One gate list per qubit.
+
+        """
+        return [list(seq) for seq in self._gate_seqs[index]]
+
+    def _apply(self, i, j):
+        """Apply the decomposition of element `i` to element `j`."""
+        for op in self._ops[self._op_offsets[i]:self._op_offsets[i + 1]]:
+            j = self.operation_table[op, j]
+        return int(j)
+
+    def _operation_matrix(self, op):
+        """Get the unitary of an operation on the full system."""
+        qubit, name = op
+        if name == 'CZ':
+            return _CZ_MATRIX
+        angle = int(name[1]) * np.pi / 2
+        matrix = (np.cos(angle / 2) * np.eye(2) -
+                  1j * np.sin(angle / 2) * _PAULI[name[0]])
+        # first qubit is the most significant in the tensor product
+        return np.kron(np.kron(np.eye(2**qubit), matrix),
+                       np.eye(2**(self.n_qubit - qubit - 1)))
+
+    def _build_tables(self):
+        """Calculate unitaries, operation, inverse and recovery tables."""
+        dim = 2**self.n_qubit
+        matrices = [self._operation_matrix(op) for op in self.operations]
+        self.unitaries = np.zeros((self.n_element, dim, dim), dtype=complex)
+        for i in range(self.n_element):
+            u = np.eye(dim, dtype=complex)
+            for op in self._ops[self._op_offsets[i]:self._op_offsets[i + 1]]:
+                u = matrices[op] @ u
+            self.unitaries[i] = u
+        self._create_lookup()
+
+        self.operation_table = np.array(
+            [self._find(matrix @ self.unitaries) for matrix in matrices],
+            dtype=np.int32).reshape(len(matrices), self.n_element)
+        self.inverse_table = self._find(
+            np.conj(np.transpose(self.unitaries, (0, 2, 1))))
+
+        # the recovery only needs to return the ground state, for each state
+        # find the shortest element mapping it back, lowest index first
+        states = phase_free_keys(self.unitaries[:, :, 0])
+        returned = phase_free_keys(np.conj(self.unitaries[:, 0, :]))
+        best = dict()
+        for j in np.lexsort((np.arange(self.n_element), self.n_step)):
+            best.setdefault(returned[j], j)
+        self.recovery_table = np.array([best[s] for s in states],
+                                       dtype=np.int32)
+
+    def _create_lookup(self):
+        keys = phase_free_keys(self.unitaries)
+        self._lookup = {key: i for i, key in enumerate(keys)}
+        if len(self._lookup) != self.n_element:
+            raise ValueError('Clifford decomposition contains duplicates.')
+
+    def _find(self, unitaries):
+        """Get element indices of an array of unitaries."""
+        try:
+            return np.array([self._lookup[key] for key in
+                             phase_free_keys(unitaries)], dtype=np.int32)
+        except KeyError:
+            raise ValueError('The Clifford group is not closed, check the '
+                             'element decomposition.')
+
+    def _cache_path(self):
+        """Get the file name for the table cache."""
+        # the hash makes sure tables are rebuilt if the decomposition changes
+        signature = hashlib.sha1(
+            repr(self.operations).encode() + self._ops.tobytes() +
+            self._op_offsets.tobytes()).hexdigest()[:16]
+        folder = (tempfile.gettempdir() if self.cache_dir is None
+                  else self.cache_dir)
+        return os.path.join(folder, 'clifford_%dqb_v%d_%s.npz' % (
+            self.n_qubit, CACHE_VERSION, signature))
+
+    def _load_tables(self):
+        """Load tables from disk, return False if not available."""
+        path = self._cache_path()
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                self.unitaries = data['unitaries']
+                self.operation_table = data['operation_table']
+                self.inverse_table = data['inverse_table']
+                self.recovery_table = data['recovery_table']
+            self._create_lookup()
+        except Exception as e:
+            log.warning('Failed loading Clifford tables from %s: %s',
+                        path, e)
+            return False
+        return (self.operation_table.shape ==
+                (len(self.operations), self.n_element))
+
+    def _save_tables(self):
+        """Store tables on disk, failures only give a warning."""
+        path = self._cache_path()
+        try:
+            np.savez(path, unitaries=self.unitaries,
+                     operation_table=self.operation_table,
+                     inverse_table=self.inverse_table,
+                     recovery_table=self.recovery_table)
+        except OSError as e:
+            log.warning('Failed saving Clifford tables to %s: %s', path, e)
+
+
+if __name__ == '__main__':
+    pass
@@ -40,6 +40,25 @@ class BaseGate:
         new_gate.phase_shift += shift
         return new_gate
 
+    def get_adjusted_pulse(self, pulse):
+        """
+        Return a copy of the pulse, adjusted to implement the gate.
+
+        Parameters
+        ----------
+        pulse : Pulse object
+            The pulse object to use for the gate.
+
+        Returns
+        ----------
+        pulse : Pulse object
+            The adjusted pulse.
+
+        """
+        pulse = copy(pulse)
+        pulse.phase += self.phase_shift
+        return pulse
+
     def get_waveform(self, pulse, t0, t):
         """
         Return the waveform corresponding to the gate.
@@ -59,8 +78,7 @@ class BaseGate:
             The calculated waveform.
 
         """
-        pulse = copy(pulse)
-        pulse.phase += self.phase_shift
+        pulse = self.get_adjusted_pulse(pulse)
         return pulse.calculate_waveform(t0, t)
 
 
@@ -81,7 +99,7 @@ class SingleQubitRotation(BaseGate):
         self.axis = axis
         self.angle = angle
 
-    def get_waveform(self, pulse, t0, t):  # noqa D102
+    def get_adjusted_pulse(self, pulse):  # noqa D102
         pulse = copy(pulse)
         if self.axis == 'X':
             pulse.phase += 0
@@ -94,7 +112,7 @@ class SingleQubitRotation(BaseGate):
             raise ValueError('Axis must be X, Y, or Z.')
         # pi pulse correspond to the full amplitude
         pulse.amplitude *= self.angle / np.pi
-        return super().get_waveform(pulse, t0, t)
+        return super().get_adjusted_pulse(pulse)
 
 
 class IdentityGate(BaseGate):
@@ -116,14 +134,14 @@ class IdentityGate(BaseGate):
         super().__init__()
         self.width = width
 
-    def get_waveform(self, pulse, t0, t):  # noqa: D102
+    def get_adjusted_pulse(self, pulse):  # noqa: D102
         pulse = copy(pulse)
         pulse.amplitude = 0
         pulse.use_drag = False
         if self.width is not None:
             pulse.width = self.width
             pulse.plateau = 0
-        return super().get_waveform(pulse, t0, t)
+        return super().get_adjusted_pulse(pulse)
 
 
 class VirtualZGate(BaseGate):
@@ -141,16 +159,10 @@ class TwoQubitGate(BaseGate):
     def __init__(self):
         super().__init__()
 
-    def get_waveform(self, pulse, t0, t):  # noqa: D102
-        return super().get_waveform(pulse, t0, t)
-
 
 class ReadoutGate(BaseGate):
     """Readouts the qubit state."""
 
-    def get_waveform(self, pulse, t0, t):  # noqa: D102
-        return super().get_waveform(pulse, t0, t)
-
 
 class CustomGate(BaseGate):
     """A gate using a given :obj:`Pulse`.
@@ -166,8 +178,8 @@ class CustomGate(BaseGate):
         super().__init__()
         self.pulse = pulse
 
-    def get_waveform(self, pulse, t0, t):  # noqa: D102
-        return super().get_waveform(self.pulse, t0, t)
+    def get_adjusted_pulse(self, pulse):  # noqa: D102
+        return super().get_adjusted_pulse(self.pulse)
 
 
 class CompositeGate:
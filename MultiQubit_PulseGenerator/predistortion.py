@@ -10,20 +10,42 @@
 # one mixer at a time. A challenge will be finding a good way to add the
 # transfer functions to a common file in a convenient way.
 
+import os
+from collections import OrderedDict
+
 import numpy as np
-from numpy.fft import fft, fftfreq, fftshift, ifft, ifftshift
+from numpy.fft import (fft, fftfreq, fftshift, ifft, ifftshift, irfft, rfft,
+                       rfftfreq)
+from scipy.fft import next_fast_len
 from scipy.interpolate import interp1d
+from scipy.signal import bilinear, lfilter
 
 
 class Predistortion(object):
-    """This class is used to predistort I/Q waveforms for qubit XY control."""
+    """This class is used to predistort I/Q waveforms for qubit XY control.
+
+    The inverse response is calculated once per transfer function file and
+    interpolated onto the frequency grid of the waveform.  The interpolated
+    inverse is cached per FFT length and sample rate, and the cache is
+    cleared whenever the transfer function file or its modification time
+    changes.
+
+    """
+
+    # max number of waveform lengths to keep inverse responses for
+    MAX_CACHE_SIZE = 32
 
     def __init__(self, waveform_number=0):
         # define variables
         self.transfer_path = ''
+        self.transfer_mtime = None
         # keep track of which Labber waveform this predistortion refers to
         self.waveform_number = waveform_number
-        # TODO(dan): define variables for predistortion algorithm
+        self.dt = 1.0
+        # inverse response on the transfer function frequency grid
+        self._inverse = None
+        # interpolated inverse responses, keyed by FFT length and sample rate
+        self._inverse_cache = OrderedDict()
 
     def set_parameters(self, config={}):
         """Set base parameters using config from from Labber driver.
@@ -36,12 +58,21 @@ class Predistortion(object):
         """
         # Labber configuration contains multiple predistortions, get right one
         path = config.get('Transfer function #%d' % (self.waveform_number + 1))
-        # only reload tranfser function if file changed
-        if path != self.transfer_path:
+        # only reload tranfser function if file or modification time changed
+        if (path != self.transfer_path or
+                self._get_mtime(path) != self.transfer_mtime):
             self.import_transfer_function(path)
 
         self.dt = 1 / config.get('Sample rate')
 
+    @staticmethod
+    def _get_mtime(path):
+        """Get modification time of file, or None if file does not exist."""
+        try:
+            return os.path.getmtime(path)
+        except (OSError, TypeError):
+            return None
+
     def import_transfer_function(self, path):
         """Import transfer function data.
 
@@ -51,8 +82,11 @@ class Predistortion(object):
             Path to file containing transfer function data
 
         """
-        # store new path
+        # store new path, and invalidate cached inverse responses
         self.transfer_path = path
+        self.transfer_mtime = self._get_mtime(path)
+        self._inverse = None
+        self._inverse_cache.clear()
 
         # return directly if not in use, look for both '' and '.'
         if self.transfer_path.strip() in ('', '.'):
@@ -65,23 +99,15 @@ class Predistortion(object):
             y_channel=1)
         # TODO(dan): load transfer function data
 
-    def predistort(self, waveform):
-        """Predistort input waveform.
-
-        Parameters
-        ----------
-        waveform : complex numpy array
-            Waveform data to be pre-distorted
+    def _calculate_inverse(self):
+        """Calculate inverse response on the transfer function frequencies.
 
         Returns
         -------
-        waveform : complex numpy array
-            Pre-distorted waveform
+        inverse : complex numpy array
+            Inverse response {{a, b}, {c, d}}, shape (2, 2, n_freq).
 
         """
-        # find timespan of waveform
-        self.tvals = np.arange(0, self.dt * len(waveform), self.dt)
-
         response_I = ifft(ifftshift(self.vFilteredResponse_FFT_I))
         response_FFT_I_r = fftshift(fft(complex(1, 0) * response_I.real))
         response_FFT_I_i = fftshift(fft(complex(1, 0) * response_I.imag))
@@ -100,29 +126,66 @@ class Predistortion(object):
         Zb = -response_FFT_Q_r / determinant
         Zc = -response_FFT_I_i / determinant
         Zd = response_FFT_I_r / determinant
+        return np.array([[Za, Zb], [Zc, Zd]])
 
-        Inverse_A = interp1d(self.vResponse_freqs, Za)
-        Inverse_B = interp1d(self.vResponse_freqs, Zb)
-        Inverse_C = interp1d(self.vResponse_freqs, Zc)
-        Inverse_D = interp1d(self.vResponse_freqs, Zd)
+    def get_inverse(self, n_fft):
+        """Get inverse response on the real FFT grid of the waveform.
 
-        # applies the interpolated inverse function to the AWG signal
+        Parameters
+        ----------
+        n_fft : int
+            Length of real FFT.
+
+        Returns
+        -------
+        inverse : complex numpy array
+            Inverse response {{a, b}, {c, d}}, shape (2, 2, n_fft // 2 + 1).
 
-        fft_vals, fft_signal_r = self.apply_FFT(
-            self.tvals, complex(1, 0) * waveform.real)
-        fft_vals, fft_signal_i = self.apply_FFT(
-            self.tvals, complex(1, 0) * waveform.imag)
+        """
+        key = (n_fft, self.dt)
+        inverse = self._inverse_cache.get(key)
+        if inverse is not None:
+            self._inverse_cache.move_to_end(key)
+            return inverse
+        if self._inverse is None:
+            self._inverse = self._calculate_inverse()
+        # the inverse is hermitian, only positive frequencies are needed
+        interp = interp1d(self.vResponse_freqs, self._inverse)
+        inverse = interp(rfftfreq(n_fft, self.dt))
+        inverse.flags.writeable = False
+        self._inverse_cache[key] = inverse
+        while len(self._inverse_cache) > self.MAX_CACHE_SIZE:
+            self._inverse_cache.popitem(last=False)
+        return inverse
 
-        fft_signal = (fft_signal_r * Inverse_A(fft_vals) + fft_signal_i *
-                      Inverse_B(fft_vals) + 1j *
-                      (fft_signal_r * Inverse_C(fft_vals) +
-                       fft_signal_i * Inverse_D(fft_vals)))
-        corr_signal = ifft(ifftshift(fft_signal))
+    def predistort(self, waveform):
+        """Predistort input waveform.
 
-        vI = np.array(corr_signal.real, dtype='float64')
-        vQ = np.array(corr_signal.imag, dtype='float64')
+        The waveform is zero-padded to a fast FFT length before applying
+        the inverse response, and truncated to its original length after.
 
-        return vI + 1j * vQ
+        Parameters
+        ----------
+        waveform : complex numpy array
+            Waveform data to be pre-distorted
+
+        Returns
+        -------
+        waveform : complex numpy array
+            Pre-distorted waveform
+
+        """
+        n = len(waveform)
+        n_fft = next_fast_len(n, real=True)
+        inverse = self.get_inverse(n_fft)
+
+        # applies the interpolated inverse function to the AWG signal,
+        # transform I and Q in the same call
+        fft_signal = rfft(np.vstack((waveform.real, waveform.imag)), n_fft)
+        fft_signal = np.einsum('ijk,jk->ik', inverse, fft_signal)
+        corr_signal = irfft(fft_signal, n_fft)[:, :n]
+
+        return corr_signal[0] + 1j * corr_signal[1]
 
     def apply_FFT(self, tvals, signal):
         fft_signal = fftshift(fft(signal))
@@ -131,7 +194,14 @@ class Predistortion(object):
 
 
 class ExponentialPredistortion:
-    """Implement a three-pole predistortion on the Z waveforms.
+    """Implement a multi-pole predistortion on the Z waveforms.
+
+    The distortion is modelled by the transfer function
+    H(s) = 1 + sum_k A_k s tau_k / (1 + s tau_k), giving a step response
+    1 + sum_k A_k exp(-t / tau_k).  The inverse of H is discretized with the
+    bilinear transform and applied as a causal IIR filter.  The filter state
+    can be carried across consecutive calls, so long waveforms can be
+    predistorted in chunks.
 
     Parameters
     ----------
@@ -152,6 +222,11 @@ class ExponentialPredistortion:
         Amplitude for the third pole.
     tau3 : float
         Time constant for the third pole.
+    amplitudes : list of float
+        Amplitudes for all poles.
+    taus : list of float
+        Time constants for all poles.  Poles with zero time constant or
+        amplitude are ignored.
     dt : float
         Sample spacing for the waveform.
 
@@ -164,8 +239,15 @@ class ExponentialPredistortion:
         self.tau2 = 0
         self.A3 = 0
         self.tau3 = 0
+        self.amplitudes = []
+        self.taus = []
         self.dt = 1
         self.n = int(waveform_number)
+        # filter coefficients, and key of parameters used to calculate them
+        self._filter = None
+        self._filter_key = None
+        # filter state after the last predistorted waveform
+        self.zi = None
 
     def set_parameters(self, config={}):
         """Set base parameters using config from from Labber driver.
@@ -184,36 +266,127 @@ class ExponentialPredistortion:
 
         self.A3 = config.get('Predistort Z{} - A3'.format(m))
         self.tau3 = config.get('Predistort Z{} - tau3'.format(m))
+        self.amplitudes = [self.A1, self.A2, self.A3]
+        self.taus = [self.tau1, self.tau2, self.tau3]
         self.dt = 1 / config.get('Sample rate')
 
-    def predistort(self, waveform):
+    def get_filter(self):
+        """Get IIR filter coefficients for the inverse transfer function.
+
+        Returns
+        -------
+        b : numpy array
+            Numerator coefficients.
+        a : numpy array
+            Denominator coefficients, normalized to a[0] = 1.
+
+        """
+        poles = [(A, tau / self.dt)
+                 for A, tau in zip(self.amplitudes, self.taus)
+                 if A and tau]
+        key = tuple(poles)
+        if key == self._filter_key:
+            return self._filter
+
+        # work with time in units of samples to keep polynomials well scaled
+        # H(s) = N(s) / D(s), with D(s) = prod_k (1 + s tau_k)
+        D = np.ones(1)
+        for A, tau in poles:
+            D = np.polymul(D, [tau, 1.0])
+        N = D.copy()
+        for k, (A, tau) in enumerate(poles):
+            term = np.array([A * tau, 0.0])
+            for j, (_, tau_j) in enumerate(poles):
+                if j != k:
+                    term = np.polymul(term, [tau_j, 1.0])
+            N = np.polyadd(N, term)
+        # inverse filter is D / N, discretize with bilinear transform
+        b, a = bilinear(D, N, fs=1.0)
+        b = b / a[0]
+        a = a / a[0]
+
+        self._filter = (b, a)
+        self._filter_key = key
+        return self._filter
+
+    def reset(self):
+        """Reset filter state, the next waveform starts from zero."""
+        self.zi = None
+
+    def predistort(self, waveform, reset=True):
         """Predistort input waveform.
 
         Parameters
         ----------
-        waveform : complex numpy array
-            Waveform data to be pre-distorted
+        waveform : numpy array
+            Waveform data to be pre-distorted.  For 2D input, each row is
+            filtered independently along the last axis.
+        reset : bool
+            If False, continue from the filter state of the previous call,
+            treating the waveform as a continuation of the previous one
+            (the default is True).
 
         Returns
         -------
-        waveform : complex numpy array
+        waveform : numpy array
             Pre-distorted waveform
 
         """
-        Y = np.fft.rfft(waveform, norm='ortho')
-
-        omega = 2 * np.pi * np.fft.rfftfreq(len(waveform), self.dt)
-        H = (1 +
-             (1j * self.A1 * omega * self.tau1) /
-             (1j * omega * self.tau1 + 1) +
-             (1j * self.A2 * omega * self.tau2) /
-             (1j * omega * self.tau2 + 1) +
-             (1j * self.A3 * omega * self.tau3) /
-             (1j * omega * self.tau3 + 1))
-        Yc = Y / H
-
-        yc = np.fft.irfft(Yc, norm='ortho')
-        return yc
+        return predistort_exponential([self], [waveform], reset)[0]
+
+
+def predistort_exponential(predistortions, waveforms, reset=True):
+    """Apply exponential predistortions to several Z waveforms at once.
+
+    Waveforms sharing the same filter coefficients are filtered together
+    in a single call to scipy.signal.lfilter.
+
+    Parameters
+    ----------
+    predistortions : list of ExponentialPredistortion
+        Predistortion for each waveform.
+    waveforms : list of numpy array, or 2D numpy array
+        Z waveforms.  Waveforms are either 1D arrays, or 2D arrays where the
+        rows are filtered independently along the last axis.
+    reset : bool
+        If False, continue from the filter state of the previous call
+        (the default is True).
+
+    Returns
+    -------
+    waveforms : list of numpy array
+        Pre-distorted waveforms
+
+    """
+    waveforms = list(waveforms)
+    # group waveforms by filter coefficients and shape
+    groups = dict()
+    for n, (p, waveform) in enumerate(zip(predistortions, waveforms)):
+        b, a = p.get_filter()
+        key = (tuple(b), tuple(a), np.shape(waveform))
+        groups.setdefault(key, []).append(n)
+
+    for (b, a, shape), indices in groups.items():
+        b, a = np.array(b), np.array(a)
+        n_state = max(len(a), len(b)) - 1
+        if (n_state == 0 and b[0] == 1.0) or shape[-1] == 0:
+            # identity filter or empty waveform, nothing to do
+            for n in indices:
+                predistortions[n].zi = None
+            continue
+        y = np.array([waveforms[n] for n in indices], dtype=float)
+        # state for each waveform, shape (n_wave, ..., n_state)
+        zi = np.zeros(y.shape[:-1] + (n_state,))
+        for m, n in enumerate(indices):
+            p = predistortions[n]
+            if (not reset and p.zi is not None and
+                    p.zi.shape == zi.shape[1:]):
+                zi[m] = p.zi
+        y, zf = lfilter(b, a, y, axis=-1, zi=zi)
+        for m, n in enumerate(indices):
+            predistortions[n].zi = zf[m]
+            waveforms[n] = y[m]
+    return waveforms
 
 
 if __name__ == '__main__':
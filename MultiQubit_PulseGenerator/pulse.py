@@ -1,12 +1,134 @@
 #!/usr/bin/env python3
 import logging
+from collections import OrderedDict
 from enum import Enum
+from functools import lru_cache
 
 import numpy as np
 
 log = logging.getLogger('LabberDriver')
 
 
+@lru_cache(maxsize=128)
+def _cz_theta_table(coupling, offset, amplitude, lcoeff, width, f_terms):
+    """Calculate time and angle of a CZ pulse as functions of tau.
+
+    Notation and calculations are based on "Fast adiabatic qubit gates using
+    only sigma_z control", PRA 90, 022307 (2014). The results are memoized,
+    since the table is the same for all CZ pulses with the same parameters.
+
+    Returns
+    -------
+    t_tau : numpy array
+        Time as function of tau.
+    theta_tau : numpy array
+        Angle on the |11>-|02> bloch sphere as function of tau.
+
+    """
+    # Initial and final angles on the |11>-|02> bloch sphere
+    theta_i = np.arctan(coupling / offset)
+    theta_f = np.arctan(coupling / amplitude)
+
+    # Normalize fouriere coefficients to initial and final angles
+    lcoeff = np.array(lcoeff)
+    lcoeff = lcoeff * ((theta_f - theta_i) /
+                       (2 * np.sum(lcoeff[range(0, f_terms, 2)])))
+
+    # defining helper variabels
+    n = np.arange(1, f_terms + 1, 1)
+    n_points = 1000  # Number of points in the numerical integration
+
+    # Calculate pulse width in tau variable
+    tau = np.linspace(0, 1, n_points)[:, np.newaxis]
+    theta_tau = np.sum(lcoeff * (1 - np.cos(2 * np.pi * n * tau)) + theta_i,
+                       axis=-1)
+    t_tau = np.trapz(np.sin(theta_tau), x=tau[:, 0])
+    width_tau = width / t_tau
+
+    # Calculating angle and time as functions of tau
+    tau = np.linspace(0, width_tau, n_points)
+    theta_tau = np.sum(
+        lcoeff * (1 - np.cos(2 * np.pi * n * tau[:, np.newaxis] / width_tau)) +
+        theta_i, axis=-1)
+    # cumulative trapezoidal integral, each time value excludes its own point
+    y = np.sin(theta_tau)
+    t_tau = np.zeros(n_points)
+    t_tau[2:] = np.cumsum(np.diff(tau) * (y[1:] + y[:-1]) / 2)[:-1]
+
+    t_tau.flags.writeable = False
+    theta_tau.flags.writeable = False
+    return (t_tau, theta_tau)
+
+
+class EnvelopeCache(object):
+    """Least-recently-used cache for calculated pulse envelopes.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximal memory used by the cached envelopes, in bytes
+        (the default is 64 MB). Set to 0 to disable the cache.
+
+    Attributes
+    ----------
+    size : int
+        Memory currently used by the cached envelopes, in bytes.
+    hits : int
+        Number of envelopes found in the cache.
+    misses : int
+        Number of envelopes not found in the cache.
+
+    """
+
+    def __init__(self, max_size=64 * 2**20):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Get envelope from cache, returns None if not available."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, values, nbytes=None):
+        """Add envelope to cache, removing the least recently used ones.
+
+        `nbytes` is the memory used by the entry, including the key, the
+        default is the size of the envelope.
+        """
+        if nbytes is None:
+            nbytes = values.nbytes
+        if nbytes > self.max_size or key in self._data:
+            return
+        values.flags.writeable = False
+        self._data[key] = (values, nbytes)
+        self.size += nbytes
+        while self.size > self.max_size:
+            (_, (_, old_nbytes)) = self._data.popitem(last=False)
+            self.size -= old_nbytes
+
+    def clear(self):
+        """Remove all envelopes and reset the counters."""
+        self._data.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Envelope cache shared by all pulses
+envelope_cache = EnvelopeCache()
+
+
 class PulseShape(Enum):
     """Define possible qubit pulses shapes."""
 
@@ -111,12 +233,52 @@ class Pulse(object):
             duration = self.width + self.plateau
         return duration
 
+    def envelope_key(self):
+        """Get a key identifying the parameters of the pulse envelope.
+
+        Pulses with equal keys have the same envelope, including DRAG
+        corrections, but may differ in phase and SSB frequency.
+
+        Returns
+        -------
+        tuple
+            Hashable tuple with all parameters defining the envelope.
+
+        """
+        if self.qubit is None:
+            qubit = None
+        else:
+            qubit = (type(self.qubit).__name__,
+                     tuple(sorted(vars(self.qubit).items())))
+        return (self.shape, self.amplitude, self.width, self.plateau,
+                self.use_drag, self.drag_coefficient, self.drag_detuning,
+                self.truncation_range, self.start_at_zero, self.F_Terms,
+                self.Coupling, self.Offset, tuple(np.ravel(self.Lcoeff)),
+                self.dfdV, qubit)
+
+    def parameter_key(self):
+        """Get a key identifying the pulse parameters.
+
+        Pulses with equal keys produce the same waveform.
+
+        Returns
+        -------
+        tuple
+            Hashable tuple with all parameters defining the pulse.
+
+        """
+        return self.envelope_key() + (self.pulse_type, self.frequency,
+                                      self.phase, self.iq_ratio, self.iq_skew)
+
     def calculate_envelope(self, t0, t):
         """Calculate pulse envelope.
 
+        Multiple pulses can be calculated at once by giving `t0` as a column
+        vector and `t` as a 2D array with one row per pulse.
+
         Parameters
         ----------
-        t0 : float
+        t0 : float or numpy array
             Pulse position, referenced to center of pulse.
 
         t : numpy array
@@ -131,8 +293,8 @@ class Pulse(object):
         # calculate the actual value for the selected indices
         if self.shape == PulseShape.SQUARE:
             # reduce risk of rounding errors by putting checks between samples
-            if len(t) > 1:
-                t0 += (t[1] - t[0]) / 2.0
+            if t.shape[-1] > 1:
+                t0 = t0 + (t[..., 1:2] - t[..., 0:1]) / 2.0
 
             values = ((t >= (t0 - (self.width + self.plateau) / 2)) &
                       (t < (t0 + (self.width + self.plateau) / 2)))
@@ -183,8 +345,8 @@ class Pulse(object):
                     )
 
             if self.start_at_zero:
-                values = values - values.min()
-                values = values / values.max()
+                values = values - values.min(axis=-1, keepdims=True)
+                values = values / values.max(axis=-1, keepdims=True)
             values = values * self.amplitude
 
         elif self.shape == PulseShape.CZ:
@@ -196,50 +358,22 @@ class Pulse(object):
             theta_i = np.arctan(self.Coupling / self.Offset)
             theta_f = np.arctan(self.Coupling / self.amplitude)
 
-            # Normalize fouriere coefficients to initial and final angles
-            self.Lcoeff *= ((theta_f - theta_i) /
-                            (2 * np.sum(self.Lcoeff[range(0,
-                                                          self.F_Terms, 2)])))
-
-            # defining helper variabels
-            n = np.arange(1, self.F_Terms + 1, 1)
-            n_points = 1000  # Number of points in the numerical integration
-
-            # Calculate pulse width in tau variable - See paper for details
-            tau = np.linspace(0, 1, n_points)
-            theta_tau = np.zeros(n_points)
-            for i in range(n_points):
-                theta_tau[i] = np.sum((self.Lcoeff *
-                                       (1 - np.cos(2 * np.pi * n * tau[i]))) +
-                                      theta_i)
-            t_tau = np.trapz(np.sin(theta_tau), x=tau)
-            Width_tau = self.width / t_tau
-
-            # Calculating angle and time as functions of tau
-            tau = np.linspace(0, Width_tau, n_points)
-            t_tau = np.zeros(n_points)
-            for i in range(n_points):
-                theta_tau[i] = np.sum((self.Lcoeff *
-                                       (1 - np.cos(2 * np.pi * n * tau[i] /
-                                                   Width_tau))) + theta_i)
-                if i > 0:
-                    t_tau[i] = np.trapz(np.sin(theta_tau[0:i]), x=tau[0:i])
+            # Time and angle as functions of tau, see paper for details
+            (t_tau, theta_tau) = _cz_theta_table(
+                self.Coupling, self.Offset, self.amplitude,
+                tuple(np.ravel(self.Lcoeff)), self.width, self.F_Terms)
 
             # Plateau is added as an extra extension of theta_f.
-            theta_t = np.ones(len(t)) * theta_i
-            for i in range(len(t)):
-                if 0 < (t[i] - t0 + self.plateau / 2) < self.plateau:
-                    theta_t[i] = theta_f
-                elif (0 < (t[i] - t0 + self.width / 2 + self.plateau / 2) <
-                        (self.width + self.plateau) / 2):
-                    theta_t[i] = np.interp(
-                        t[i] - t0 + self.width / 2 + self.plateau / 2,
-                        t_tau, theta_tau)
-                elif (0 < (t[i] - t0 + self.width / 2 + self.plateau / 2) <
-                      (self.width + self.plateau)):
-                    theta_t[i] = np.interp(
-                        t[i] - t0 + self.width / 2 - self.plateau / 2,
-                        t_tau, theta_tau)
+            t_rise = t - t0 + self.width / 2 + self.plateau / 2
+            theta_t = np.select(
+                [(0 < t - t0 + self.plateau / 2) &
+                 (t - t0 + self.plateau / 2 < self.plateau),
+                 (0 < t_rise) & (t_rise < (self.width + self.plateau) / 2),
+                 (0 < t_rise) & (t_rise < (self.width + self.plateau))],
+                [theta_f,
+                 np.interp(t_rise, t_tau, theta_tau),
+                 np.interp(t_rise - self.plateau, t_tau, theta_tau)],
+                default=theta_i)
 
             df = self.Coupling * (1 / np.tan(theta_t) - 1 / np.tan(theta_i))
             if self.qubit is None:
@@ -255,14 +389,18 @@ class Pulse(object):
                           (1 - np.cos(2 * np.pi * (t - t0 + tau / 2) / tau)))
             else:
                 values = np.ones_like(t) * self.amplitude
-                values[t < t0 - self.plateau / 2] = self.amplitude / 2 * \
-                    (1 - np.cos(2 * np.pi *
-                                (t[t < t0 - self.plateau / 2] - t0 +
-                                 self.plateau / 2 + tau / 2) / tau))
-                values[t > t0 + self.plateau / 2] = self.amplitude / 2 * \
-                    (1 - np.cos(2 * np.pi *
-                                (t[t > t0 + self.plateau / 2] - t0 -
-                                 self.plateau / 2 + tau / 2) / tau))
+                values = np.where(
+                    t < t0 - self.plateau / 2,
+                    self.amplitude / 2 *
+                    (1 - np.cos(2 * np.pi * (t - t0 + self.plateau / 2 +
+                                             tau / 2) / tau)),
+                    values)
+                values = np.where(
+                    t > t0 + self.plateau / 2,
+                    self.amplitude / 2 *
+                    (1 - np.cos(2 * np.pi * (t - t0 - self.plateau / 2 +
+                                             tau / 2) / tau)),
+                    values)
 
         # Make sure the waveform is zero outside the pulse
         values[t < (t0 - self.total_duration() / 2)] = 0
@@ -274,11 +412,12 @@ class Pulse(object):
 
         Parameters
         ----------
-        t0 : float
+        t0 : float or numpy array
             Pulse position, referenced to center of pulse.
 
         t : numpy array
-            Array with time values for which to calculate the pulse waveform.
+            Array with time values for which to calculate the pulse waveform,
+            see `calculate_envelope` for calculating multiple pulses at once.
 
         Returns
         -------
@@ -286,12 +425,7 @@ class Pulse(object):
             Array containing pulse waveform.
 
         """
-        y = self.calculate_envelope(t0, t)
-        if self.use_drag:
-            beta = self.drag_coefficient / (t[1] - t[0])
-            y = y + 1j * beta * np.gradient(y)
-            y = y * np.exp(1j * 2 * np.pi * self.drag_detuning *
-                           (t - t0 + self.total_duration() / 2))
+        y = self.calculate_baseband(t0, t)
 
         if self.pulse_type in (PulseType.XY, PulseType.READOUT):
             # Apply phase and SSB
@@ -306,6 +440,55 @@ class Pulse(object):
                       -y.imag * np.sin(omega * t - phase + self.iq_skew +
                                        np.pi / 2))
             y = data_i + 1j * data_q
+        elif envelope_cache.max_size > 0:
+            # don't return cached data
+            y = y.copy()
+        return y
+
+    def calculate_baseband(self, t0, t):
+        """Calculate pulse envelope with DRAG corrections, but without SSB.
+
+        Envelopes are cached using the pulse parameters, the exact pulse
+        positions and the exact time values as key, so cached envelopes are
+        identical to calculated ones. The same pulses at the same positions
+        are repeated when a sequence is compiled again, for example in a
+        sweep of parameters of other pulses, or in batch compilation.
+
+        Parameters
+        ----------
+        t0 : float or numpy array
+            Pulse position, referenced to center of pulse.
+
+        t : numpy array
+            Array with time values for which to calculate the envelope, see
+            `calculate_envelope` for calculating multiple pulses at once.
+
+        Returns
+        -------
+        waveform : numpy array
+            Array containing pulse envelope. Cached data is returned as
+            read-only arrays.
+
+        """
+        if envelope_cache.max_size <= 0 or t.shape[-1] < 2:
+            return self._calculate_baseband(t0, t)
+        t0 = np.asarray(t0, dtype=float)
+        key = (self.envelope_key(), t0.shape, t0.tobytes(), t.shape,
+               t.tobytes())
+        y = envelope_cache.get(key)
+        if y is None:
+            y = self._calculate_baseband(t0, t)
+            envelope_cache.put(key, y, nbytes=y.nbytes + t.nbytes)
+        return y
+
+    def _calculate_baseband(self, t0, t):
+        """Calculate pulse envelope with DRAG corrections, without caching."""
+        y = self.calculate_envelope(t0, t)
+        if self.use_drag:
+            beta = self.drag_coefficient / (t[..., 1:2] - t[..., 0:1])
+            y = y + 1j * beta * np.gradient(y, axis=-1)
+            y = y * np.exp(1j * 2 * np.pi * self.drag_detuning *
+                           (t - t0 + self.total_duration() / 2))
         return y
 
 
@@ -4,6 +4,8 @@ import logging
 
 import numpy as np
 
+import demodulation
+
 log = logging.getLogger('LabberDriver')
 
 
@@ -30,6 +32,10 @@ class Readout(object):
         self.freq_offset = 0.0
         self.use_phase_ref = False
 
+        # last demodulation result, the reference matrix is cached by the
+        # demodulation module
+        self._last_result = None
+
         # self.n_records = 1
 
     def set_parameters(self, config={}):
@@ -61,6 +67,9 @@ class Readout(object):
     def demodulate(self, n, signal, ref=None):
         """Calculate complex signal from data and reference.
 
+        All qubits are demodulated at once, and the result is cached so that
+        subsequent calls for other qubits with the same data are free.
+
         Parameters
         ----------
         n : int
@@ -78,57 +87,14 @@ class Readout(object):
             Complex array matching number of segments in input
 
         """
-        # get parameters
-        frequency = self.frequencies[n] - self.freq_offset
-        n_segment = int(self.n_records)
-        # get input data from dict, with keys {'y': value, 't0': t0, 'dt': dt}
-        if signal is None:
-            return np.zeros(n_segment, dtype=complex)
-        vY = signal['y']
-        dt = signal['dt']
-        # get shape of input data
-        shape = signal.get('shape', vY.shape)
-        # override segment parameter if input data has more than one dimension
-        if len(shape) > 1:
-            n_segment = shape[0]
-        # avoid exceptions if no time step is given
-        if dt == 0:
-            dt = 1.0
-        # get indices for data trimming
-        n0 = int(round(self.demod_skip / dt))
-        n_total = vY.size
-        length = 1 + int(round(self.demod_length / dt))
-        length = min(length, int(n_total / n_segment) - n0)
-        if length <= 1:
-            return np.zeros(n_segment, dtype=complex)
-
-        # define data to use, put in 2d array of segments
-        vData = np.reshape(vY, (n_segment, int(n_total / n_segment)))
-        # calculate cos/sin vectors, allow segmenting
-        vTime = dt * (n0 + np.arange(length, dtype=float))
-        vCos = np.cos(2 * np.pi * vTime * frequency)
-        vSin = np.sin(2 * np.pi * vTime * frequency)
-        # calc I/Q
-        dI = 2 * np.trapz(vCos * vData[:, n0:n0 + length]) / float(length - 1)
-        dQ = 2 * np.trapz(vSin * vData[:, n0:n0 + length]) / float(length - 1)
-        values = dI + 1j * dQ
-        if self.use_phase_ref and ref is not None:
-            # skip reference if trace length doesn't match
-            if len(ref['y']) != len(vY):
-                return values
-            vRef = np.reshape(ref['y'], (n_segment, int(n_total / n_segment)))
-            Iref = (2 * np.trapz(vCos * vRef[:, n0:n0 + length]) /
-                    float(length - 1))
-            Qref = (2 * np.trapz(vSin * vRef[:, n0:n0 + length]) /
-                    float(length - 1))
-            # subtract the reference angle
-            dAngleRef = np.arctan2(Qref, Iref)
-            values /= (np.cos(dAngleRef) + 1j * np.sin(dAngleRef))
-        return values
+        return self.demodulate_all(signal, ref)[n].copy()
 
     def demodulate_iq(self, n, signal_i, signal_q, ref=None):
         """Calculate complex signal from complex data and reference.
 
+        All qubits are demodulated at once, and the result is cached so that
+        subsequent calls for other qubits with the same data are free.
+
         Parameters
         ----------
         n : int
@@ -149,58 +115,145 @@ class Readout(object):
             Complex array matching number of segments in input
 
         """
-        # get parameters
-        frequency = self.frequencies[n] - self.freq_offset
-        n_segment = int(self.n_records)
+        return self.demodulate_iq_all(signal_i, signal_q, ref)[n].copy()
+
+    def demodulate_all(self, signal, ref=None):
+        """Calculate complex signal for all qubits from data and reference.
+
+        Parameters
+        ----------
+        signal : dict
+            Dictionary with signal data
+
+        ref : dict
+            Dictionary with reference data
+
+        Returns
+        -------
+        values : complex numpy array
+            Complex array of shape (max_qubit, n_segment), read-only
+
+        """
         # get input data from dict, with keys {'y': value, 't0': t0, 'dt': dt}
+        if signal is None:
+            return np.zeros((self.max_qubit, int(self.n_records)),
+                            dtype=complex)
+        return self._demodulate(signal['y'], None, signal, ref)
+
+    def demodulate_iq_all(self, signal_i, signal_q, ref=None):
+        """Calculate complex signal for all qubits from complex data.
+
+        Parameters
+        ----------
+        signal_i : dict
+            Dictionary with in-phase signal data
+
+        signal_q : dict
+            Dictionary with qudrature signal data
+
+        ref : dict
+            Dictionary with reference data
+
+        Returns
+        -------
+        values : complex numpy array
+            Complex array of shape (max_qubit, n_segment), read-only
+
+        """
         if signal_i is None or signal_q is None:
-            return np.zeros(n_segment, dtype=complex)
-        vI = signal_i['y']
-        vQ = signal_q['y']
-        if vI.shape != vQ.shape:
+            return np.zeros((self.max_qubit, int(self.n_records)),
+                            dtype=complex)
+        if signal_i['y'].shape != signal_q['y'].shape:
             raise ValueError('I and Q must have the same shape.')
+        return self._demodulate(signal_i['y'], signal_q['y'], signal_i, ref)
+
+    def get_reference(self, dt, n0, length):
+        """Get complex reference matrix for demodulating all qubits.
+
+        The matrix includes the trapezoidal integration weights, and is
+        cached by the demodulation module.
+
+        Parameters
+        ----------
+        dt : float
+            Time step of the data.
+        n0 : int
+            Index of first sample to demodulate.
+        length : int
+            Number of samples to demodulate.
 
+        Returns
+        -------
+        reference : complex numpy array
+            Reference exp(i 2 pi f t) times integration weights, with shape
+            (max_qubit, length), read-only.
+
+        """
+        frequencies = self.frequencies - self.freq_offset
+        return demodulation.get_weights(dt, frequencies, n0, length)
+
+    def _demodulate(self, vI, vQ, signal, ref=None):
+        """Demodulate real or complex data for all qubits.
+
+        Parameters
+        ----------
+        vI : numpy array
+            Real signal, or in-phase signal for IQ demodulation.
+        vQ : numpy array or None
+            Quadrature signal, or None for real demodulation.
+        signal : dict
+            Dictionary with signal data, used for shape and time step.
+        ref : dict
+            Dictionary with reference data
+
+        Returns
+        -------
+        values : complex numpy array
+            Complex array of shape (max_qubit, n_segment)
+
+        """
+        n_segment = int(self.n_records)
         # override segment parameter if input data has more than one dimension
-        shape = signal_i.get('shape', vI.shape)
+        shape = signal.get('shape', vI.shape)
         if len(shape) > 1:
             n_segment = shape[0]
-        dt = signal_i['dt']
+        dt = signal['dt']
         # avoid exceptions if no time step is given
         if dt == 0:
             dt = 1.0
         # get indices for data trimming
-        n0 = int(round(self.demod_skip / dt))
         n_total = vI.size
-        length = 1 + int(round(self.demod_length / dt))
-        length = min(length, int(n_total / n_segment) - n0)
+        n0, length = demodulation.get_window(
+            dt, self.demod_skip, self.demod_length, int(n_total / n_segment))
         if length <= 1:
-            return np.zeros(n_segment, dtype=complex)
+            return np.zeros((self.max_qubit, n_segment), dtype=complex)
+
+        frequencies = self.frequencies - self.freq_offset
+        key = ((tuple(frequencies), dt, n0, length), n_segment)
+        # re-use last result if data and parameters are the same, the data
+        # arrays are kept in the cache so their identity can not be re-used
+        ref_y = ref['y'] if (self.use_phase_ref and ref is not None) else None
+        last = self._last_result
+        if (last is not None and last[0] is vI and last[1] is vQ and
+                last[2] is ref_y and last[3] == key):
+            return last[4]
 
         # define data to use, put in 2d array of segments
-        vData = np.reshape(vI + 1j * vQ, (n_segment, int(n_total / n_segment)))
-        # calculate cos/sin vectors, allow segmenting
-        vTime = dt * (n0 + np.arange(length, dtype=float))
-        vS = np.exp(-2j * np.pi * vTime * frequency)
-
-        # calc I/Q
-        dI = np.trapz((vS * vData[:, n0:n0 + length]).real) / float(length - 1)
-        dQ = -np.trapz((vS * vData[:, n0:n0 + length]
-                        ).imag) / float(length - 1)
-        values = dI + 1j * dQ
-        if self.use_phase_ref and ref is not None:
-            # skip reference if trace length doesn't match
-            if len(ref['y']) != len(vI):
-                return values
-            vRef = np.reshape(ref['y'], (n_segment, int(n_total / n_segment)))
-            vCos = np.cos(2 * np.pi * vTime * frequency)
-            vSin = np.sin(2 * np.pi * vTime * frequency)
-            Iref = (2 * np.trapz(vCos * vRef[:, n0:n0 + length]) /
-                    float(length - 1))
-            Qref = (2 * np.trapz(vSin * vRef[:, n0:n0 + length]) /
-                    float(length - 1))
-            # subtract the reference angle
-            dAngleRef = np.arctan2(Qref, Iref)
-            values /= (np.cos(dAngleRef) + 1j * np.sin(dAngleRef))
+        n_pts = int(n_total / n_segment)
+        vData = np.reshape(vI, (n_segment, n_pts))
+        if vQ is not None:
+            # complex data, the Q sign comes from the demodulation convention
+            vData = vData - 1j * np.reshape(vQ, (n_segment, n_pts))
+        # skip reference if trace length doesn't match
+        vRef = None
+        if ref_y is not None and len(ref_y) == len(vI):
+            vRef = np.reshape(ref_y, (n_segment, n_pts))
+        # calc I/Q for all qubits with one matrix product per block
+        values = demodulation.demodulate(vData, dt, frequencies, n0, length,
+                                         ref=vRef)
+
+        values.flags.writeable = False
+        self._last_result = (vI, vQ, ref_y, key, values)
         return values
 
 
@@ -6,9 +6,11 @@ from enum import Enum
 import numpy as np
 
 from crosstalk import Crosstalk
-from gates import (CompositeGate, CustomGate, Gate, IdentityGate, ReadoutGate,
-                   SingleQubitRotation, TwoQubitGate, VirtualZGate)
-from predistortion import ExponentialPredistortion, Predistortion
+from gates import (BaseGate, CompositeGate, CustomGate, Gate, IdentityGate,
+                   ReadoutGate, SingleQubitRotation, TwoQubitGate,
+                   VirtualZGate)
+from predistortion import (ExponentialPredistortion, Predistortion,
+                           predistort_exponential)
 from pulse import Pulse, PulseShape, PulseType
 from qubits import Qubit, Transmon
 from readout import Readout
@@ -539,6 +541,9 @@ class SequenceToWaveforms:
         self.readout_trig = np.array([], dtype=float)
         self.readout_iq = np.array([], dtype=np.complex)
 
+        # pulse durations, only valid as long as the parameters are unchanged
+        self._durations = dict()
+
     def get_waveforms(self, sequences):
         """Compile the given sequence into waveforms.
 
@@ -553,6 +558,98 @@ class SequenceToWaveforms:
             Description of returned object.
 
         """
+        self._durations = dict()
+        return self._compile(sequences)
+
+    def get_waveforms_batch(self, sequence_list):
+        """Compile multiple sequences into stacked waveforms.
+
+        Pulse durations are calculated once for the whole batch. Waveforms
+        shorter than the longest sequence are padded with zeros at the end,
+        or at the start if the pulses are aligned to the end.
+
+        Parameters
+        ----------
+        sequence_list : list of list of :obj:`Step`
+            The qubit sequences to be compiled.
+
+        Returns
+        -------
+        dict
+            The waveforms, with the same keys as for `get_waveforms`. XY, Z
+            and gate waveforms have shape (n_seq, n_qubit, n_pts), readout
+            waveforms have shape (n_seq, n_pts).
+
+        """
+        self._durations = dict()
+        results = [self._compile(sequences) for sequences in sequence_list]
+        return self._stack_waveforms(results)
+
+    def get_waveforms_sweep(self, sequence, config, name, values):
+        """Compile a sequence for each value of a swept parameter.
+
+        Parameters
+        ----------
+        sequence : :obj:`Sequence`
+            The sequence object generating the steps.
+        config : dict
+            Configuration as defined by Labber driver configuration window.
+        name : str
+            Name of the swept configuration parameter.
+        values : list
+            Values of the swept parameter.
+
+        Returns
+        -------
+        dict
+            The stacked waveforms, see `get_waveforms_batch`.
+
+        """
+        results = []
+        config = dict(config)
+        original = config.get(name)
+        try:
+            for value in values:
+                config[name] = value
+                sequence.set_parameters(config)
+                self.set_parameters(config)
+                results.append(self._compile(sequence.get_sequence(config)))
+        finally:
+            # restore the original configuration
+            config[name] = original
+            sequence.set_parameters(config)
+            self.set_parameters(config)
+        return self._stack_waveforms(results)
+
+    def _stack_waveforms(self, results):
+        """Stack waveforms of multiple sequences, padding to equal length."""
+        n_pts = max(len(waveforms['readout_iq']) for waveforms in results)
+
+        def pad(wave, value=0.0):
+            n_pad = n_pts - wave.shape[-1]
+            if n_pad == 0:
+                return wave
+            padding = np.full(wave.shape[:-1] + (n_pad,), value,
+                              dtype=wave.dtype)
+            if self.align_to_end:
+                return np.concatenate((padding, wave), axis=-1)
+            return np.concatenate((wave, padding), axis=-1)
+
+        readout_offset = self.readout_i_offset + 1j * self.readout_q_offset
+        stacked = dict()
+        for key in ('xy', 'z', 'gate'):
+            stacked[key] = np.array([
+                pad(np.array(waveforms[key][:self.n_qubit]))
+                for waveforms in results])
+        stacked['readout_trig'] = np.array([
+            pad(waveforms['readout_trig']) for waveforms in results])
+        stacked['readout_iq'] = np.array([
+            pad(waveforms['readout_iq'], readout_offset)
+            for waveforms in results])
+        return stacked
+
+    def _compile(self, sequences):
+        """Compile the given sequence into waveforms."""
         self.sequences = sequences
         self._seperate_gates()
 
@@ -583,11 +680,12 @@ class SequenceToWaveforms:
         # Apply offsets
         self.readout_iq += self.readout_i_offset + 1j * self.readout_q_offset
 
-        # create and return dictionary with waveforms
+        # create and return dictionary with waveforms, the lists are copied
+        # since they are re-filled by the next compilation
         waveforms = dict()
-        waveforms['xy'] = self._wave_xy
-        waveforms['z'] = self._wave_z
-        waveforms['gate'] = self._wave_gate
+        waveforms['xy'] = list(self._wave_xy)
+        waveforms['z'] = list(self._wave_z)
+        waveforms['gate'] = list(self._wave_gate)
         waveforms['readout_trig'] = self.readout_trig
         waveforms['readout_iq'] = self.readout_iq
         return waveforms
@@ -628,12 +726,9 @@ class SequenceToWaveforms:
         for step in self.sequences:
             max_duration = -np.inf
             for q, g in enumerate(step.gates):
-                if isinstance(g, IdentityGate) and g.width is not None:
-                    duration = g.width
-                else:
-                    pulse = self._get_pulse_for_gate(q, g)
-                    if pulse is not None:
-                        duration = pulse.total_duration()
+                gate_duration = self._get_duration(q, g)
+                if gate_duration is not None:
+                    duration = gate_duration
                 if duration > max_duration:
                     max_duration = duration
             if step.t0 is None:
@@ -654,6 +749,18 @@ class SequenceToWaveforms:
             for step in self.sequences:
                 step.time_shift(time_diff)
 
+    def _get_duration(self, qubit, gate):
+        """Get the duration of a gate, or None for gates without pulses."""
+        key = (qubit, gate)
+        if key not in self._durations:
+            if isinstance(gate, IdentityGate) and gate.width is not None:
+                duration = gate.width
+            else:
+                pulse = self._get_pulse_for_gate(qubit, gate)
+                duration = (None if pulse is None else pulse.total_duration())
+            self._durations[key] = duration
+        return self._durations[key]
+
     def _get_pulse_for_gate(self, qubit, gate):
         # Virtual Z is special since it has no length
         if isinstance(gate, VirtualZGate):
@@ -691,10 +798,10 @@ class SequenceToWaveforms:
                     self._wave_xy[n])
 
         if self.perform_predistortion_z:
-            # go through and predistort all waveforms
-            for n in range(self.n_qubit):
-                self._wave_z[n] = self._predistortions_z[n].predistort(
-                    self._wave_z[n])
+            # predistort all waveforms, filtering equal channels together
+            n = self.n_qubit
+            self._wave_z[:n] = predistort_exponential(
+                self._predistortions_z[:n], self._wave_z[:n])
 
     def _perform_crosstalk_compensation(self):
         """Compensate for Z-control crosstalk."""
@@ -835,6 +942,8 @@ class SequenceToWaveforms:
 
     def _generate_waveforms(self):
         """Generate the waveforms corresponding to the sequence."""
+        # pulses with equal parameters and length are calculated together
+        groups = dict()
         for step in self.sequences:
             for qubit, gate in enumerate(step.gates):
                 pulse = self._get_pulse_for_gate(qubit, gate)
@@ -854,17 +963,12 @@ class SequenceToWaveforms:
                 start = self._round(step.t_start + delay)
                 middle = self._round(step.t_middle + delay)
                 end = self._round(step.t_end + delay)
-                indices = np.arange(
-                    max(np.floor(start * self.sample_rate), 0),
-                    min(np.ceil(end * self.sample_rate), self.n_pts),
-                    dtype=int
-                )
+                i_start = int(max(np.floor(start * self.sample_rate), 0))
+                i_end = int(min(np.ceil(end * self.sample_rate), self.n_pts))
                 # return directly if no indices
-                if len(indices) == 0:
+                if i_end <= i_start:
                     continue
 
-                # calculate time values for the pulse indices
-                t = indices / self.sample_rate
                 max_duration = end - start
                 if step.align == 'center':
                     t0 = middle
@@ -872,8 +976,29 @@ class SequenceToWaveforms:
                     t0 = middle - (max_duration - pulse.total_duration()) / 2
                 elif step.align == 'right':
                     t0 = middle + (max_duration - pulse.total_duration()) / 2
-                # calculate the pulse waveform for the selected indices
-                waveform[indices] += gate.get_waveform(pulse, t0, t)
+
+                if type(gate).get_waveform is not BaseGate.get_waveform:
+                    # gates with custom waveforms are calculated directly
+                    indices = np.arange(i_start, i_end, dtype=int)
+                    t = indices / self.sample_rate
+                    waveform[indices] += gate.get_waveform(pulse, t0, t)
+                    continue
+                pulse = gate.get_adjusted_pulse(pulse)
+                length = i_end - i_start
+                key = (id(waveform), pulse.parameter_key(), length)
+                if key not in groups:
+                    groups[key] = (waveform, pulse, length, [], [])
+                groups[key][3].append(i_start)
+                groups[key][4].append(t0)
+
+        for (waveform, pulse, length, starts, t0s) in groups.values():
+            # calculate time values for the pulse indices, one row per pulse
+            indices = (np.array(starts, dtype=int)[:, np.newaxis] +
+                       np.arange(length, dtype=int))
+            t = indices / self.sample_rate
+            t0 = np.array(t0s)[:, np.newaxis]
+            # calculate the pulse waveforms for the selected indices
+            np.add.at(waveform, indices, pulse.calculate_waveform(t0, t))
 
     def set_parameters(self, config={}):
         """Set base parameters using config from from Labber driver.
@@ -884,6 +1009,8 @@ class SequenceToWaveforms:
             Configuration as defined by Labber driver configuration window
 
         """
+        # pulse durations may change with the new parameters
+        self._durations = dict()
         # sequence parameters
         d = dict(Zero=0, One=1, Two=2, Three=3, Four=4, Five=5, Six=6, Seven=7,
                  Eight=8, Nine=9)
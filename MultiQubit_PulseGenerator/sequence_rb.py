@@ -4,11 +4,15 @@ import random as rnd
 
 import numpy as np
 
+from clifford import CliffordGroup
 from gates import Gate
 from sequence import Sequence
 
 log = logging.getLogger('LabberDriver')
 
+# Clifford groups are built on first use and shared by all RB sequences
+_clifford_groups = {}
+
 
 def add_singleQ_clifford(index, gate_seq, pad_with_I=True):
     """Add single qubit clifford (24)."""
@@ -277,6 +281,38 @@ def add_SWAP_like_twoQ_clifford(index, gate_seq_1, gate_seq_2, **kwargs):
         pass
 
 
+def _add_singleQ_clifford_unpadded(index, gate_seq):
+    """Add single qubit clifford without padding with I gates."""
+    add_singleQ_clifford(index, gate_seq, pad_with_I=False)
+
+
+def get_clifford_group(n_qubit):
+    """Get the single or two qubit Clifford group.
+
+    The group tables are calculated on the first call and then reused.
+
+    Parameters
+    ----------
+    n_qubit : int
+        Number of qubits, 1 or 2.
+
+    Returns
+    -------
+    :obj:`CliffordGroup`
+        The Clifford group.
+
+    """
+    if n_qubit not in _clifford_groups:
+        if n_qubit == 1:
+            group = CliffordGroup(1, 24, _add_singleQ_clifford_unpadded)
+        elif n_qubit == 2:
+            group = CliffordGroup(2, 11520, add_twoQ_clifford)
+        else:
+            raise ValueError('Clifford groups only defined for 1 or 2 qubits.')
+        _clifford_groups[n_qubit] = group
+    return _clifford_groups[n_qubit]
+
+
 class SingleQubit_RB(Sequence):
     """Single qubit randomized benchmarking."""
 
@@ -374,37 +410,13 @@ class SingleQubit_RB(Sequence):
 
     def get_recovery_gate(self, gate_seq):
         """Get recovery gate."""
-        qubit_state = np.matrix('1; 0')
+        group = get_clifford_group(1)
         # initial state: ground state, following the QC community's convention
-        qubit_state = np.matmul(self.evaluate_sequence(gate_seq), qubit_state)
         # find recovery gate which makes qubit_state return to initial state
-        if (np.abs(np.linalg.norm(qubit_state.item((0, 0))) - 1) < 0.1):
-            # ground state -> I
-            recovery_gate = Gate.I
-        elif (np.abs(np.linalg.norm(qubit_state.item((1, 0))) - 1) < 0.1):
-            # excited state -> X Pi
-            recovery_gate = Gate.Xp
-        elif (np.linalg.norm(qubit_state.item((1, 0)) /
-                             qubit_state.item((0, 0)) + 1) < 0.1):
-            # X State  -> Y +Pi/2
-            recovery_gate = Gate.Y2p
-        elif (np.linalg.norm(qubit_state.item((1, 0)) /
-                             qubit_state.item((0, 0)) - 1) < 0.1):
-            # -X State -> Y -Pi/2
-            recovery_gate = Gate.Y2m
-        elif (np.linalg.norm(qubit_state.item((1, 0)) /
-                             qubit_state.item((0, 0)) + 1j) < 0.1):
-            # Y State -> X -Pi/2
-            recovery_gate = Gate.X2m
-        elif (np.linalg.norm(qubit_state.item((1, 0)) /
-                             qubit_state.item((0, 0)) - 1j) < 0.1):
-            # -Y State -> X +Pi/2
-            recovery_gate = Gate.X2p
-        else:
-            raise InstrumentDriver.Error(
-                'Error in calculating recovery gate. qubit state:' +
-                str(qubit_state))
-        return recovery_gate
+        index = group.recovery(group.index_of_sequence([gate_seq]))
+        (recovery_seq,) = group.get_gates(index)
+        # the shortest recovery of a single qubit state is always one gate
+        return recovery_seq[0]
 
 
 class TwoQubit_RB(Sequence):
@@ -566,31 +578,12 @@ class TwoQubit_RB(Sequence):
 
     def get_recovery_gate(self, gate_seq_1, gate_seq_2):
         """Get recovery 2QB gate."""
-        qubit_state = np.matrix(
-            '1; 0; 0; 0')  # initial state: ground state |00>
-        # initial state: ground state |00>
-        qubit_state = np.matmul(self.evaluate_sequence(
-            gate_seq_1, gate_seq_2), qubit_state)
-
-        # find recovery gate which makes qubit_state return to initial state
-        total_num_cliffords = 11520
-        recovery_seq_1 = []
-        recovery_seq_2 = []
-        # Search recovery gate in two Qubit clifford group
-        for i in range(total_num_cliffords):
-            add_twoQ_clifford(i, recovery_seq_1, recovery_seq_2)
-            qubit_final_state = np.matmul(self.evaluate_sequence(
-                recovery_seq_1, recovery_seq_2), qubit_state)
-            # numerical error threshold: 1e-4
-            if np.abs(np.abs(qubit_final_state[0]) - 1) < 1e-6:
-                break
-            else:
-                recovery_seq_1 = []
-                recovery_seq_2 = []
-
-        if (recovery_seq_1 == [] and recovery_seq_2 == []):
-            recovery_seq_1 = [None]
-            recovery_seq_2 = [None]
+        group = get_clifford_group(2)
+        # find recovery gate which makes qubit_state return to ground state,
+        # look-up in pre-calculated table of the two Qubit clifford group
+        index = group.recovery(
+            group.index_of_sequence([gate_seq_1, gate_seq_2]))
+        (recovery_seq_1, recovery_seq_2) = group.get_gates(index)
         return (recovery_seq_1, recovery_seq_2)
 
 
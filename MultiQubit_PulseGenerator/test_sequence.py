@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Tests for batch and sweep compilation, and the pulse envelope cache.
+
+Run from the driver folder:
+
+    python -m pytest test_sequence.py
+
+"""
+import numpy as np
+
+import pulse
+from benchmark import get_default_config
+from pulse import EnvelopeCache, Pulse, PulseShape, PulseType
+from sequence import SequenceToWaveforms
+from sequence_builtin import CPMG, Rabi
+
+
+def get_rabi_config():
+    config = get_default_config()
+    config['Sequence'] = 'Rabi'
+    config['Number of qubits'] = 'One'
+    return config
+
+
+def test_sweep_gives_one_waveform_per_value():
+    config = get_rabi_config()
+    sequence = Rabi(1)
+    generator = SequenceToWaveforms(1)
+    sequence.set_parameters(config)
+    generator.set_parameters(config)
+    values = [0.1, 0.5, 0.9]
+    waveforms = generator.get_waveforms_sweep(sequence, config,
+                                              'Amplitude #1', values)
+    amplitudes = np.max(np.abs(waveforms['xy'][:, 0]), axis=1)
+    assert np.allclose(amplitudes, values)
+
+
+def test_batch_keeps_each_sequence():
+    config = get_rabi_config()
+    config['Sequence'] = 'CP/CPMG'
+    generator = SequenceToWaveforms(1)
+    generator.set_parameters(config)
+    sequences = []
+    for n_pulse in (0, 2):
+        config['# of pi pulses'] = n_pulse
+        sequence = CPMG(1)
+        sequence.set_parameters(config)
+        sequences.append(sequence.get_sequence(config))
+    waveforms = generator.get_waveforms_batch(sequences)
+    for n, steps in enumerate(sequences):
+        single = generator.get_waveforms(steps)
+        n_pts = len(single['xy'][0])
+        assert np.allclose(waveforms['xy'][n, 0, :n_pts], single['xy'][0])
+    assert not np.allclose(waveforms['xy'][0], waveforms['xy'][1])
+
+
+def get_test_pulses():
+    gaussian = Pulse(PulseShape.GAUSSIAN)
+    gaussian.use_drag = True
+    gaussian.drag_coefficient = 2E-10
+    gaussian.drag_detuning = 1E6
+    cosine = Pulse(PulseShape.COSINE)
+    cosine.plateau = 7E-9
+    ramp = Pulse(PulseShape.RAMP, PulseType.Z)
+    ramp.plateau = 5E-9
+    cz = Pulse(PulseShape.CZ, PulseType.Z)
+    cz.width = 50E-9
+    cz.plateau = 10E-9
+    cz.amplitude = 200E6
+    return [gaussian, cosine, ramp, cz]
+
+
+def calculate_waveforms(pulse_list, max_size):
+    # several pulses at sub-sample offsets, on the time grid of a sequence
+    max_size_old = pulse.envelope_cache.max_size
+    pulse.envelope_cache.max_size = max_size
+    pulse.envelope_cache.clear()
+    try:
+        waveforms = []
+        for p in pulse_list:
+            length = int(np.ceil(p.total_duration() * 1E9)) + 2
+            starts = np.array([3, 17, 40, 101])
+            t = (starts[:, np.newaxis] + np.arange(length)) / 1E9
+            t0 = (starts * 1E-9 + p.total_duration() / 2 +
+                  np.array([0.0, 0.25E-9, 0.5E-9, 0.13E-9]))[:, np.newaxis]
+            # calculate twice, to also get cached values
+            waveforms.append(p.calculate_waveform(t0, t))
+            waveforms.append(p.calculate_waveform(t0, t))
+    finally:
+        pulse.envelope_cache.max_size = max_size_old
+    return waveforms
+
+
+def test_cached_envelopes_are_identical():
+    pulse_list = get_test_pulses()
+    cached = calculate_waveforms(pulse_list, 64 * 2**20)
+    calculated = calculate_waveforms(pulse_list, 0)
+    for (y_cached, y_calculated) in zip(cached, calculated):
+        assert np.array_equal(y_cached, y_calculated)
+
+
+def test_cached_sequence_is_identical():
+    config = get_rabi_config()
+    config['Sequence'] = 'CP/CPMG'
+    config['# of pi pulses'] = 3
+    waveforms = []
+    for (pulse_type, max_size) in [('Ramp', 0), ('Ramp', 2**20),
+                                   ('Cosine', 0), ('Cosine', 2**20)]:
+        config['Pulse type'] = pulse_type
+        sequence = CPMG(1)
+        sequence.set_parameters(config)
+        generator = SequenceToWaveforms(1)
+        generator.set_parameters(config)
+        pulse.envelope_cache.max_size = max_size
+        try:
+            generator.get_waveforms(sequence.get_sequence(config))
+            waveforms.append(
+                generator.get_waveforms(sequence.get_sequence(config)))
+        finally:
+            pulse.envelope_cache.max_size = 64 * 2**20
+    for (calculated, cached) in [waveforms[0:2], waveforms[2:4]]:
+        for key in ('xy', 'z', 'gate'):
+            assert np.array_equal(calculated[key][0], cached[key][0])
+        assert np.array_equal(calculated['readout_iq'], cached['readout_iq'])
+
+
+def test_cache_hits_for_repeated_compilation():
+    config = get_rabi_config()
+    config['Sequence'] = 'CP/CPMG'
+    config['# of pi pulses'] = 4
+    sequence = CPMG(1)
+    sequence.set_parameters(config)
+    generator = SequenceToWaveforms(1)
+    generator.set_parameters(config)
+    pulse.envelope_cache.clear()
+    generator.get_waveforms(sequence.get_sequence(config))
+    misses = pulse.envelope_cache.misses
+    assert misses > 0
+    assert pulse.envelope_cache.hits == 0
+    generator.get_waveforms(sequence.get_sequence(config))
+    assert pulse.envelope_cache.misses == misses
+    assert pulse.envelope_cache.hits == misses
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EnvelopeCache(max_size=3 * 800)
+    for n in range(3):
+        cache.put(n, np.zeros(100))
+    assert cache.get(0) is not None
+    # adding a fourth envelope removes the least recently used one
+    cache.put(3, np.zeros(100))
+    assert len(cache) == 3
+    assert cache.size == 3 * 800
+    assert cache.get(1) is None
+    assert all(cache.get(n) is not None for n in (0, 2, 3))
+    assert (cache.hits, cache.misses) == (4, 1)
+    # envelopes larger than the cache are not stored
+    cache.put(4, np.zeros(1000))
+    assert cache.get(4) is None
+    assert len(cache) == 3
+    cache.clear()
+    assert (len(cache), cache.size, cache.hits, cache.misses) == (0, 0, 0, 0)
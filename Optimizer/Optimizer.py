@@ -1,16 +1,21 @@
 #!/usr/bin/env python
 import InstrumentDriver
 import numpy as np
-import copy
+from optimizers import NelderMead, GaussianProcess
 
 class Driver(InstrumentDriver.InstrumentWorker):
-    """ This class implements a Nelder-Mead optimization driver"""
+    """ This class implements a Nelder-Mead or Gaussian-process optimization
+    driver"""
 
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
         self.x = []
         self.cost = 0
-        self.step = 'None'
+        self.batch_cost = []
+        self.optimizer = None
+        # candidates of the current optimizer step, and their costs
+        self.candidates = np.zeros((0, 0))
+        self.scores = []
         self.i = -1
 
 
@@ -25,148 +30,125 @@ class Driver(InstrumentDriver.InstrumentWorker):
 
         if quant.name == 'Cost':
             self.cost += value
+        elif quant.name == 'Batch cost':
+            self.batch_cost = np.array(value['y'] if isinstance(value, dict)
+                                       else value, dtype=float).ravel()
         return value
 
 
     def performGetValue(self, quant, options={}):
         """Perform the Get Value instrument operation"""
-        if quant.name.startswith('Parameter'):
-            n = int(quant.name.split('#')[1]) - 1
+        if quant.name.startswith('Parameter') or \
+                quant.name.startswith('Batch parameter') or \
+                quant.name == 'Batch size':
             if int(self.getValue('Iteration')) != self.i:
-                self.nelder_mead()
+                self.next_iteration()
                 self.cost = 0
-            value = self.x[n]
+            if quant.name.startswith('Parameter'):
+                n = int(quant.name.split('#')[1]) - 1
+                value = self.x[n]
+            elif quant.name == 'Batch size':
+                value = len(self.candidates)
+            else:
+                n = int(quant.name.split('#')[1]) - 1
+                vx = self.candidates[:, n] if n < self.candidates.shape[1] \
+                    else np.zeros(len(self.candidates))
+                value = quant.getTraceDict(vx, x0=0, dx=1)
 
+        elif quant.name.startswith('Best parameter'):
+            n = int(quant.name.split('#')[1]) - 1
+            x = [] if self.optimizer is None else self.optimizer.best[0]
+            value = x[n] if n < len(x) else 0.0
+        elif quant.name == 'Best cost':
+            score = None if self.optimizer is None else self.optimizer.best[1]
+            value = 0.0 if score is None else self.cost_function(score)
         elif quant.name == 'Cost':
             value = self.cost
+        elif quant.name == 'Batch cost':
+            value = quant.getTraceDict(self.batch_cost, x0=0, dx=1)
         else:
             # just return the quantity value
             value = quant.getValue()
         return value
 
-    def cost_function(self):
+    def cost_function(self, cost=None):
+        if cost is None:
+            cost = self.cost
         if self.getValue('Maximize'):
-            return -self.cost
+            return -cost
         else:
-            return self.cost
+            return cost
+
+
+    def create_optimizer(self, batch):
+        n_parameters = int(self.getValue('Number of parameters'))
+        x_start = []
+        x_step = []
+        x_range = []
+        for i in range(n_parameters):
+            x_start.append(self.getValue('Start value parameter #{}'.format(i+1)))
+            x_step.append(self.getValue('Step size parameter #{}'.format(i+1)))
+            x_range.append(self.getValue('Range parameter #{}'.format(i+1)))
+        name = self.getValue('Optimizer')
+        if name == 'Nelder-Mead':
+            return NelderMead(x_start, x_step, speculative=batch,
+                              gamma=self.getValue('Expansion coefficient'),
+                              rho=self.getValue('Contraction coefficient'),
+                              sigma=self.getValue('Shrink coefficient'))
+        elif name == 'Gaussian process':
+            n_initial = int(self.getValue('Initial points'))
+            return GaussianProcess(
+                x_start, x_range,
+                n_initial=n_initial if n_initial > 0 else None,
+                batch_size=int(self.getValue('Candidates per batch')) if batch
+                else 1,
+                xi=self.getValue('Exploration'))
+        else:
+            raise ValueError('Unknown optimizer: {}'.format(name))
 
 
-    def nelder_mead(self):
+    def next_iteration(self):
         '''
-        Reference: https://en.wikipedia.org/wiki/Nelder%E2%80%93Mead_method
+        Advance the optimizer by one iteration.
+
+        In serial mode one candidate is evaluated per iteration, and the
+        optimizer is updated once all candidates of its step have a cost. In
+        batch mode all candidates of a step are evaluated in one iteration,
+        and the costs are set as a vector to 'Batch cost'.
         '''
         self.i = int(self.getValue('Iteration'))
-        gamma = 2.
-        rho = 0.5
-        sigma = 0.5
+        batch = self.getValue('Batch mode')
 
         if self.i == 0:
-            self.n_parameters = int(self.getValue('Number of parameters'))
-            # init
-            self.x_start = []
-            self.x_step = []
-            for i in range(self.n_parameters):
-                self.x_start.append(self.getValue('Start value parameter #{}'.format(i+1)))
-                self.x_step.append(self.getValue('Step size parameter #{}'.format(i+1)))
-            self.x_start = np.array(self.x_start)
-            self.x = self.x_start
-
-        elif self.i == 1:
-            self.prev_best = self.cost_function()
-            self.res = [[self.x_start, self.prev_best]]
-
-            x = copy.copy(self.x_start)
-            self.k = 0
-            x[self.k] = x[self.k] + self.x_step[self.k]
-            self.log('start ', x)
-            self.x = x
-
-        elif self.i in (np.arange(self.n_parameters) + 1):
-            self.score = self.cost_function()
-            self.res.append([self.x, self.score])
-            self.k += 1
-            x = copy.copy(self.x_start)
-            x[self.k] = x[self.k] + self.x_step[self.k]
-            self.log('start ', x)
-            self.x = x
-
-        elif self.i == self.n_parameters + 1:
-            self.score = self.cost_function()
-            self.res.append([self.x, self.score])
-            self.start()
+            self.optimizer = self.create_optimizer(batch)
+            self.candidates = self.optimizer.ask()
+            self.scores = []
+            self.batch_cost = []
+
+        elif batch:
+            if len(self.batch_cost) != len(self.candidates):
+                raise ValueError(
+                    'Batch cost has %d elements, expected %d' %
+                    (len(self.batch_cost), len(self.candidates)))
+            self.optimizer.tell(self.cost_function(self.batch_cost))
+            self.batch_cost = []
+            self.candidates = self.optimizer.ask()
+            self.log('{} {}'.format(self.optimizer.step, self.candidates))
 
         else:
-            if self.step == 'reflection':
-                self.rscore = self.cost_function()
-                if self.res[0][1] <= self.rscore < self.res[-2][1]:
-                    del self.res[-1]
-                    self.res.append([self.xr, self.rscore])
-                    self.start()
-
-                elif self.rscore < self.res[0][1]:
-                        self.xe = self.x0 + gamma*(self.xr - self.x0)
-                        self.x = self.xe
-                        self.step = 'expansion'
-
-                else:
-                    self.xc = self.x0 + rho*(self.res[-1][0] - self.x0)
-                    self.x = self.xc
-                    self.step = 'contraction'
-
-            elif self.step == 'expansion':
-                    self.escore = self.cost_function()
-                    if self.escore < self.rscore:
-                        del self.res[-1]
-                        self.res.append([self.xe, self.escore])
-                        self.start()
-                    else:
-                        del self.res[-1]
-                        self.res.append([self.xr, self.rscore])
-                        self.start()
-
-            elif self.step == 'contraction':
-                self.cscore = self.cost_function()
-                if self.cscore < self.res[-1][1]:
-                    del self.res[-1]
-                    self.res.append([self.xc, self.cscore])
-                    self.start()
-
-                else:
-                    self.x1 = self.res[0][0]
-                    self.step = 'reduction'
-                    self.nres = []
-                    self.j = 0
-                    self.redx = self.x1 + sigma*(self.res[self.j][0] - self.x1)
-                    self.x = self.redx
-
-            elif self.step == 'reduction':
-                    self.score = self.cost_function()
-                    self.nres.append([self.redx, self.score])
-                    self.j += 1
-                    if self.j < len(self.res):
-                        self.redx = self.x1 + sigma*(self.res[self.j][0] - self.x1)
-                        self.x = self.redx
-                    else:
-                        self.res = self.nres
-                        self.start()
-            else:
-                raise ValueError('Should never happen')
-
-    def start(self):
-        alpha = 1
-        # order
-        self.res.sort(key=lambda x: x[1])
-
-        # centroid
-        self.x0 = [0.] * self.n_parameters
-        for tup in self.res[:-1]:
-            for i, c in enumerate(tup[0]):
-                self.x0[i] += c / (len(self.res)-1)
-
-        self.xr = self.x0 + alpha*(self.x0 - self.res[-1][0])
-
-        self.x = self.xr
-        self.step = 'reflection'
+            self.scores.append(self.cost_function())
+            if len(self.scores) == len(self.candidates):
+                self.optimizer.tell(self.scores)
+                self.candidates = self.optimizer.ask()
+                self.scores = []
+            self.log('{} {}'.format(self.optimizer.step,
+                                    self.candidates[len(self.scores)]))
+
+        if batch:
+            # best point so far
+            self.x = self.optimizer.best[0]
+        else:
+            self.x = self.candidates[len(self.scores)]
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Benchmark the optimizer backends against synthetic noisy cost functions.
+
+Run from the driver folder:
+
+    python benchmark.py
+
+"""
+import time
+
+import numpy as np
+
+from optimizers import NelderMead, GaussianProcess
+
+
+def quadratic(x):
+    # anisotropic quadratic, minimum 0 at x = 0.3
+    w = np.arange(1, len(x) + 1)
+    return np.sum(w*(np.asarray(x) - 0.3)**2)
+
+
+def rosenbrock(x):
+    # curved valley, minimum 0 at x = 1
+    x = np.asarray(x)
+    return np.sum(100*(x[1:] - x[:-1]**2)**2 + (1 - x[:-1])**2)
+
+
+def fidelity(x):
+    # qubit-style cost 1 - F, saturates far from the optimum at x = 0.2
+    return 1 - np.exp(-np.sum((np.asarray(x) - 0.2)**2/0.5))
+
+
+def create_optimizer(name, n_parameters, batch_size, seed):
+    # both start at 0, NM step 0.1 and GP search range +-1
+    x_start = np.zeros(n_parameters)
+    if name == 'Nelder-Mead':
+        return NelderMead(x_start, 0.1*np.ones(n_parameters),
+                          speculative=batch_size > 1)
+    else:
+        return GaussianProcess(x_start, np.ones(n_parameters),
+                               batch_size=batch_size, seed=seed)
+
+
+def run_optimizer(name, cost, n_parameters, noise, n_eval, batch_size=1,
+                  seed=0):
+    # true cost of the recommended point after a budget of n_eval evaluations
+    rng = np.random.RandomState(seed)
+    optimizer = create_optimizer(name, n_parameters, batch_size, seed)
+    n = 0
+    while n < n_eval:
+        candidates = optimizer.ask()
+        optimizer.tell([cost(x) + noise*rng.normal() for x in candidates])
+        n += len(candidates)
+    return cost(optimizer.best[0])
+
+
+if __name__ == '__main__':
+    n_seed = 5
+    for (cost, n_parameters, noise, n_eval) in [(quadratic, 2, 0.01, 30),
+                                                (quadratic, 4, 0.01, 60),
+                                                (rosenbrock, 2, 0.1, 60),
+                                                (fidelity, 3, 0.02, 40)]:
+        for batch_size in (1, 4):
+            lResult = []
+            for name in ('Nelder-Mead', 'Gaussian process'):
+                start_time = time.time()
+                vCost = [run_optimizer(name, cost, n_parameters, noise, n_eval,
+                                       batch_size, seed)
+                         for seed in range(n_seed)]
+                lResult += [np.median(vCost),
+                            (time.time() - start_time)/n_seed]
+            print('%-10s N=%d, noise %.2f, %3d evaluations, batch %d: ' % (
+                  cost.__name__, n_parameters, noise, n_eval, batch_size) +
+                  'Nelder-Mead %.2e (%.2f s), Gaussian process %.2e (%.2f s)'
+                  % tuple(lResult))
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+import numpy as np
+from scipy.linalg import solve_triangular
+from scipy.special import ndtr
+
+
+class NelderMead(object):
+    """Nelder-Mead simplex minimizer with an ask/tell interface.
+
+    Reference: https://en.wikipedia.org/wiki/Nelder%E2%80%93Mead_method
+
+    `ask` returns the candidates of the current step as an array of shape
+    (n_candidates, n_parameters), `tell` takes the costs of all of them.
+    The initial simplex and the shrink points are always proposed as one
+    batch. With `speculative` the reflection, expansion and contraction
+    candidates are proposed together as well, so that every step of the
+    simplex takes a single batch of evaluations.
+    """
+
+    def __init__(self, x_start, x_step, speculative=False,
+                 alpha=1., gamma=2., rho=0.5, sigma=0.5):
+        self.x_start = np.array(x_start, dtype=float)
+        self.x_step = np.array(x_step, dtype=float)
+        self.n_parameters = len(self.x_start)
+        self.speculative = speculative
+        self.alpha = alpha
+        self.gamma = gamma
+        self.rho = rho
+        self.sigma = sigma
+        # evaluated simplex vertices, list of [x, score]
+        self.res = []
+        # init, start point and one step along each parameter
+        self.step = 'init'
+        self.candidates = np.tile(self.x_start, (self.n_parameters + 1, 1))
+        for k in range(self.n_parameters):
+            self.candidates[k + 1, k] += self.x_step[k]
+
+    def ask(self):
+        """Return the candidates to evaluate next"""
+        return self.candidates.copy()
+
+    def tell(self, scores):
+        """Update the simplex with the costs of the candidates from `ask`"""
+        scores = [float(s) for s in scores]
+        if len(scores) != len(self.candidates):
+            raise ValueError('Expected %d costs, got %d' %
+                             (len(self.candidates), len(scores)))
+
+        if self.step == 'init':
+            self.res = [[x, s] for x, s in zip(self.candidates, scores)]
+            self.start()
+
+        elif self.step == 'reflection':
+            self.rscore = scores[0]
+            if self.res[0][1] <= self.rscore < self.res[-2][1]:
+                self.replace_worst(self.xr, self.rscore)
+            elif self.rscore < self.res[0][1]:
+                self.propose('expansion', [self.xe])
+            else:
+                self.propose('contraction', [self.xc])
+
+        elif self.step == 'expansion':
+            if scores[0] < self.rscore:
+                self.replace_worst(self.xe, scores[0])
+            else:
+                self.replace_worst(self.xr, self.rscore)
+
+        elif self.step == 'contraction':
+            if scores[0] < self.res[-1][1]:
+                self.replace_worst(self.xc, scores[0])
+            else:
+                self.shrink()
+
+        elif self.step == 'speculative':
+            (self.rscore, escore, cscore) = scores
+            if self.res[0][1] <= self.rscore < self.res[-2][1]:
+                self.replace_worst(self.xr, self.rscore)
+            elif self.rscore < self.res[0][1]:
+                if escore < self.rscore:
+                    self.replace_worst(self.xe, escore)
+                else:
+                    self.replace_worst(self.xr, self.rscore)
+            elif cscore < self.res[-1][1]:
+                self.replace_worst(self.xc, cscore)
+            else:
+                self.shrink()
+
+        elif self.step == 'reduction':
+            # the best vertex is kept, with its score
+            self.res = self.res[:1] + [[x, s] for x, s in
+                                       zip(self.candidates, scores)]
+            self.start()
+        else:
+            raise ValueError('Should never happen')
+
+    @property
+    def best(self):
+        """Best evaluated point and its cost, or (x_start, None)"""
+        if len(self.res) == 0:
+            return (self.x_start, None)
+        best = min(self.res, key=lambda x: x[1])
+        return (best[0], best[1])
+
+    def propose(self, step, candidates):
+        self.step = step
+        self.candidates = np.array(candidates, dtype=float)
+
+    def replace_worst(self, x, score):
+        del self.res[-1]
+        self.res.append([x, score])
+        self.start()
+
+    def shrink(self):
+        # move all vertices but the best towards the best one
+        x1 = self.res[0][0]
+        self.propose('reduction', [x1 + self.sigma*(tup[0] - x1)
+                                   for tup in self.res[1:]])
+
+    def start(self):
+        # order
+        self.res.sort(key=lambda x: x[1])
+        # centroid, and candidates of the next step
+        self.x0 = np.mean([tup[0] for tup in self.res[:-1]], axis=0)
+        self.xr = self.x0 + self.alpha*(self.x0 - self.res[-1][0])
+        self.xe = self.x0 + self.gamma*(self.xr - self.x0)
+        self.xc = self.x0 + self.rho*(self.res[-1][0] - self.x0)
+        if self.speculative:
+            self.propose('speculative', [self.xr, self.xe, self.xc])
+        else:
+            self.propose('reflection', [self.xr])
+
+
+class GaussianProcess(object):
+    """Surrogate-model minimizer, Gaussian-process regression of the cost.
+
+    Every evaluated point is kept. The cost is modelled by a Gaussian process
+    with a Matern 5/2 kernel and a noise term, with hyperparameters chosen by
+    maximum marginal likelihood, and the next point is the maximum of the
+    expected improvement. The search is bounded to `x_start` +- `x_range`.
+    The first `n_initial` points are the start point and a Latin hypercube.
+    With `batch_size` > 1 each step proposes several points, the model is
+    updated with its own prediction after each proposed point.
+    """
+
+    length_scales = np.logspace(-1.3, 0.5, 10)
+    noise_levels = np.array([1E-6, 1E-3, 1E-2, 0.05, 0.2, 0.5])
+
+    def __init__(self, x_start, x_range, n_initial=None, batch_size=1,
+                 xi=0.01, n_random=2000, seed=None):
+        self.x_start = np.array(x_start, dtype=float)
+        self.x_range = np.abs(np.array(x_range, dtype=float))
+        self.x_range[self.x_range == 0] = 1.
+        self.n_parameters = len(self.x_start)
+        if n_initial is None:
+            n_initial = 2*self.n_parameters + 1
+        self.n_initial = max(1, int(n_initial))
+        self.batch_size = max(1, int(batch_size))
+        self.xi = xi
+        self.n_random = n_random
+        self.rng = np.random.RandomState(seed)
+        # evaluation history, scaled to [-1, 1]
+        self.u = np.zeros((0, self.n_parameters))
+        self.y = np.zeros(0)
+        # start point and Latin hypercube
+        self.u_initial = np.zeros((self.n_initial, self.n_parameters))
+        n = self.n_initial - 1
+        for k in range(self.n_parameters):
+            self.u_initial[1:, k] = 2*(self.rng.permutation(n) +
+                                       self.rng.uniform(size=n))/max(n, 1) - 1
+        self.model = None
+        self.update()
+
+    def ask(self):
+        """Return the candidates to evaluate next"""
+        return self.candidates.copy()
+
+    def tell(self, scores):
+        """Add the costs of the candidates from `ask` to the history"""
+        scores = np.array(scores, dtype=float).ravel()
+        if len(scores) != len(self.candidates):
+            raise ValueError('Expected %d costs, got %d' %
+                             (len(self.candidates), len(scores)))
+        self.u = np.vstack((self.u, self.to_unit(self.candidates)))
+        self.y = np.concatenate((self.y, scores))
+        self.update()
+
+    @property
+    def best(self):
+        """Evaluated point with the lowest modelled cost, and that cost
+
+        Before the model is fitted, the lowest measured cost is used.
+        """
+        if len(self.y) == 0:
+            return (self.x_start, None)
+        if self.model is None:
+            n = np.argmin(self.y)
+            return (self.from_unit(self.u[n]), self.y[n])
+        mean = self.predict(self.model, self.u)[0]
+        n = np.argmin(mean)
+        return (self.from_unit(self.u[n]), mean[n])
+
+    def to_unit(self, x):
+        return (np.asarray(x, dtype=float) - self.x_start)/self.x_range
+
+    def from_unit(self, u):
+        return self.x_start + np.asarray(u)*self.x_range
+
+    def update(self):
+        # candidates of the next step, from the initial design or the model
+        n = len(self.y)
+        if n < self.n_initial:
+            self.step = 'initial'
+            u_next = self.u_initial[n:n + self.batch_size]
+        else:
+            self.step = 'acquisition'
+            self.model = self.fit(self.u, self.y)
+            u_next = []
+            model = self.model
+            for j in range(self.batch_size):
+                u_next.append(self.maximize_acquisition(model))
+                if j < self.batch_size - 1:
+                    # assume the model prediction for the proposed point
+                    u = np.vstack((self.u, u_next))
+                    y_pred = self.predict(model, np.array(u_next))[0]
+                    y = np.concatenate((self.y, y_pred))
+                    model = self.fit(u, y, model['length'], model['noise'])
+        self.candidates = self.from_unit(np.array(u_next))
+
+    @staticmethod
+    def kernel(u1, u2, length):
+        # Matern 5/2 kernel, unit variance
+        d = np.sqrt(np.sum((u1[:, np.newaxis, :] - u2[np.newaxis, :, :])**2,
+                           axis=-1))*np.sqrt(5.)/length
+        return (1 + d + d**2/3.)*np.exp(-d)
+
+    def fit(self, u, y, length=None, noise=None):
+        # normalized GP model, hyperparameters by max. marginal likelihood
+        y_mean = np.mean(y)
+        y_std = np.std(y)
+        if y_std == 0:
+            y_std = 1.
+        yn = (y - y_mean)/y_std
+        lengths = self.length_scales if length is None else [length]
+        noises = self.noise_levels if noise is None else [noise]
+        model = None
+        for length in lengths:
+            K0 = self.kernel(u, u, length)
+            for noise in noises:
+                try:
+                    L = np.linalg.cholesky(K0 + noise*np.eye(len(u)))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = solve_triangular(
+                    L.T, solve_triangular(L, yn, lower=True), lower=False)
+                log_lik = -0.5*np.dot(yn, alpha) - np.sum(np.log(np.diag(L)))
+                if model is None or log_lik > model['log_lik']:
+                    model = dict(u=u, L=L, alpha=alpha, length=length,
+                                 noise=noise, log_lik=log_lik,
+                                 y_mean=y_mean, y_std=y_std)
+        if model is None:
+            # ill-conditioned kernel, add more noise until it factorizes
+            if max(noises) >= 1.:
+                raise ValueError('Gaussian process kernel is not positive '
+                                 'definite, even with noise level %g' %
+                                 max(noises))
+            return self.fit(u, y, min(lengths), min(10*max(noises), 1.))
+        return model
+
+    def predict(self, model, u):
+        # posterior mean and standard deviation of the cost
+        Ks = self.kernel(u, model['u'], model['length'])
+        mean = np.dot(Ks, model['alpha'])
+        v = solve_triangular(model['L'], Ks.T, lower=True)
+        var = np.maximum(1. - np.sum(v**2, axis=0), 1E-12)
+        return (model['y_mean'] + model['y_std']*mean,
+                model['y_std']*np.sqrt(var))
+
+    def expected_improvement(self, model, u):
+        mean, std = self.predict(model, u)
+        # noisy costs, compare to the best modelled cost of the history
+        y_best = np.min(self.predict(model, model['u'])[0])
+        imp = y_best - mean - self.xi*model['y_std']
+        z = imp/std
+        return imp*ndtr(z) + std*np.exp(-0.5*z**2)/np.sqrt(2*np.pi)
+
+    def maximize_acquisition(self, model):
+        # random points in the box, and around the best points so far
+        u_rand = self.rng.uniform(-1, 1, (self.n_random, self.n_parameters))
+        mean = self.predict(model, model['u'])[0]
+        u_best = model['u'][np.argsort(mean)[:5]]
+        u_local = (np.repeat(u_best, self.n_random // 10, axis=0) +
+                   self.rng.normal(scale=0.2*model['length'],
+                                   size=(len(u_best)*(self.n_random // 10),
+                                         self.n_parameters)))
+        u = np.clip(np.vstack((u_rand, u_local)), -1, 1)
+        return u[np.argmax(self.expected_improvement(model, u))]
+
+
+if __name__ == '__main__':
+    pass
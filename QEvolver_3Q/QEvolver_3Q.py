@@ -107,7 +107,10 @@ class Driver(InstrumentDriver.InstrumentWorker):
 				self.SIM.generateTraceRho()
 			log.info('Density')
 		else:
-			self.SIM.psiEvolver_3Q()
+			if CONFIG.get('Closed-System Engine') == 'Propagator':
+				self.SIM.propagatorEvolver_3Q()
+			else:
+				self.SIM.psiEvolver_3Q()
 			self.SIM.generateFinalPsi()
 			if self.bShowTrace:
 				self.SIM.generateTracePsi()
@@ -59,21 +59,21 @@ def add_rise(t, pulseCfg):
 	return (gen_fall(-t/pulseCfg.Rise, pulseCfg) - gen_fall(1, pulseCfg)) / (gen_fall(0, pulseCfg) - gen_fall(1, pulseCfg))
 
 def add_pulse(t, pulseCfg):
-	# add single pulse
+	# add single pulse, t is a single time or an array of times
 	pulseCfg.Start = pulseCfg.PlateauStart - pulseCfg.Rise
 	pulseCfg.PlateauEnd = pulseCfg.PlateauStart + pulseCfg.Plateau
 	pulseCfg.End = pulseCfg.PlateauEnd + pulseCfg.Fall
-	if t < pulseCfg.Start:
-		y = 0
-	elif pulseCfg.Start <= t < pulseCfg.PlateauStart:
-		y = add_rise(t - pulseCfg.PlateauStart, pulseCfg)
-	elif pulseCfg.PlateauStart <= t < pulseCfg.PlateauEnd:
-		y = 1
-	elif pulseCfg.PlateauEnd <= t < pulseCfg.End:
-		y = add_fall(t - pulseCfg.PlateauEnd, pulseCfg)
-	elif t >= pulseCfg.End:
-		y = 0
-	return y * pulseCfg.Amplitude * np.cos(2 * np.pi * pulseCfg.Frequency * t + pulseCfg.Phase)
+	vTime = np.atleast_1d(np.asarray(t, dtype=float))
+	y = np.zeros(vTime.shape)
+	bRise = (pulseCfg.Start <= vTime) & (vTime < pulseCfg.PlateauStart)
+	if np.any(bRise):
+		y[bRise] = add_rise(vTime[bRise] - pulseCfg.PlateauStart, pulseCfg)
+	y[(pulseCfg.PlateauStart <= vTime) & (vTime < pulseCfg.PlateauEnd)] = 1
+	bFall = (pulseCfg.PlateauEnd <= vTime) & (vTime < pulseCfg.End)
+	if np.any(bFall):
+		y[bFall] = add_fall(vTime[bFall] - pulseCfg.PlateauEnd, pulseCfg)
+	y = y * pulseCfg.Amplitude * np.cos(2 * np.pi * pulseCfg.Frequency * vTime + pulseCfg.Phase)
+	return y if np.ndim(t) > 0 else y[0]
 
 def add_sequence(t, seqCfg):
 	# add a sequence
@@ -116,4 +116,27 @@ def	timeFunc_g23_pp(t,args=None):
 	return 0.5 * args.capCfg.r23 * np.sqrt(timeFunc_Q2_Frequency(t,args) * timeFunc_Q3_Frequency(t,args))
 
 def	timeFunc_g13_pp(t,args=None):
-	return 0.5 * args.capCfg.r13 * np.sqrt(timeFunc_Q1_Frequency(t,args) * timeFunc_Q3_Frequency(t,args))
\ No newline at end of file
+	return 0.5 * args.capCfg.r13 * np.sqrt(timeFunc_Q1_Frequency(t,args) * timeFunc_Q3_Frequency(t,args))
+
+List_sTimeSeries = ['Q1_Frequency', 'Q1_Anharmonicity', 'Q1_DriveP',
+					'Q2_Frequency', 'Q2_Anharmonicity', 'Q2_DriveP',
+					'Q3_Frequency', 'Q3_Anharmonicity', 'Q3_DriveP',
+					'g12_pp', 'g23_pp', 'g13_pp']
+
+def generateTimeSeries(tlist, args):
+	# evaluate all control channels on the time array tlist in one pass, same
+	# values as the timeFunc_* functions. Returns a dict keyed by channel name
+	tlist = np.asarray(tlist, dtype=float)
+	dict_TimeSeries = {}
+	for sQubit in ['Q1', 'Q2', 'Q3']:
+		qubitCfg = getattr(args, 'qubitCfg_' + sQubit)
+		for sSeqType in ['Frequency', 'Anharmonicity', 'DriveP']:
+			sName = sQubit + '_' + sSeqType
+			y = add_sequence(tlist, getattr(args, 'seqCfg_' + sName))
+			if sSeqType != 'DriveP':
+				y = y + getattr(qubitCfg, sSeqType)
+			dict_TimeSeries[sName] = y + np.zeros(tlist.shape)
+	for (s1, s2) in [('1', '2'), ('2', '3'), ('1', '3')]:
+		r = getattr(args.capCfg, 'r' + s1 + s2)
+		dict_TimeSeries['g' + s1 + s2 + '_pp'] = 0.5 * r * np.sqrt(dict_TimeSeries['Q' + s1 + '_Frequency'] * dict_TimeSeries['Q' + s2 + '_Frequency'])
+	return dict_TimeSeries
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the closed-system engines of QEvolver_3Q, mesolve and the
+piecewise-constant propagator. Run from the driver folder:
+
+	python benchmark.py
+
+"""
+
+import configparser
+import os
+import time
+
+import numpy as np
+from simulation import *
+from sequence import *
+
+
+def getDefaultConfig():
+	# driver configuration with the default values of the ini file
+	sPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'QEvolver_3Q.ini')
+	parser = configparser.ConfigParser(strict=False, interpolation=None)
+	parser.optionxform = str
+	parser.read(sPath)
+	CONFIG = {}
+	for sName in parser.sections():
+		section = parser[sName]
+		if 'datatype' not in section:
+			continue
+		sType = section['datatype'].strip().upper()
+		value = section.get('def_value')
+		if sType == 'DOUBLE':
+			CONFIG[sName] = 0.0 if value is None else float(value)
+		elif sType == 'BOOLEAN':
+			CONFIG[sName] = value is not None and value.strip() in ('1', 'True')
+		elif sType == 'COMBO':
+			CONFIG[sName] = (value or section.get('combo_def_1', '')).strip()
+		else:
+			CONFIG[sName] = value
+	return CONFIG
+
+
+def addPulse(CONFIG, sSeq, **kwargs):
+	# add a pulse to the sequence sSeq, e.g. 'Q1 DriveP'
+	sSeqName = 'Seq ' + sSeq + ': '
+	nPulse = int(CONFIG[sSeqName + 'Pulse Number']) + 1
+	CONFIG[sSeqName + 'Pulse Number'] = nPulse
+	for key, value in kwargs.items():
+		CONFIG[sSeqName + key + ' #%d' % nPulse] = value
+
+
+def benchmarkEngines(CONFIG):
+	# run both engines, return run times and max. deviation of the states
+	SEQ = sequence(CONFIG)
+	SEQ.generateSeqDisplay()
+	SIM = simulation_3Q(CONFIG)
+	SIM.updateSequence(SEQ)
+	SIM.generateHamiltonian_3Q_cap()
+	SIM.generateInitialState()
+	lTime = []
+	lState = []
+	for method in [SIM.psiEvolver_3Q, SIM.propagatorEvolver_3Q]:
+		dStart = time.time()
+		method()
+		lTime.append(time.time() - dStart)
+		lState.append(np.array([psi.full()[:,0] for psi in SIM.result_psi.states]))
+	return lTime[0], lTime[1], np.max(np.abs(lState[1] - lState[0]))
+
+
+if __name__ == '__main__':
+	dict_Case = {}
+	# resonant Gaussian drive on Q1
+	CONFIG = getDefaultConfig()
+	addPulse(CONFIG, 'Q1 DriveP', Shape='GAUSS', PlateauStart=20E-9, Rise=8E-9, Plateau=10E-9, Fall=8E-9,
+		Amplitude=20E6, Frequency=CONFIG['Q1 Frequency'], Phase=0.0)
+	dict_Case['Drive'] = CONFIG
+	# flux pulse on Q2
+	CONFIG = getDefaultConfig()
+	addPulse(CONFIG, 'Q2 Frequency', Shape='COS', PlateauStart=20E-9, Rise=5E-9, Plateau=50E-9, Fall=5E-9,
+		Amplitude=-300E6, Frequency=0.0, Phase=0.0)
+	dict_Case['Flux'] = CONFIG
+	for key, CONFIG in dict_Case.items():
+		for nTrunc in [3, 4]:
+			CONFIG['Degree of Trunction'] = nTrunc
+			dMesolve, dPropagator, dError = benchmarkEngines(CONFIG)
+			print('%s, nTrunc=%d: mesolve %.2f s, propagator %.2f s, max. deviation %.1e' % (key, nTrunc, dMesolve, dPropagator, dError))
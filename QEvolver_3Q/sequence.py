@@ -15,6 +15,11 @@ List_sCapParam = ['C1', 'C2', 'C3', 'C12', 'C23', 'C13']
 List_sSeqType = ['Frequency', 'Anharmonicity', 'DriveP']
 List_sPulseParam = ['Shape', 'PlateauStart', 'Rise', 'Plateau', 'Fall', 'Stretch', 'Amplitude', 'Frequency', 'Phase', 'DragCoeff']
 
+# min. number of coefficient samples per pulse oscillation period and per rise/fall,
+# the solver interpolates the control channels between samples
+nCoeffPerPeriod = 40
+nCoeffPerEdge = 20
+
 # dict_Seq = {'Time Series: Q1 Frequency': [], 
 # 			'Time Series: Q1 Anharmonicity': [], 
 # 			'Time Series: Q1 DriveP': [], 
@@ -119,17 +124,38 @@ class sequence():
 		self.nTimeList = int((self.dTimeEnd - self.dTimeStart) * self.dSampleFreq + 1)
 		self.tlist = np.linspace(self.dTimeStart, self.dTimeEnd, self.nTimeList)
 		self.dt = self.tlist[1] - self.tlist[0]
+		# coefficient time grid, oversampled to resolve pulses, contains tlist
+		self.nOversample = self.getOversampling()
+		self.tlist_coeff = np.linspace(self.dTimeStart, self.dTimeEnd, (self.nTimeList - 1) * self.nOversample + 1)
+		self.dict_TimeSeries = None
 		#
 		self.dict_Seq = {}
 
 
+	def getOversampling(self):
+		# find oversampling of tlist needed to resolve all pulses
+		dRate = self.dSampleFreq
+		for sQubit in List_sQubit:
+			for sSeqType in List_sSeqType:
+				seqCfg = getattr(self, 'seqCfg_' + sQubit + '_' + sSeqType)
+				for pulseCfg in seqCfg.lpulseCfg:
+					dRate = max(dRate, nCoeffPerPeriod * abs(pulseCfg.Frequency))
+					for dEdge in [pulseCfg.Rise, pulseCfg.Fall]:
+						if dEdge > 0:
+							dRate = max(dRate, nCoeffPerEdge / dEdge)
+		return max(1, int(np.ceil(dRate / self.dSampleFreq)))
+
+
+	def getTimeSeries(self):
+		# control channels on the coefficient time grid, calculated once
+		if self.dict_TimeSeries is None:
+			self.dict_TimeSeries = generateTimeSeries(self.tlist_coeff, self)
+		return self.dict_TimeSeries
+
+
 	def generateSeqDisplay(self):
-		#
-		for key, method in dict_timeFunc.items():
-			sName = 'Time Series: ' + key.replace('timeFunc_','').replace('_',' ')
-			self.dict_Seq[sName] = []
-		#
-		for key, method in dict_timeFunc.items():
-			sName = 'Time Series: ' + key.replace('timeFunc_','').replace('_',' ')
-			for t in self.tlist:
-				self.dict_Seq[sName].append(method(t,self))
+		# display the coefficient arrays at the times in tlist
+		dict_TimeSeries = self.getTimeSeries()
+		for key in List_sTimeSeries:
+			sName = 'Time Series: ' + key.replace('_',' ')
+			self.dict_Seq[sName] = dict_TimeSeries[key][::self.nOversample]
@@ -6,6 +6,8 @@
 import numpy as np
 from scipy.linalg import eig
 from qutip import *
+from qutip.solver import Result
+from operatorBasis import getOperatorBasis
 from basicfunc import *
 
 import logging
@@ -55,6 +57,7 @@ for k1 in range(4):
 	for k2 in range(4):
 		key = List_sPauli[k1] + List_sPauli[k2]
 		dict_pauli16[key] = Qflatten(tensor(List_mPauli[k1], List_mPauli[k2]))
+mPauli16 = np.array([op.full() for op in dict_pauli16.values()])
 
 
 
@@ -82,17 +85,6 @@ def level_identify(vals, vecs, list_table, list_select):
 				break			
 	return vals[v_idx], vecs[:,v_idx]
 
-def generateBasicOperator(nTrunc):
-	# generate basic operators. matrix truncated at nTrunc 
-	I = qeye(nTrunc)
-	a = destroy(nTrunc)
-	x = a + a.dag()
-	p = -1j*(a - a.dag())
-	aa = a.dag() * a
-	aaaa = a.dag() * a.dag() * a * a
-	return {'I':I, 'a':a, 'x':x, 'p':p, 'aa':aa, 'aaaa':aaaa}
-
-
 class QubitConfiguration():
 
 	def __init__(self, sQubit, CONFIG):
@@ -184,6 +176,8 @@ class simulation_3Q():
 		self.opts_mesolve = Options(atol=self.opts_mesolve_AbsTol,
 									rtol=self.opts_mesolve_RelTol,
 									nsteps=self.opts_mesolve_IntSteps)
+		# max. number of matrix elements of the propagators calculated at once
+		self.nBlockSize = 2**22
 
 
 
@@ -193,37 +187,41 @@ class simulation_3Q():
 			for sSeqType in List_sSeqType:
 				sName = 'seqCfg_' + sQubit + '_' + sSeqType
 				setattr(self, sName, getattr(sequence, sName))
+		# control channels sampled on the coefficient time grid
+		self.tlist_coeff = sequence.tlist_coeff
+		self.nOversample = sequence.nOversample
+		self.dict_TimeSeries = sequence.getTimeSeries()
 
 
 	def generateSubHamiltonian_3Q(self):
-		# generate partial Hamiltonian in 3-qubit system
-		OP = generateBasicOperator(self.nTrunc)
+		# generate partial Hamiltonian in 3-qubit system, from the operator cache
+		OP = getOperatorBasis(3, self.nTrunc)
 		self.OP = OP
 		# self Hamiltonian operators
-		self.H_Q1_aa = Qflatten(tensor(OP['aa'], OP['I'], OP['I']))
-		self.H_Q1_aaaa = Qflatten(tensor(OP['aaaa'], OP['I'], OP['I']))
-		self.H_Q2_aa = Qflatten(tensor(OP['I'], OP['aa'], OP['I']))
-		self.H_Q2_aaaa = Qflatten(tensor(OP['I'], OP['aaaa'], OP['I']))
-		self.H_Q3_aa = Qflatten(tensor(OP['I'], OP['I'], OP['aa']))
-		self.H_Q3_aaaa = Qflatten(tensor(OP['I'], OP['I'], OP['aaaa']))
+		self.H_Q1_aa = OP['Q1 aa']
+		self.H_Q1_aaaa = OP['Q1 aaaa']
+		self.H_Q2_aa = OP['Q2 aa']
+		self.H_Q2_aaaa = OP['Q2 aaaa']
+		self.H_Q3_aa = OP['Q3 aa']
+		self.H_Q3_aaaa = OP['Q3 aaaa']
 		# coupling Hamiltonian operators
-		self.H_g12_xx = Qflatten(tensor(OP['x'], OP['x'], OP['I']))
-		self.H_g23_xx = Qflatten(tensor(OP['I'], OP['x'], OP['x']))
-		self.H_g13_xx = Qflatten(tensor(OP['x'], OP['I'], OP['x']))
-		self.H_g12_pp = Qflatten(tensor(OP['p'], OP['p'], OP['I']))
-		self.H_g23_pp = Qflatten(tensor(OP['I'], OP['p'], OP['p']))
-		self.H_g13_pp = Qflatten(tensor(OP['p'], OP['I'], OP['p']))
+		self.H_g12_xx = OP['Q12 xx']
+		self.H_g23_xx = OP['Q23 xx']
+		self.H_g13_xx = OP['Q13 xx']
+		self.H_g12_pp = OP['Q12 pp']
+		self.H_g23_pp = OP['Q23 pp']
+		self.H_g13_pp = OP['Q13 pp']
 		# drive Hamiltonian operators
-		self.H_Q1_dr_x = Qflatten(tensor(OP['x'], OP['I'], OP['I']))
-		self.H_Q2_dr_x = Qflatten(tensor(OP['I'], OP['x'], OP['I']))
-		self.H_Q3_dr_x = Qflatten(tensor(OP['I'], OP['I'], OP['x']))
-		self.H_Q1_dr_p = Qflatten(tensor(OP['p'], OP['I'], OP['I']))
-		self.H_Q2_dr_p = Qflatten(tensor(OP['I'], OP['p'], OP['I']))
-		self.H_Q3_dr_p = Qflatten(tensor(OP['I'], OP['I'], OP['p']))
+		self.H_Q1_dr_x = OP['Q1 x']
+		self.H_Q2_dr_x = OP['Q2 x']
+		self.H_Q3_dr_x = OP['Q3 x']
+		self.H_Q1_dr_p = OP['Q1 p']
+		self.H_Q2_dr_p = OP['Q2 p']
+		self.H_Q3_dr_p = OP['Q3 p']
 		# collapse operators
-		self.L_Q1_a = Qflatten(tensor(OP['a'], OP['I'], OP['I']))
-		self.L_Q2_a = Qflatten(tensor(OP['I'], OP['a'], OP['I']))
-		self.L_Q3_a = Qflatten(tensor(OP['I'], OP['I'], OP['a']))
+		self.L_Q1_a = OP['Q1 a']
+		self.L_Q2_a = OP['Q2 a']
+		self.L_Q3_a = OP['Q3 a']
 
 
 	def generateHamiltonian_3Q_cap(self):
@@ -273,42 +271,117 @@ class simulation_3Q():
 		self.psi0 = self.psi_input_full_lab
 
 
+	def generateControlOperators(self):
+		# Hamiltonian operators and the control channels they are multiplied by,
+		# drive operators last
+		return [[2*np.pi*self.H_Q1_aa, 'Q1_Frequency'],
+				[2*np.pi*self.H_Q1_aaaa/2, 'Q1_Anharmonicity'],
+				[2*np.pi*self.H_Q2_aa, 'Q2_Frequency'],
+				[2*np.pi*self.H_Q2_aaaa/2, 'Q2_Anharmonicity'],
+				[2*np.pi*self.H_Q3_aa, 'Q3_Frequency'],
+				[2*np.pi*self.H_Q3_aaaa/2, 'Q3_Anharmonicity'],
+				[2*np.pi*self.H_g12_pp, 'g12_pp'],
+				[2*np.pi*self.H_g23_pp, 'g23_pp'],
+				[2*np.pi*self.H_g13_pp, 'g13_pp'],
+				[2*np.pi*self.H_Q1_dr_p, 'Q1_DriveP'],
+				[2*np.pi*self.H_Q2_dr_p, 'Q2_DriveP'],
+				[2*np.pi*self.H_Q3_dr_p, 'Q3_DriveP']]
+
+
+	def generateTimeDependentH(self):
+		# time-dependent Hamiltonian, control channels given as interpolated arrays
+		t0 = self.tlist_coeff[0]
+		t1 = self.tlist_coeff[-1]
+		return [[H, Cubic_Spline(t0, t1, self.dict_TimeSeries[key])] for H, key in self.generateControlOperators()]
+
+
 	def rhoEvolver_3Q(self):
 		#
-		self.result_rho = mesolve(H=[
-			[2*np.pi*self.H_Q1_aa, timeFunc_Q1_Frequency],
-			[2*np.pi*self.H_Q1_aaaa/2, timeFunc_Q1_Anharmonicity],
-			[2*np.pi*self.H_Q2_aa, timeFunc_Q2_Frequency],
-			[2*np.pi*self.H_Q2_aaaa/2, timeFunc_Q2_Anharmonicity],
-			[2*np.pi*self.H_Q3_aa, timeFunc_Q3_Frequency],
-			[2*np.pi*self.H_Q3_aaaa/2, timeFunc_Q3_Anharmonicity],
-			[2*np.pi*self.H_g12_pp, timeFunc_g12_pp],
-			[2*np.pi*self.H_g23_pp, timeFunc_g23_pp],
-			[2*np.pi*self.H_g13_pp, timeFunc_g13_pp],
-			[2*np.pi*self.H_Q1_dr_p, timeFunc_Q1_DriveP],
-			[2*np.pi*self.H_Q2_dr_p, timeFunc_Q2_DriveP],
-			[2*np.pi*self.H_Q3_dr_p, timeFunc_Q3_DriveP]
-			],
-			rho0 = self.rho0, tlist = self.tlist, c_ops = self.c_ops, args = self, options=self.opts_mesolve)#, options = options), store_states=True, c_ops=[], e_ops=[]
+		self.result_rho = mesolve(H=self.generateTimeDependentH(),
+			rho0 = self.rho0, tlist = self.tlist, c_ops = self.c_ops, options=self.opts_mesolve)#, options = options), store_states=True, c_ops=[], e_ops=[]
 
 
 	def psiEvolver_3Q(self):
 		#2*np.pi*(self.H_Q1 + self.H_Q2 + self.H_Q3)
-		self.result_psi = mesolve(H=[
-			[2*np.pi*self.H_Q1_aa, timeFunc_Q1_Frequency],
-			[2*np.pi*self.H_Q1_aaaa/2, timeFunc_Q1_Anharmonicity],
-			[2*np.pi*self.H_Q2_aa, timeFunc_Q2_Frequency],
-			[2*np.pi*self.H_Q2_aaaa/2, timeFunc_Q2_Anharmonicity],
-			[2*np.pi*self.H_Q3_aa, timeFunc_Q3_Frequency],
-			[2*np.pi*self.H_Q3_aaaa/2, timeFunc_Q3_Anharmonicity],
-			[2*np.pi*self.H_g12_pp, timeFunc_g12_pp],
-			[2*np.pi*self.H_g23_pp, timeFunc_g23_pp],
-			[2*np.pi*self.H_g13_pp, timeFunc_g13_pp],
-			[2*np.pi*self.H_Q1_dr_p, timeFunc_Q1_DriveP],
-			[2*np.pi*self.H_Q2_dr_p, timeFunc_Q2_DriveP],
-			[2*np.pi*self.H_Q3_dr_p, timeFunc_Q3_DriveP]
-			],
-			rho0 = self.psi0, tlist = self.tlist, c_ops = [], args = self, options=self.opts_mesolve)
+		self.result_psi = mesolve(H=self.generateTimeDependentH(),
+			rho0 = self.psi0, tlist = self.tlist, c_ops = [], options=self.opts_mesolve)
+
+
+	def propagatorEvolver_3Q(self):
+		# closed-system evolution with piecewise-constant controls, taken at the
+		# midpoint of each step of the coefficient time grid. The drive terms are
+		# diagonal in the eigenbasis of p, so the evolution is done in that basis
+		# with the drive applied as a phase between two half-steps of the rest of
+		# the Hamiltonian. Half-step propagators are found by batched
+		# eigendecomposition once per distinct set of control values, and the
+		# propagators of idle intervals between output times are cached
+		List_H = self.generateControlOperators()
+		nTrunc = self.nTrunc
+		vLam, W = np.linalg.eigh(self.OP['p'].full())
+		W3 = np.kron(np.kron(W, W), W)
+		vOne = np.ones(nTrunc)
+		mLam = 2*np.pi*np.array([np.kron(np.kron(vLam, vOne), vOne),
+								np.kron(np.kron(vOne, vLam), vOne),
+								np.kron(np.kron(vOne, vOne), vLam)])
+		mH = np.array([W3.conj().T.dot(H.full()).dot(W3) for H, key in List_H[:-3]])
+		# controls at the midpoint of each step
+		dt = self.tlist_coeff[1] - self.tlist_coeff[0]
+		dict_Mid = generateTimeSeries(self.tlist_coeff[:-1] + dt/2, self)
+		mCoeff = np.array([dict_Mid[key] for H, key in List_H[:-3]]).T
+		mDrive = np.array([dict_Mid[key] for H, key in List_H[-3:]]).T
+		vIdle = ~np.any(mDrive != 0, axis=1)
+		mRow, vRow = np.unique(mCoeff, axis=0, return_inverse=True)
+		vRow = vRow.ravel()
+		vCount = np.bincount(vRow)
+		#
+		def getHalfStep(lRow):
+			# half-step propagators for a list of distinct control values
+			E, V = np.linalg.eigh(mRow[lRow].dot(mH.reshape(len(mH), -1)).reshape((len(lRow),) + mH.shape[1:]))
+			return np.matmul(V * np.exp(-0.5j*dt*E)[:,np.newaxis,:], V.conj().transpose(0, 2, 1))
+		#
+		nOver = self.nOversample
+		nWin = len(self.tlist) - 1
+		nWinBlock = max(1, self.nBlockSize // (nOver * len(W3)**2))
+		dict_Half = {}
+		dict_Window = {}
+		mState = np.zeros((nWin + 1, len(W3)), dtype=complex)
+		mState[0] = W3.conj().T.dot(self.psi0.full()[:,0])
+		phi = mState[0]
+		for n1 in range(0, nWin, nWinBlock):
+			n2 = min(n1 + nWinBlock, nWin)
+			k1, k2 = n1 * nOver, n2 * nOver
+			# half-step propagators needed in block, keep the ones of long segments
+			lNew = [r for r in np.unique(vRow[k1:k2]) if r not in dict_Half]
+			dict_Block = dict(dict_Half)
+			if len(lNew) > 0:
+				for r, mHalf in zip(lNew, getHalfStep(lNew)):
+					dict_Block[r] = mHalf
+					if vCount[r] >= nOver:
+						dict_Half[r] = mHalf
+			mPhase = np.exp(-1j*dt*mDrive[k1:k2].dot(mLam))
+			for n in range(n1, n2):
+				j1, j2 = n * nOver, (n + 1) * nOver
+				r = vRow[j1]
+				if np.all(vRow[j1:j2] == r) and np.all(vIdle[j1:j2]):
+					# idle interval, all controls constant
+					if r not in dict_Window:
+						mHalf = dict_Block[r]
+						dict_Window[r] = np.linalg.matrix_power(mHalf.dot(mHalf), nOver)
+					phi = dict_Window[r].dot(phi)
+				else:
+					for j in range(j1, j2):
+						mHalf = dict_Block[vRow[j]]
+						if vIdle[j]:
+							phi = mHalf.dot(mHalf.dot(phi))
+						else:
+							phi = mHalf.dot(mPhase[j - k1] * mHalf.dot(phi))
+				mState[n + 1] = phi
+		# back to the Fock basis
+		mState = mState.dot(W3.T)
+		self.result_psi = Result()
+		self.result_psi.solver = 'propagatorEvolver_3Q'
+		self.result_psi.times = self.tlist
+		self.result_psi.states = [Qobj(psi[:,np.newaxis], dims=self.psi0.dims) for psi in mState]
 
 
 	def generateFinalRho(self):
@@ -321,13 +394,21 @@ class simulation_3Q():
 		log.info(self.final_state)
 
 
+	def getLogicPhase(self, tlist):
+		# diagonal of U(2*np.pi*self.H_idle_logic, t).dag() for all times in tlist
+		return np.exp(2j*np.pi*np.outer(tlist, self.vals_idle_sub))
+
+
 	def generateTraceRho(self):
-		for k, t in enumerate(self.tlist):
-			rho_full_lab = self.result_rho.states[k]
-			rho_logic_lab = T(rho_full_lab, self.U_full_to_logic)
-			rho_logic = T(rho_logic_lab, U(2*np.pi*self.H_idle_logic, t).dag())
-			for key, op in dict_pauli16.items():
-				self.dict_Trace['Time Series: ' + key].append(np.real((op * rho_logic).tr()))
+		# all states in the logical frame at once
+		mRho = np.array([rho.full() for rho in self.result_rho.states])
+		U_full_to_logic = self.U_full_to_logic.full()
+		mRho = np.matmul(np.matmul(U_full_to_logic, mRho), U_full_to_logic.conj().T)
+		mPhase = self.getLogicPhase(self.tlist)
+		mRho = mRho * mPhase[:,:,np.newaxis] * mPhase.conj()[:,np.newaxis,:]
+		mPauli = np.real(np.einsum('pij,tji->pt', mPauli16, mRho))
+		for key, vPauli in zip(dict_pauli16.keys(), mPauli):
+			self.dict_Trace_pauli16['Time Series: ' + key] = vPauli
 
 
 	def generateFinalPsi(self):
@@ -339,11 +420,11 @@ class simulation_3Q():
 
 
 	def generateTracePsi(self):
-		for k, t in enumerate(self.tlist):
-			psi_full_lab = self.result_psi.states[k]
-			psi_logic_lab = self.U_full_to_logic * psi_full_lab
-			psi_logic = U(2*np.pi*self.H_idle_logic, t).dag() * psi_logic_lab
-			for k, key in enumerate(self.list_label_sub_2Q):
-				self.dict_Trace_state['Time Series: a' + key].append(psi_logic.full()[k,0])
-			for key, op in dict_pauli16.items():
-				self.dict_Trace_pauli16['Time Series: ' + key].append(np.real((op * psi_logic * psi_logic.dag()).tr()))
+		# all states in the logical frame at once
+		mPsi = np.array([psi.full()[:,0] for psi in self.result_psi.states])
+		mPsi = mPsi.dot(self.U_full_to_logic.full().T) * self.getLogicPhase(self.tlist)
+		for k, key in enumerate(self.list_label_sub_2Q):
+			self.dict_Trace_state['Time Series: a' + key] = mPsi[:,k]
+		mPauli = np.real(np.einsum('ti,pij,tj->pt', mPsi.conj(), mPauli16, mPsi))
+		for key, vPauli in zip(dict_pauli16.keys(), mPauli):
+			self.dict_Trace_pauli16['Time Series: ' + key] = vPauli
@@ -11,6 +11,18 @@ from QSolver_ForDriver import *
 # import logging
 # log = logging.getLogger('LabberDriver')
 
+# sweep parameters, with name and scale factor of attribute in MultiQubitHamiltonian
+dict_SweepParam = {'Q1 Flux Bias': ('dFlux_Q1', 1.0),
+				'Q2 Flux Bias': ('dFlux_Q2', 1.0),
+				'Q3 Flux Bias': ('dFlux_Q3', 1.0),
+				'Q1 Frequency': ('dFreq_Q1', 1E-9),
+				'Q2 Frequency': ('dFreq_Q2', 1E-9),
+				'Q3 Frequency': ('dFreq_Q3', 1E-9)}
+
+dict_LabelSelect = {1: ['0','1','2','3'],
+				2: ['00','10','01','11','20','02'],
+				3: ['000','100','010','001','110','101','011','200','020','002']}
+
 class Driver(InstrumentDriver.InstrumentWorker):
 	""" This class implements eigensolver of a multi-qubit system"""
 
@@ -18,6 +30,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
 		"""Perform the operation of opening the instrument connection"""
 		# init variables
 		self.multiqubit = MultiQubitHamiltonian()
+		self.bSimulated = False
+		self.bSwept = False
 		# self.vPolarization = np.zeros((4,))
 		# self.lTrace = [np.array([], dtype=float) for n in range(4)]
 
@@ -34,25 +48,38 @@ class Driver(InstrumentDriver.InstrumentWorker):
 		# dElevels = {'Eigenenergies unlabel': 0, 'Eigenenergies label': 1}
 		# dPolarization = {'Polarization - X': 0, 'Polarization - Y': 1, 'Polarization - Z': 2, '3rd Level Population': 3}
 		# check type of quantity
+		if self.isConfigUpdated():
+			self.bSimulated = False
+			self.bSwept = False
 		if quant.name in list({'Eigenenergies unlabel'}) + list({'Eigenenergies label'}):
 			# output data, check if simulation needs to be performed
-			if self.isConfigUpdated():
+			if not self.bSimulated:
 				self.performSimulation()
 			# get new value
 			if quant.name == 'Eigenenergies unlabel':
 				value = quant.getTraceDict(self.vals_unlabel_show*1E9, x0=0, dx=1)
 			if quant.name == 'Eigenenergies label':
 				value = quant.getTraceDict(self.vals_label_show*1E9, x0=0, dx=1)
+		elif quant.name.startswith('Sweep Eigenenergy #'):
+			if not self.bSwept:
+				self.performSweep()
+			# labeled level vs. sweep value
+			n = int(quant.name.split('#')[1]) - 1
+			if n < self.vals_sweep_show.shape[1]:
+				vLevel = self.vals_sweep_show[:,n]*1E9
+			else:
+				vLevel = np.zeros(0)
+			dStep = self.vSweep[1] - self.vSweep[0] if len(self.vSweep) > 1 else 1.0
+			value = quant.getTraceDict(vLevel, x0=self.vSweep[0], dx=dStep)
 		else:
 			# otherwise, just return current value
 			value = quant.getValue()
 		return value
 
 
-	def performSimulation(self):
-		"""Perform simulation"""
-		# get config values
-		Config = dict(
+	def getSimCfg(self):
+		"""Get simulation config values"""
+		return dict(
 					nQubit = int(self.getValue('Number of Qubits')),
 					nTrunc = int(self.getValue('Degree of Trunction')),
 					# nShow = int(self.getValue('Max Number of Display')),
@@ -86,6 +113,12 @@ class Driver(InstrumentDriver.InstrumentWorker):
 					dFlux_Q1 = self.getValue('Q1 Flux Bias'),
 					dFlux_Q2 = self.getValue('Q2 Flux Bias'),
 					dFlux_Q3 = self.getValue('Q3 Flux Bias'))
+
+
+	def performSimulation(self):
+		"""Perform simulation"""
+		# get config values
+		Config = self.getSimCfg()
 		# update config
 		self.multiqubit.updateSimCfg(Config)
 		if self.multiqubit.nQubit == 1:
@@ -107,6 +140,18 @@ class Driver(InstrumentDriver.InstrumentWorker):
 		self.multiqubit.vals_label, self.multiqubit.vecs_label = level_identify(self.multiqubit.vals_unlabel, self.multiqubit.vecs_unlabel, self.multiqubit.list_label_table, self.multiqubit.list_label_select)
 		self.vals_unlabel_show = self.multiqubit.vals_unlabel
 		self.vals_label_show = self.multiqubit.vals_label
+		self.bSimulated = True
+
+
+	def performSweep(self):
+		"""Find eigenenergies for all values of the sweep parameter"""
+		self.multiqubit.updateSimCfg(self.getSimCfg())
+		sParam, dScale = dict_SweepParam[self.getValue('Sweep Parameter')]
+		self.vSweep = np.linspace(self.getValue('Sweep Start'), self.getValue('Sweep Stop'), int(self.getValue('Sweep Points')))
+		bSparse = bool(self.getValue('Use Sparse Solver'))
+		nLevel = int(self.getValue('Number of Levels')) if bSparse else None
+		self.vals_sweep_show = self.multiqubit.generateSweep(sParam, self.vSweep * dScale, dict_LabelSelect[self.multiqubit.nQubit], nLevel, bSparse)
+		self.bSwept = True
 
 
 if __name__ == '__main__':
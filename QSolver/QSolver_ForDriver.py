@@ -6,8 +6,12 @@ Created on Wed Jan 24 2018
 """
 
 import numpy as np
-from scipy.linalg import eig
+import scipy.sparse
+from scipy.linalg import eigh
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.linalg import eigsh
 from qutip import *
+from operatorBasis import getOperatorBasis
 
 import logging
 log = logging.getLogger('LabberDriver')
@@ -55,15 +59,42 @@ def Qflatten(Q):
 def eigensolve(H):
 	# find eigensolution of H
 	H = H.full()
-	vals, vecs = eig(H)    
-	#idx = vals.argsort()[::-1] #Descending Order
-	idx = vals.argsort() #Ascending Order
-	vals = vals[idx]
-	vecs = vecs[:,idx]
+	vals, vecs = eigh(H)    # Ascending Order
 	return np.real(vals), vecs
 
-def level_identify(vals, vecs, list_table, list_select):
-	# identify and sort eigen solutions according to "list_select"
+def eigensolve_sweep(list_op, coeff, nLevel=None, bSparse=False, nBlockSize=2**22):
+	# find eigensolutions of H = sum(coeff[n,k] * list_op[k]) for all sweep
+	# points n, in ascending order. Dense solutions are found for stacks of
+	# points at once, the sparse solver finds only the lowest nLevel levels
+	coeff = np.asarray(coeff)
+	nPoint = coeff.shape[0]
+	nDim = list_op[0].shape[0]
+	if nLevel is None or nLevel > nDim:
+		nLevel = nDim
+	if bSparse and nLevel < nDim - 1:
+		list_op = [scipy.sparse.csr_matrix(op) for op in list_op]
+		vals = np.zeros((nPoint, nLevel))
+		vecs = np.zeros((nPoint, nDim, nLevel), dtype=complex)
+		for n in range(nPoint):
+			H = sum(c * op for c, op in zip(coeff[n], list_op))
+			v, w = eigsh(H, k=nLevel, which='SA')
+			idx = v.argsort()
+			vals[n], vecs[n] = v[idx], w[:,idx]
+		return vals, vecs
+	ops = np.array([op.toarray() if scipy.sparse.issparse(op) else np.asarray(op) for op in list_op])
+	ops = ops.reshape(len(ops), -1)
+	vals = np.zeros((nPoint, nLevel))
+	vecs = np.zeros((nPoint, nDim, nLevel), dtype=complex)
+	nBlock = max(1, nBlockSize // nDim**2)
+	for n1 in range(0, nPoint, nBlock):
+		n2 = min(n1 + nBlock, nPoint)
+		H = coeff[n1:n2].dot(ops).reshape(n2 - n1, nDim, nDim)
+		v, w = np.linalg.eigh(H)
+		vals[n1:n2], vecs[n1:n2] = v[:,:nLevel], w[:,:,:nLevel]
+	return vals, vecs
+
+def level_index(vecs, list_table, list_select):
+	# indices of the eigenvectors identified as the levels in "list_select"
 	v_idx = []
 	for k, str_level in enumerate(list_select):
 		idx_sort = np.argsort(np.abs(vecs[list_table.index(str_level),:]))
@@ -74,8 +105,28 @@ def level_identify(vals, vecs, list_table, list_select):
 			else:
 				v_idx.append(idx_sort[-count])
 				break			
+	return v_idx
+
+def level_identify(vals, vecs, list_table, list_select):
+	# identify and sort eigen solutions according to "list_select"
+	v_idx = level_index(vecs, list_table, list_select)
 	return vals[v_idx], vecs[:,v_idx]
 
+def level_track(vals, vecs, list_table, list_select):
+	# identify levels in a sweep. Levels are identified by "level_index" at the
+	# first point, and then follow the eigenvector with the largest overlap
+	# with the same level at the previous point
+	nPoint = vals.shape[0]
+	m_idx = np.zeros((nPoint, len(list_select)), dtype=int)
+	m_idx[0] = level_index(vecs[0], list_table, list_select)
+	for n in range(1, nPoint):
+		overlap = np.abs(vecs[n-1][:,m_idx[n-1]].conj().T.dot(vecs[n]))**2
+		row, col = linear_sum_assignment(-overlap)
+		m_idx[n, row] = col
+	vals_label = np.take_along_axis(vals, m_idx, axis=1)
+	vecs_label = np.take_along_axis(vecs, m_idx[:,np.newaxis,:], axis=2)
+	return vals_label, vecs_label
+
 
 
 class MultiQubitHamiltonian():
@@ -159,35 +210,29 @@ class MultiQubitHamiltonian():
 				setattr(self, 'dAnh_Q3', -self.dEc_Q3)
 
 
-	def generateOperators(self):
-		# generate basic operators. matrix truncated at nTrunc 
-		I = qeye(self.nTrunc)
-		a = destroy(self.nTrunc)
-		x = a + a.dag()
-		p = -1j*(a - a.dag())
-		aa = a.dag() * a
-		aaaa = a.dag() * a.dag() * a * a
-		return {'I':I, 'a':a, 'x':x, 'p':p, 'aa':aa, 'aaaa':aaaa}
-
-
 	def generateSubHamiltonian_1Q(self):
 		# generate partial Hamiltonian in 3-qubit system
-		OP = self.generateOperators()
+		OP = getOperatorBasis(1, self.nTrunc)
 		# self Hamiltonian operators
-		self.H_Q1_aa = Qflatten(tensor(OP['aa']))
-		self.H_Q1_aaaa = Qflatten(tensor(OP['aaaa']))
+		self.H_Q1_aa = OP['Q1 aa']
+		self.H_Q1_aaaa = OP['Q1 aaaa']
 		# drive Hamiltonian operators
-		self.H_dr_Q1_x = Qflatten(tensor(OP['x']))
-		self.H_dr_Q1_p = Qflatten(tensor(OP['p']))
+		self.H_dr_Q1_x = OP['Q1 x']
+		self.H_dr_Q1_p = OP['Q1 p']
+
+
+	def generateTerms_1Q_cap(self):
+		# coefficients and operators of the 1-qubit Hamiltonian. Coefficients are
+		# arrays if the qubit parameters are arrays of sweep values
+		return [(self.dFreq_Q1, self.H_Q1_aa),
+				(self.dAnh_Q1/2, self.H_Q1_aaaa)]
 
 
 	def generateHamiltonian_1Q_cap(self):
-		# construct 3-qubit Hamiltonian
+		# construct 1-qubit Hamiltonian
 		self.generateSubHamiltonian_1Q()
-		# self Hamiltonian
-		self.H_Q1 = self.dFreq_Q1 * self.H_Q1_aa + self.dAnh_Q1/2 * self.H_Q1_aaaa
 		# system Hamiltonian
-		self.H_sys = self.H_Q1 + self.H_Q2 + self.H_12
+		self.H_sys = sum([c * op for c, op in self.generateTerms_1Q_cap()])
 
 
 	def generateLabel_1Q(self):
@@ -200,33 +245,39 @@ class MultiQubitHamiltonian():
 
 	def generateSubHamiltonian_2Q(self):
 		# generate partial Hamiltonian in 3-qubit system
-		OP = self.generateOperators()
+		OP = getOperatorBasis(2, self.nTrunc)
 		# self Hamiltonian operators
-		self.H_Q1_aa = Qflatten(tensor(OP['aa'], OP['I']))
-		self.H_Q1_aaaa = Qflatten(tensor(OP['aaaa'], OP['I']))
-		self.H_Q2_aa = Qflatten(tensor(OP['I'], OP['aa']))
-		self.H_Q2_aaaa = Qflatten(tensor(OP['I'], OP['aaaa']))
+		self.H_Q1_aa = OP['Q1 aa']
+		self.H_Q1_aaaa = OP['Q1 aaaa']
+		self.H_Q2_aa = OP['Q2 aa']
+		self.H_Q2_aaaa = OP['Q2 aaaa']
 		# coupling Hamiltonian operators
-		self.H_12_xx = Qflatten(tensor(OP['x'], OP['x']))#
-		self.H_12_pp = Qflatten(tensor(OP['p'], OP['p']))
+		self.H_12_xx = OP['Q12 xx']#
+		self.H_12_pp = OP['Q12 pp']
 		# drive Hamiltonian operators
-		self.H_dr_Q1_x = Qflatten(tensor(OP['x'], OP['I']))
-		self.H_dr_Q2_x = Qflatten(tensor(OP['I'], OP['x']))
-		self.H_dr_Q1_p = Qflatten(tensor(OP['p'], OP['I']))
-		self.H_dr_Q2_p = Qflatten(tensor(OP['I'], OP['p']))
+		self.H_dr_Q1_x = OP['Q1 x']
+		self.H_dr_Q2_x = OP['Q2 x']
+		self.H_dr_Q1_p = OP['Q1 p']
+		self.H_dr_Q2_p = OP['Q2 p']
+
+
+	def generateTerms_2Q_cap(self):
+		# coefficients and operators of the 2-qubit Hamiltonian. Coefficients are
+		# arrays if the qubit parameters are arrays of sweep values
+		# coupling coefficient
+		self.g_12 = 0.5 * self.c12 * np.sqrt(self.dFreq_Q1 * self.dFreq_Q2)
+		return [(self.dFreq_Q1, self.H_Q1_aa),
+				(self.dAnh_Q1/2, self.H_Q1_aaaa),
+				(self.dFreq_Q2, self.H_Q2_aa),
+				(self.dAnh_Q2/2, self.H_Q2_aaaa),
+				(self.g_12, self.H_12_pp)]
 
 
 	def generateHamiltonian_2Q_cap(self):
-		# construct 3-qubit Hamiltonian
+		# construct 2-qubit Hamiltonian
 		self.generateSubHamiltonian_2Q()
-		# self Hamiltonian
-		self.H_Q1 = self.dFreq_Q1 * self.H_Q1_aa + self.dAnh_Q1/2 * self.H_Q1_aaaa
-		self.H_Q2 = self.dFreq_Q2 * self.H_Q2_aa + self.dAnh_Q2/2 * self.H_Q2_aaaa
-		# coupling Hamiltonian
-		self.g_12 = 0.5 * self.c12 * np.sqrt(self.dFreq_Q1 * self.dFreq_Q2)
-		self.H_12 = self.g_12 * self.H_12_pp
 		# system Hamiltonian
-		self.H_sys = self.H_Q1 + self.H_Q2 + self.H_12
+		self.H_sys = sum([c * op for c, op in self.generateTerms_2Q_cap()])
 
 
 	def generateLabel_2Q(self):
@@ -240,46 +291,53 @@ class MultiQubitHamiltonian():
 
 	def generateSubHamiltonian_3Q(self):
 		# generate partial Hamiltonian in 3-qubit system
-		OP = self.generateOperators()
+		OP = getOperatorBasis(3, self.nTrunc)
 		# self Hamiltonian operators
-		self.H_Q1_aa = Qflatten(tensor(OP['aa'], OP['I'], OP['I']))
-		self.H_Q1_aaaa = Qflatten(tensor(OP['aaaa'], OP['I'], OP['I']))
-		self.H_Q2_aa = Qflatten(tensor(OP['I'], OP['aa'], OP['I']))
-		self.H_Q2_aaaa = Qflatten(tensor(OP['I'], OP['aaaa'], OP['I']))
-		self.H_Q3_aa = Qflatten(tensor(OP['I'], OP['I'], OP['aa']))
-		self.H_Q3_aaaa = Qflatten(tensor(OP['I'], OP['I'], OP['aaaa']))
+		self.H_Q1_aa = OP['Q1 aa']
+		self.H_Q1_aaaa = OP['Q1 aaaa']
+		self.H_Q2_aa = OP['Q2 aa']
+		self.H_Q2_aaaa = OP['Q2 aaaa']
+		self.H_Q3_aa = OP['Q3 aa']
+		self.H_Q3_aaaa = OP['Q3 aaaa']
 		# coupling Hamiltonian operators
-		self.H_12_xx = Qflatten(tensor(OP['x'], OP['x'], OP['I']))
-		self.H_23_xx = Qflatten(tensor(OP['I'], OP['x'], OP['x']))
-		self.H_13_xx = Qflatten(tensor(OP['x'], OP['I'], OP['x']))		#
-		self.H_12_pp = Qflatten(tensor(OP['p'], OP['p'], OP['I']))
-		self.H_23_pp = Qflatten(tensor(OP['I'], OP['p'], OP['p']))
-		self.H_13_pp = Qflatten(tensor(OP['p'], OP['I'], OP['p']))
+		self.H_12_xx = OP['Q12 xx']
+		self.H_23_xx = OP['Q23 xx']
+		self.H_13_xx = OP['Q13 xx']		#
+		self.H_12_pp = OP['Q12 pp']
+		self.H_23_pp = OP['Q23 pp']
+		self.H_13_pp = OP['Q13 pp']
 		# drive Hamiltonian operators
-		self.H_dr_Q1_x = Qflatten(tensor(OP['x'], OP['I'], OP['I']))
-		self.H_dr_Q2_x = Qflatten(tensor(OP['I'], OP['x'], OP['I']))
-		self.H_dr_Q3_x = Qflatten(tensor(OP['I'], OP['I'], OP['x']))
-		self.H_dr_Q1_p = Qflatten(tensor(OP['p'], OP['I'], OP['I']))
-		self.H_dr_Q2_p = Qflatten(tensor(OP['I'], OP['p'], OP['I']))
-		self.H_dr_Q3_p = Qflatten(tensor(OP['I'], OP['I'], OP['p']))
+		self.H_dr_Q1_x = OP['Q1 x']
+		self.H_dr_Q2_x = OP['Q2 x']
+		self.H_dr_Q3_x = OP['Q3 x']
+		self.H_dr_Q1_p = OP['Q1 p']
+		self.H_dr_Q2_p = OP['Q2 p']
+		self.H_dr_Q3_p = OP['Q3 p']
+
+
+	def generateTerms_3Q_cap(self):
+		# coefficients and operators of the 3-qubit Hamiltonian. Coefficients are
+		# arrays if the qubit parameters are arrays of sweep values
+		# coupling coefficients
+		self.g_12 = 0.5 * self.c12 * np.sqrt(self.dFreq_Q1 * self.dFreq_Q2)
+		self.g_23 = 0.5 * self.c23 * np.sqrt(self.dFreq_Q2 * self.dFreq_Q3)
+		self.g_13 = 0.5 * (self.c12 * self.c23 + self.c13) * np.sqrt(self.dFreq_Q1 * self.dFreq_Q3)
+		return [(self.dFreq_Q1, self.H_Q1_aa),
+				(self.dAnh_Q1/2, self.H_Q1_aaaa),
+				(self.dFreq_Q2, self.H_Q2_aa),
+				(self.dAnh_Q2/2, self.H_Q2_aaaa),
+				(self.dFreq_Q3, self.H_Q3_aa),
+				(self.dAnh_Q3/2, self.H_Q3_aaaa),
+				(self.g_12, self.H_12_pp),
+				(self.g_23, self.H_23_pp),
+				(self.g_13, self.H_13_pp)]
 
 
 	def generateHamiltonian_3Q_cap(self):
 		# construct 3-qubit Hamiltonian
 		self.generateSubHamiltonian_3Q()
-		# self Hamiltonian
-		self.H_Q1 = self.dFreq_Q1 * self.H_Q1_aa + self.dAnh_Q1/2 * self.H_Q1_aaaa
-		self.H_Q2 = self.dFreq_Q2 * self.H_Q2_aa + self.dAnh_Q2/2 * self.H_Q2_aaaa
-		self.H_Q3 = self.dFreq_Q3 * self.H_Q3_aa + self.dAnh_Q3/2 * self.H_Q3_aaaa
-		# coupling Hamiltonian
-		self.g_12 = 0.5 * self.c12 * np.sqrt(self.dFreq_Q1 * self.dFreq_Q2)
-		self.H_12 = self.g_12 * self.H_12_pp
-		self.g_23 = 0.5 * self.c23 * np.sqrt(self.dFreq_Q2 * self.dFreq_Q3)
-		self.H_23 = self.g_23 * self.H_23_pp
-		self.g_13 = 0.5 * (self.c12 * self.c23 + self.c13) * np.sqrt(self.dFreq_Q1 * self.dFreq_Q3)
-		self.H_13 = self.g_13 * self.H_13_pp
 		# system Hamiltonian
-		self.H_sys = self.H_Q1 + self.H_Q2 + self.H_Q3 + self.H_12 + self.H_23 + self.H_13
+		self.H_sys = sum([c * op for c, op in self.generateTerms_3Q_cap()])
 
 
 	def generateLabel_3Q(self):
@@ -291,3 +349,40 @@ class MultiQubitHamiltonian():
 				for k3 in np.arange(self.nTrunc):
 					self.list_label_table.append(list_label_gen[k1] + list_label_gen[k2] + list_label_gen[k3])
 
+
+	def generateSweep(self, sParam, vValue, list_label_select, nLevel=None, bSparse=False):
+		# eigenenergies vs. the values vValue of the parameter sParam, e.g.
+		# 'dFlux_Q2' or 'dFreq_Q2'. Flux biases only change the qubit frequencies
+		# if the design parameters are used
+		nQubit = int(self.nQubit)
+		# with design parameters, updateSimCfg overwrites frequency and
+		# anharmonicity, without them the flux bias is not used. Either sweep
+		# would give a flat spectrum
+		if sParam.startswith(('dFreq_Q', 'dAnh_Q', 'dFlux_Q')):
+			sQubit = sParam.split('_')[1]
+			bFlux = getattr(self, 'bDesignParam_' + sQubit) and \
+					getattr(self, 'sQubitType_' + sQubit) == '2-JJ'
+			if bFlux and not sParam.startswith('dFlux_Q'):
+				raise ValueError('Cannot sweep %s %s while the design parameters are used, sweep the flux bias instead' % (sQubit, 'frequency' if sParam.startswith('dFreq') else 'anharmonicity'))
+			if not bFlux and sParam.startswith('dFlux_Q'):
+				raise ValueError('Cannot sweep %s flux bias without the design parameters of a 2-JJ qubit, sweep the frequency instead' % sQubit)
+		# operators are taken from the operator cache
+		getattr(self, 'generateSubHamiltonian_%dQ' % nQubit)()
+		getattr(self, 'generateLabel_%dQ' % nQubit)()
+		vValue = np.asarray(vValue, dtype=float)
+		value = getattr(self, sParam)
+		try:
+			setattr(self, sParam, vValue)
+			self.updateSimCfg({})
+			lTerm = getattr(self, 'generateTerms_%dQ_cap' % nQubit)()
+		finally:
+			setattr(self, sParam, value)
+			self.updateSimCfg({})
+		coeff = np.array([np.broadcast_to(c, vValue.shape) for c, op in lTerm]).T
+		list_op = [op.data for c, op in lTerm]
+		if nLevel is not None:
+			nLevel = max(nLevel, len(list_label_select))
+		self.vSweep = vValue
+		self.vals_sweep, self.vecs_sweep = eigensolve_sweep(list_op, coeff, nLevel, bSparse)
+		self.vals_sweep_label, self.vecs_sweep_label = level_track(self.vals_sweep, self.vecs_sweep, self.list_label_table, list_label_select)
+		return self.vals_sweep_label
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Operator basis of multi-qubit Hamiltonians, cached for the lifetime of the
+process. The same module is used by the QSolver and QEvolver_3Q drivers.
+"""
+
+from qutip import *
+
+# operator basis for each (nQubit, nTrunc)
+dict_OperatorCache = {}
+
+
+def Qflatten(Q):
+	return Qobj(Q.full())
+
+def generateBasicOperator(nTrunc):
+	# generate basic operators. matrix truncated at nTrunc
+	I = qeye(nTrunc)
+	a = destroy(nTrunc)
+	x = a + a.dag()
+	p = -1j*(a - a.dag())
+	aa = a.dag() * a
+	aaaa = a.dag() * a.dag() * a * a
+	return {'I':I, 'a':a, 'x':x, 'p':p, 'aa':aa, 'aaaa':aaaa}
+
+def generateOperatorBasis(nQubit, nTrunc):
+	# single-qubit operators and two-qubit couplings in the full space, e.g.
+	# 'Q2 aa' or 'Q13 pp'. The basic operators of one qubit are under 'I', 'a', ...
+	OP = generateBasicOperator(nTrunc)
+	dict_OP = dict(OP)
+	for k1 in range(nQubit):
+		for sOp in ['a', 'x', 'p', 'aa', 'aaaa']:
+			list_op = [OP['I']] * nQubit
+			list_op[k1] = OP[sOp]
+			dict_OP['Q%d %s' % (k1+1, sOp)] = Qflatten(tensor(list_op))
+		for k2 in range(k1+1, nQubit):
+			for sOp in ['x', 'p']:
+				list_op = [OP['I']] * nQubit
+				list_op[k1] = OP[sOp]
+				list_op[k2] = OP[sOp]
+				dict_OP['Q%d%d %s%s' % (k1+1, k2+1, sOp, sOp)] = Qflatten(tensor(list_op))
+	return dict_OP
+
+def getOperatorBasis(nQubit, nTrunc):
+	# operator basis as Qobj, only generated the first time it is requested. The
+	# operators are shared, qutip arithmetic returns new objects but the data of
+	# the operators must not be changed in place
+	key = (int(nQubit), int(nTrunc))
+	if key not in dict_OperatorCache:
+		dict_OperatorCache[key] = generateOperatorBasis(*key)
+	return dict(dict_OperatorCache[key])
@@ -3,6 +3,8 @@
 import InstrumentDriver
 import numpy as np
 
+import demodulation
+
 
 class Error(Exception):
     pass
@@ -10,9 +12,13 @@ class Error(Exception):
 class Driver(InstrumentDriver.InstrumentWorker):
     """ This class implements a demodulation driver"""
 
+    # number of demodulation frequencies, 'Modulation frequency' is the first
+    N_FREQ = 9
+
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
-        pass
+        # cached last result, the kernels are cached by the demodulation module
+        self.lastResult = None
 
 
     def performClose(self, bError=False, options={}):
@@ -36,115 +42,86 @@ class Driver(InstrumentDriver.InstrumentWorker):
             # calculate I/Q signal here
             value = self.getIQAmplitudes()
         elif quant.name.startswith('Value #'):
+            # all frequencies are demodulated in the same pass
             index = int(quant.name[-1])
-            sDemodFreq = 'Mod. frequency #' + str(index)
-            dFreq = self.getValue(sDemodFreq)
-            value = np.mean(self.getIQAmplitudes_MultiFreq(dFreq))
+            value = np.mean(self.getIQAmplitudes(index - 1))
         else:
             # just return the quantity value
             value = quant.getValue()
         return value
 
-    def getIQAmplitudes(self):
-        """Calculate complex signal from data and reference"""
-        # get parameters
-        dFreq = self.getValue('Modulation frequency')
-        skipStart = self.getValue('Skip start')
-        nSegment = int(self.getValue('Number of segments'))
-        # get input data from dict, with keys {'y': value, 't0': t0, 'dt': dt}
+    def getFrequencies(self):
+        """Get list of all demodulation frequencies"""
+        lFreq = [self.getValue('Modulation frequency')]
+        for n in range(2, self.N_FREQ + 1):
+            lFreq.append(self.getValue('Mod. frequency #' + str(n)))
+        return lFreq
+
+    def getIQAmplitudes(self, index=0):
+        """Calculate complex signal from data and reference.
+
+        All modulation frequencies are demodulated in one pass over the data,
+        the result is kept until the input data or settings change.
+        """
+        lFreq = self.getFrequencies()
         traceIn = self.getValue('Input data')
+        bUseRef = bool(self.getValue('Use phase reference signal'))
+        traceRef = self.getValue('Reference data') if bUseRef else None
         if traceIn is None:
             return complex(0.0)
-        vY = traceIn['y']     
-        dt = traceIn['dt']
-        # get shape of input data
-        shape = traceIn.get('shape', vY.shape)
-        # override segment parameter if input data has more than one dimension
-        if len(shape) > 1:
-            nSegment = shape[0]
-        # avoid exceptions if no time step is given
-        if dt==0:
-            dt = 1.0
-        skipIndex = int(round(skipStart/dt))
-        nTotLength = vY.size
-        length = 1 + int(round(self.getValue('Length')/dt))
-        length = min(length, int(nTotLength/nSegment)-skipIndex)
-        if length <=1:
+        # re-use last result if data and settings are the same, the data
+        # arrays are kept in the cache so their identity can not be re-used
+        vY = traceIn['y']
+        vRef = None if traceRef is None else traceRef['y']
+        key = (tuple(lFreq), traceIn['dt'], traceIn.get('shape', vY.shape),
+               self.getValue('Skip start'), self.getValue('Length'),
+               self.getValue('Number of segments'))
+        if (self.lastResult is not None and self.lastResult[0] is vY and
+                self.lastResult[1] is vRef and self.lastResult[2] == key):
+            signal, vIndex = self.lastResult[3:]
+        else:
+            # only demodulate each distinct frequency once
+            vFreq, vIndex = np.unique(lFreq, return_inverse=True)
+            signal = self.demodulate(vFreq, traceIn, traceRef)
+            self.lastResult = (vY, vRef, key, signal, vIndex)
+        if signal is None:
             return complex(0.0)
-        bUseRef = bool(self.getValue('Use phase reference signal'))
-        # define data to use, put in 2d array of segments
-        vData = np.reshape(vY, (nSegment, int(nTotLength/nSegment)))
-        # calculate cos/sin vectors, allow segmenting
-        vTime = dt * (skipIndex + np.arange(length, dtype=float))
-        vCos = np.cos(2*np.pi * vTime * dFreq)
-        vSin = np.sin(2*np.pi * vTime * dFreq)
-        # calc I/Q
-        dI = 2. * np.trapz(vCos * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        dQ = 2. * np.trapz(vSin * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        signal = dI + 1j*dQ
-        if bUseRef:
-            traceRef = self.getValue('Reference data')
-            # skip reference if trace length doesn't match
-            if len(traceRef['y']) != len(vY):
-                return signal
-            vRef = np.reshape(traceRef['y'], (nSegment, int(nTotLength/nSegment)))
-            dIref = 2. * np.trapz(vCos * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            dQref = 2. * np.trapz(vSin * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            # subtract the reference angle
-            dAngleRef = np.arctan2(dQref, dIref)
-            signal /= (np.cos(dAngleRef) + 1j*np.sin(dAngleRef))
-        return signal
-    
-
-
-    def getIQAmplitudes_MultiFreq(self,dFreq):
-        """Calculate complex signal from data and reference"""
+        return signal[vIndex[index]].copy()
+
+    def demodulate(self, lFreq, traceIn, traceRef=None):
+        """Demodulate data at several frequencies, in blocks of segments.
+
+        Returns a complex array of shape (number of frequencies, nSegment),
+        or None if there is no data to demodulate.
+        """
         # get parameters
         skipStart = self.getValue('Skip start')
         nSegment = int(self.getValue('Number of segments'))
         # get input data from dict, with keys {'y': value, 't0': t0, 'dt': dt}
-        traceIn = self.getValue('Input data')
         if traceIn is None:
-            return complex(0.0)
-        vY = traceIn['y']     
+            return None
+        vY = traceIn['y']
         dt = traceIn['dt']
         # get shape of input data
         shape = traceIn.get('shape', vY.shape)
         # override segment parameter if input data has more than one dimension
         if len(shape) > 1:
             nSegment = shape[0]
-        # avoid exceptions if no time step is given
-        if dt==0:
-            dt = 1.0
-        skipIndex = int(round(skipStart/dt))
         nTotLength = vY.size
-        length = 1 + int(round(self.getValue('Length')/dt))
-        length = min(length, int(nTotLength/nSegment)-skipIndex)
+        skipIndex, length = demodulation.get_window(
+            dt, skipStart, self.getValue('Length'), int(nTotLength/nSegment))
         if length <=1:
-            return complex(0.0)
-        bUseRef = bool(self.getValue('Use phase reference signal'))
+            return None
         # define data to use, put in 2d array of segments
         vData = np.reshape(vY, (nSegment, int(nTotLength/nSegment)))
-        # calculate cos/sin vectors, allow segmenting
-        vTime = dt * (skipIndex + np.arange(length, dtype=float))
-        vCos = np.cos(2*np.pi * vTime * dFreq)
-        vSin = np.sin(2*np.pi * vTime * dFreq)
-        # calc I/Q
-        dI = 2. * np.trapz(vCos * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        dQ = 2. * np.trapz(vSin * vData[:,skipIndex:skipIndex+length]) / float(length-1)
-        signal = dI + 1j*dQ
-        if bUseRef:
-            traceRef = self.getValue('Reference data')
-            # skip reference if trace length doesn't match
-            if len(traceRef['y']) != len(vY):
-                return signal
-            vRef = np.reshape(traceRef['y'], (nSegment, int(nTotLength/nSegment)))
-            dIref = 2. * np.trapz(vCos * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            dQref = 2. * np.trapz(vSin * vRef[:,skipIndex:skipIndex+length]) / float(length-1)
-            # subtract the reference angle
-            dAngleRef = np.arctan2(dQref, dIref)
-            signal /= (np.cos(dAngleRef) + 1j*np.sin(dAngleRef))
-        return signal
+        # skip reference if trace length doesn't match
+        vRef = None
+        if traceRef is not None and len(traceRef['y']) == len(vY):
+            vRef = np.reshape(traceRef['y'],
+                              (nSegment, int(nTotLength/nSegment)))
+        # calc I/Q for all frequencies, in blocks of segments
+        return demodulation.demodulate(vData, dt if dt != 0 else 1.0, lFreq,
+                                       skipIndex, length, ref=vRef)
 
 
 if __name__ == '__main__':
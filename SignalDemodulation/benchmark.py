@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Benchmark the shared demodulation module against per-call kernels.
+
+Uses synthetic segmented traces, demodulated at several frequencies with a
+phase reference, as in the SignalDemodulation driver. The previous
+implementation, with cos/sin kernels re-calculated for every call, is
+compared to the cached weights of the demodulation module, in float64,
+float32 and with several threads. Run from the driver folder:
+
+    python benchmark.py
+
+"""
+import time
+
+import numpy as np
+
+import demodulation
+
+
+def demodulate_trapz(data, ref, dt, frequencies, n0, length):
+    # previous implementation, kernels and integration for every call
+    vTime = dt * (n0 + np.arange(length, dtype=float))
+    vData = data[:, n0:(n0 + length)]
+    vRef = ref[:, n0:(n0 + length)]
+    values = np.zeros((len(frequencies), data.shape[0]), dtype=complex)
+    for n, freq in enumerate(frequencies):
+        vCos = np.cos(2 * np.pi * freq * vTime)
+        vSin = np.sin(2 * np.pi * freq * vTime)
+        # subtract the reference angle
+        dAngleRef = np.arctan2(np.trapz(vSin * vRef), np.trapz(vCos * vRef))
+        values[n] = (2 * (np.trapz(vCos * vData) + 1j * np.trapz(vSin * vData))
+                     / float(length - 1) * np.exp(-1j * dAngleRef))
+    return values
+
+
+def run(n_segment, n_points, n_freq, n_repeat=3):
+    rng = np.random.RandomState(0)
+    data = rng.randn(n_segment, n_points)
+    ref = rng.randn(n_segment, n_points)
+    dt = 1E-9
+    frequencies = list(np.linspace(10E6, 90E6, n_freq))
+    (n0, length) = demodulation.get_window(dt, 10E-9, n_points * dt, n_points)
+    result = {}
+    for name, func in [
+            ('trapz', lambda: demodulate_trapz(data, ref, dt, frequencies,
+                                               n0, length)),
+            ('float64', lambda: demodulation.demodulate(
+                data, dt, frequencies, n0, length, ref=ref)),
+            ('float32', lambda: demodulation.demodulate(
+                data, dt, frequencies, n0, length, ref=ref,
+                dtype=np.float32)),
+            ('threads', lambda: demodulation.demodulate(
+                data, dt, frequencies, n0, length, ref=ref,
+                block_size=2**18, n_threads=4))]:
+        durations = []
+        for n in range(n_repeat):
+            start = time.perf_counter()
+            values = func()
+            durations.append(time.perf_counter() - start)
+        result[name] = (min(durations), values)
+    reference = result['trapz'][1]
+    scale = np.max(np.abs(reference))
+    return [(result[name][0], np.max(np.abs(result[name][1] - reference)) /
+             scale) for name in ('trapz', 'float64', 'float32', 'threads')]
+
+
+if __name__ == '__main__':
+    names = ('trapz', 'float64', 'float32', 'threads')
+    print('%8s %8s %5s ' % ('segments', 'points', 'freq') +
+          ' '.join(['%17s' % (name + ' (ms/err)') for name in names]))
+    for (n_segment, n_points, n_freq) in [
+            (1, 100000, 1),
+            (1000, 1000, 1),
+            (1000, 1000, 9),
+            (10000, 500, 9),
+            (200, 20000, 4)]:
+        result = run(n_segment, n_points, n_freq)
+        print('%8d %8d %5d ' % (n_segment, n_points, n_freq) +
+              ' '.join(['%8.1f/%8.1e' % (1E3 * t, error)
+                        for (t, error) in result]))
@@ -21,7 +21,12 @@ else:
 #                      "include_dirs":np.get_include()},
 #                      reload_support=True)
 
-from _integrateHNoNumpy_ForDriver import integrateH, integrateHy
+try:
+    # compiled batch integrator, build with compileCython.py
+    from _integrateHNoNumpy_ForDriver import integrateHyBatch
+except ImportError:
+    integrateHyBatch = None
+from integrateScan import integrateHyBatchScan
 
 #import matplotlib.pyplot as plt
 
@@ -152,8 +157,53 @@ class NoiseCfg():
 
 
 
+def integrateHyBatchNumpy(mStart, vDTime, mDelta, mDetuning, mY, nReshape):
+    # pure-NumPy version of integrateHyBatch, used if the compiled module is
+    # not available.  Simulate the time evolution for a batch of start states
+    # (nRep, 2), with mDelta, mDetuning and mY of shape (nRep, nStep).
+    # Output has shape (nRep, 2, nOut), keeping every nReshape:th state
+    nReshape = max(1, int(nReshape))
+    nStep = len(vDTime)
+    nOut = (nStep + nReshape) // nReshape
+    # precalc vectors
+    mEnergy = 0.5 * np.sqrt(mDelta**2 + mDetuning**2 + mY**2)
+    mAngle = 2*np.pi*mEnergy*vDTime
+    mCos = np.cos(mAngle)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mSinEn = np.sin(mAngle) / mEnergy
+    # take care of sin(x)/x division by zero
+    mSinEn = np.where(mEnergy == 0, 2 * np.pi * vDTime, mSinEn)
+    # elements of time-evolution operators
+    mU11 = mCos + 1j*0.5*mDetuning*mSinEn
+    mU12 = (mY + 1j*mDelta) * 0.5 * mSinEn
+    mU21 = (-mY + 1j*mDelta) * 0.5 * mSinEn
+    mU22 = mCos - 1j*0.5*mDetuning*mSinEn
+    # apply hamiltonian N times, for all repetitions at once
+    mState = np.zeros((len(mStart), 2, nOut), dtype='complex128')
+    a = np.array(mStart[:,0], dtype='complex128')
+    b = np.array(mStart[:,1], dtype='complex128')
+    mState[:,0,0] = a
+    mState[:,1,0] = b
+    for n1 in range(nStep):
+        a, b = (mU11[:,n1]*a + mU12[:,n1]*b, mU21[:,n1]*a + mU22[:,n1]*b)
+        if (n1 + 1) % nReshape == 0:
+            mState[:,0,(n1 + 1) // nReshape] = a
+            mState[:,1,(n1 + 1) // nReshape] = b
+    return mState
+
+
+
 class QubitSimulator():
 
+    # max number of elements (repetitions x time steps) to integrate at once
+    BATCH_SIZE = 2**21
+    # integration engines, the sequential engine is compiled if available,
+    # automatic uses the scan only if the compiled integrator is missing
+    AUTOMATIC = 'Automatic'
+    SCAN = 'Parallel scan'
+    SEQUENTIAL = 'Sequential'
+
+
     def __init__(self, simCfg = None):
         # init the object variables
         self.dDelta = 5
@@ -168,6 +218,7 @@ class QubitSimulator():
         self.bRotFrame = True
         self.bRemoveNoise = False
         self.bDriveCharge = True
+        self.sIntegrator = self.AUTOMATIC
         self.lNoiseCfg = [] # [NoiseCfg(bEmpty = True)]
         if simCfg is not None:
             # update simulation options
@@ -221,10 +272,43 @@ class QubitSimulator():
         return mState
         
 
+    def integrateHBatch(self, vStart, vTime, mDelta, mDetuning, mY, nReshape):
+        # simulate the time evolution for the start state vStart, for a batch
+        # of repetitions.  mDelta, mDetuning and mY are arrays of shape
+        # (nRep, len(vTime)), or 1D arrays/scalars shared by all repetitions.
+        # The output has shape (nRep, 2, nOut), each state is [Psi0 Psi1]'
+        #
+        lArray = []
+        for m in (mDelta, mDetuning, mY):
+            m = np.atleast_2d(np.asarray(m, dtype=float))
+            if m.shape[1] != len(vTime):
+                m = np.broadcast_to(m, (m.shape[0], len(vTime)))
+            lArray.append(np.ascontiguousarray(m))
+        (mDelta, mDetuning, mY) = lArray
+        nRep = max(m.shape[0] for m in lArray)
+        mStart = np.zeros((nRep, 2), dtype='complex128') + vStart
+        # get time steps
+        vDTime = np.diff(vTime).astype(float)
+        sIntegrator = self.sIntegrator
+        if sIntegrator == self.AUTOMATIC:
+            sIntegrator = self.SEQUENTIAL if integrateHyBatch is not None \
+                          else self.SCAN
+        if sIntegrator == self.SCAN:
+            return integrateHyBatchScan(mStart, vDTime, mDelta[:,:-1],
+                                        mDetuning[:,:-1], mY[:,:-1], nReshape)
+        if integrateHyBatch is None:
+            return integrateHyBatchNumpy(mStart, vDTime, mDelta[:,:-1],
+                                         mDetuning[:,:-1], mY[:,:-1], nReshape)
+        return integrateHyBatch(mStart, vDTime, mDelta, mDetuning, mY,
+                                int(nReshape))
+
+
     def goToRotatingFrame(self, mState, vTime, dDriveFreq, dTimeZero):
+        # mState is either a single state vector (2, nTime) or a batch of
+        # state vectors (nRep, 2, nTime)
         vRot = np.exp(-1j*np.pi*dDriveFreq*(vTime-dTimeZero))
-        mState[0,:] = vRot*mState[0,:] 
-        mState[1,:] = mState[1,:]/vRot 
+        mState[...,0,:] = vRot*mState[...,0,:] 
+        mState[...,1,:] = mState[...,1,:]/vRot 
         return mState
         
 #        for n2, dTime in enumerate(vTime):
@@ -298,10 +382,6 @@ class QubitSimulator():
         #
         # pre-allocate result vector
         vTimeReshape = vTime[0::nReshape]
-        vP1 = np.zeros(len(vTimeReshape))
-        vPx = np.zeros(len(vTimeReshape))
-        vPy = np.zeros(len(vTimeReshape))
-        #
         self.mPx = np.zeros((nRep, len(vTimeReshape)))
         self.mPy = np.zeros((nRep, len(vTimeReshape)))
         self.mPz = np.zeros((nRep, len(vTimeReshape)))
@@ -344,71 +424,76 @@ class QubitSimulator():
         # rotatation matrice
         mRotX = splin.expm(-1j*0.5*np.pi*0.5*mSx)
         mRotY = splin.expm(-1j*0.5*np.pi*0.5*mSy)
-        for n1 in range(nRep):
+        # integrate repetitions in batches, to limit memory usage
+        nBatch = max(1, min(nRep, self.BATCH_SIZE // len(vTime)))
+        for n0 in range(0, nRep, nBatch):
+            vRep = np.arange(n0, min(n0 + nBatch, nRep))
             # create new vectors for delta and detuning for each time step
-            vDelta = np.zeros(len(vTime)) + vStaticDelta[n1]
-            vDetuning = np.zeros(len(vTime)) + vStaticDet[n1]
-
-            # add noise to both delta and epsilon from all noise sources
-            if nRep>1:
-                for noise in lNoise:
-                    noise.addNoise(vDelta, vDetuning, dTimeStep*1E-9, 1E-9)
-
-            # add externally applied noise for the right repetition
-            if (noise_epsilon is not None):
-                noise_data = np.interp(vTime, noise_epsilon_t, noise_eps_m[n1])
-                vDetuning += noise_data
-            if (noise_delta is not None):
-                noise_data = np.interp(vTime, noise_delta_t, noise_delta_m[n1])
-                vDelta += noise_data
+            mDelta = np.zeros((len(vRep), len(vTime))) + \
+                vStaticDelta[vRep,np.newaxis]
+            mDetuning = np.zeros((len(vRep), len(vTime))) + \
+                vStaticDet[vRep,np.newaxis]
+
+            for n2, n1 in enumerate(vRep):
+                vDelta = mDelta[n2]
+                vDetuning = mDetuning[n2]
+                # add noise to both delta and epsilon from all noise sources
+                if nRep>1:
+                    for noise in lNoise:
+                        noise.addNoise(vDelta, vDetuning, dTimeStep*1E-9, 1E-9)
+
+                # add externally applied noise for the right repetition
+                if (noise_epsilon is not None):
+                    noise_data = np.interp(vTime, noise_epsilon_t, noise_eps_m[n1])
+                    vDetuning += noise_data
+                if (noise_delta is not None):
+                    noise_data = np.interp(vTime, noise_delta_t, noise_delta_m[n1])
+                    vDelta += noise_data
 
             # if wanted, remove noise where pulses are applied
             if self.bRemoveNoise:
-                vDelta[pulse_indx] = 0.0
-                vDetuning[pulse_indx] = 0.0
+                mDelta[:,pulse_indx] = 0.0
+                mDetuning[:,pulse_indx] = 0.0
 
             # combine noise with static bias points
-            vDelta += dDelta
-            vDetuning += dDetuning
+            mDelta += dDelta
+            mDetuning += dDetuning
+            vScaleDrive = (1.0 + vStaticDrive[vRep,np.newaxis])
  
              # do simulation, either using RWA or full Hamiltonian
             if bRWA:
                 # new frame, refer to drive frequency
-                vDetuning = np.sqrt(vDetuning**2 + vDelta**2) - dDriveFreq
-                mState = integrateHy(vStart, vTime, np.real(vDrive), vDetuning, 
-                                     -np.imag(vDrive), nReshape)
-                # mState = self.integrateH(vStart, vTime, np.real(vDrive), vDetuning, 
-                #     np.imag(vDrive), nReshape)
-
+                mDetuning = np.sqrt(mDetuning**2 + mDelta**2) - dDriveFreq
+                mState = self.integrateHBatch(vStart, vTime, np.real(vDrive),
+                                              mDetuning, -np.imag(vDrive),
+                                              nReshape)
             else:
                 # two different methonds depending if using Y-drive or not
                 if self.bDriveCharge:
                     # drive on Y (= charge)
-                    vY = vDrive * (1.0 + vStaticDrive[n1])
-                    mState = integrateHy(vStart, vTime, vDelta, vDetuning, vY, nReshape)
-                    # mState = self.integrateH(vStart, vTime, vDelta, vDetuning, vY, nReshape)
+                    mY = np.real(vDrive) * vScaleDrive
+                    mState = self.integrateHBatch(vStart, vTime, mDelta,
+                                                  mDetuning, mY, nReshape)
                 else:
                     # drive on Z (= flux)
-                    vDetuning += vDrive * (1.0 + vStaticDrive[n1])
-                    mState = integrateH(vStart, vTime, vDelta, vDetuning, nReshape)
-                    # vY = np.zeros_like(vDrive)
-                    # mState = self.integrateH(vStart, vTime, vDelta, vDetuning, vY, nReshape)
+                    mDetuning += np.real(vDrive) * vScaleDrive
+                    mState = self.integrateHBatch(vStart, vTime, mDelta,
+                                                  mDetuning, 0.0, nReshape)
                 # convert the results to an eigenbasis of dDelta, dDetuning
                 mState = self.convertToEigen(mState, dDelta0, dDetuning)
                 # go to the rotating frame (add timeStep/2 to get the right phase)
                 if bRotFrame:
                     mState = self.goToRotatingFrame(mState, vTimeReshape, dDriveFreq, dTimeZero+dTimeStep/2)
             # get probablity of measuring p1
-            mStateEig = mState
-            self.mPz[n1,:] = np.real(mStateEig[1,:]*np.conj(mStateEig[1,:]))
-            vP1 += self.mPz[n1,:]
+            self.mPz[vRep,:] = np.abs(mState[:,1,:])**2
             # get projection on X and Y
-            mStateEig = np.dot(mRotX,mState)
-            self.mPx[n1,:] = np.real(mStateEig[1,:]*np.conj(mStateEig[1,:]))
-            vPx += self.mPx[n1,:]
-            mStateEig = np.dot(mRotY,mState)
-            self.mPy[n1,:] = np.real(mStateEig[1,:]*np.conj(mStateEig[1,:]))
-            vPy += self.mPy[n1,:]
+            self.mPx[vRep,:] = np.abs(mRotX[1,0]*mState[:,0,:] +
+                                      mRotX[1,1]*mState[:,1,:])**2
+            self.mPy[vRep,:] = np.abs(mRotY[1,0]*mState[:,0,:] +
+                                      mRotY[1,1]*mState[:,1,:])**2
+        vP1 = np.sum(self.mPz, axis=0)
+        vPx = np.sum(self.mPx, axis=0)
+        vPy = np.sum(self.mPy, axis=0)
 
         # divide to get average
         vP1 = vP1/nRep
@@ -66,7 +66,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
                        bRelFreq=bool(self.getValue('Drive relative to qubit frequency')),
                        bRotFrame=bool(self.getValue('Use rotating frame')),
                        bRemoveNoise=bool(self.getValue('Disable noise during pulses')),
-                       bRWA=bool(self.getValue('Use rotating-wave approximation')))
+                       bRWA=bool(self.getValue('Use rotating-wave approximation')),
+                       sIntegrator=self.getValue('Integration engine'))
         if self.getValue('Drive type') == 'Charge':
             dConfig['bDriveCharge'] = True
         else:
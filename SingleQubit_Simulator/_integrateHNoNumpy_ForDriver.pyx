@@ -113,6 +113,66 @@ def integrateH_RWA(np.ndarray[double, ndim=1] vStart, np.ndarray[double, ndim=1]
        mState = mState[:,0::nReshape]
     return mState
 
+def integrateHyBatch(np.ndarray[complex, ndim=2] mStart, \
+  np.ndarray[double, ndim=1] vDTime, np.ndarray[double, ndim=2] mDelta, \
+  np.ndarray[double, ndim=2] mDetuning, np.ndarray[double, ndim=2] mY, \
+  int nReshape):
+    # simulate the time evolution for a batch of start states, mStart has
+    # shape (nRep, 2) and mDelta, mDetuning, mY have shape (nRep, nTime) or
+    # (1, nTime), with nTime > nStep = len(vDTime).  Arrays with a single row
+    # are used for all repetitions.
+    # The output has shape (nRep, 2, nOut), keeping every nReshape:th state
+    cdef Py_ssize_t n1, n2, n3, nOut, nD, nE, nY
+    cdef Py_ssize_t nRep = mStart.shape[0], nStep = vDTime.shape[0]
+    cdef double ar, ai, br, bi, cr, ci, dCos, dX, dY, dZ
+    cdef np.ndarray[double, ndim=1] vCos, vSinEn
+    if nReshape < 1:
+        nReshape = 1
+    nOut = (nStep + nReshape) // nReshape
+    cdef np.ndarray[complex, ndim=3] mState = \
+        np.zeros((nRep, 2, nOut), dtype='complex')
+    for n2 in range(nRep):
+        # rows to use for this repetition
+        nD = n2 if mDelta.shape[0] > 1 else 0
+        nE = n2 if mDetuning.shape[0] > 1 else 0
+        nY = n2 if mY.shape[0] > 1 else 0
+        # precalc vectors for this repetition
+        vEnergy = 0.5*np.sqrt(mDelta[nD,:nStep]**2 + \
+                              mDetuning[nE,:nStep]**2 + mY[nY,:nStep]**2)
+        vAngle = 2*np.pi*vEnergy*vDTime
+        vCos = np.cos(vAngle)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vSinEn = np.sin(vAngle)/vEnergy
+        # take care of sin(x)/x division by zero
+        nan_indx = np.isnan(vSinEn)
+        vSinEn[nan_indx] = 2 * np.pi * vDTime[nan_indx]
+        # apply hamiltonian N times, using real arithmetic
+        ar = mStart[n2,0].real
+        ai = mStart[n2,0].imag
+        br = mStart[n2,1].real
+        bi = mStart[n2,1].imag
+        mState[n2,0,0] = mStart[n2,0]
+        mState[n2,1,0] = mStart[n2,1]
+        n3 = 0
+        for n1 in range(nStep):
+            dCos = vCos[n1]
+            dZ = 0.5*mDetuning[nE,n1]*vSinEn[n1]
+            dX = 0.5*mDelta[nD,n1]*vSinEn[n1]
+            dY = 0.5*mY[nY,n1]*vSinEn[n1]
+            # U = [[cos + iZ, Y + iX], [-Y + iX, cos - iZ]]
+            cr = dCos*ar - dZ*ai + dY*br - dX*bi
+            ci = dCos*ai + dZ*ar + dY*bi + dX*br
+            br, bi = (-dY*ar - dX*ai + dCos*br + dZ*bi,
+                      -dY*ai + dX*ar + dCos*bi - dZ*br)
+            ar = cr
+            ai = ci
+            n3 += 1
+            if n3 == nReshape:
+                n3 = 0
+                mState[n2,0,(n1 + 1) // nReshape] = ar + 1j*ai
+                mState[n2,1,(n1 + 1) // nReshape] = br + 1j*bi
+    return mState
+
 #    mSx = np.array([[0.,1.],[1.,0.]])
 #    mSy = np.array([[0.,-1j],[1j,0.]])
 #    mSz = np.array([[1.,0.],[0.,-1.]])
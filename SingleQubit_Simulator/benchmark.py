@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Benchmark the integration engines of the single-qubit simulator.
+
+Run from the driver folder:
+
+    python benchmark.py
+
+"""
+import time
+
+import numpy as np
+
+import QubitSimulator_ForDriver
+from QubitSimulator_ForDriver import NoiseCfg, QubitSimulator
+
+
+def benchmarkIntegrator(sIntegrator, nPts, nRep, dTimeStepOut, nCall=3):
+    # average simulation time for a Rabi-type pulse with static noise
+    vTime = np.arange(nPts)
+    vI = np.where((vTime > nPts // 8) & (vTime < nPts // 2), 0.5, 0.0)
+    vQ = np.zeros(nPts)
+    noise = NoiseCfg()
+    noise.model = NoiseCfg.NOISESTATIC
+    sim = QubitSimulator(dict(dDelta=5.0, dDetuning=0.1, dRabiAmp=0.05,
+                              dTimeStep=0.02, nRep=nRep, lNoiseCfg=[noise],
+                              sIntegrator=sIntegrator))
+    dTime = 0.0
+    for n in range(nCall):
+        np.random.seed(n)
+        start_time = time.time()
+        sim.performSimulation(vI, vQ, 0.02, dTimeStepOut)
+        dTime += time.time() - start_time
+    return dTime / nCall
+
+
+if __name__ == '__main__':
+    bCompiled = QubitSimulator_ForDriver.integrateHyBatch is not None
+    print('Sequential engine: %s' % ('compiled' if bCompiled else 'NumPy'))
+    for (nPts, nRep, dTimeStepOut) in [(200000, 1, 1.0), (2000000, 1, 1.0),
+                                       (4000, 1000, 1.0), (50000, 20, 0.02)]:
+        lResult = []
+        for sIntegrator in (QubitSimulator.SEQUENTIAL, QubitSimulator.SCAN):
+            lResult.append(benchmarkIntegrator(sIntegrator, nPts, nRep,
+                                               dTimeStepOut))
+        print('%8d steps, %4d reps, output %.2f ns: ' % (
+              nPts, nRep, dTimeStepOut) +
+              'sequential %.3f s, parallel scan %.3f s' % tuple(lResult))
@@ -1,5 +1,5 @@
-from distutils.core import setup
-from distutils.extension import Extension
+from setuptools import setup
+from setuptools.extension import Extension
 from Cython.Build import cythonize
 import numpy as np
 extensions = [
@@ -8,11 +8,13 @@ extensions = [
 setup(
     ext_modules = cythonize(extensions))
 
+# The compiled module is optional, without it the simulator falls back to a
+# slower pure-NumPy integrator.
+
 # WIN: use same compiler as for python, Microsoft Build Tools for Visual Studio 2017 or 
 # Microsoft Visual C++ Build Tools 2015.
 # see https://wiki.python.org/moin/WindowsCompilers  
 # run with python .\compileCython.py build_ext --inplace 
 
-# MAC, Py3: run with python compileCython.py build_ext --inplace
+# MAC/LINUX, Py3: run with python compileCython.py build_ext --inplace
                 
-
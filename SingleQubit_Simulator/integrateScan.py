@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Parallel-in-time integrator for the single-qubit simulator.
+
+The time evolution is a product of SU(2) step operators, each stored as the
+pair (a, b) representing U = [[a, b], [-conj(b), conj(a)]].  The product of
+the steps within each output window of nReshape steps is found by a tree
+reduction, and the prefix products over windows by an associative scan, so
+that only the decimated states are stored.  Time is split in blocks that are
+processed in a thread pool, NumPy releases the GIL for the array operations.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# max number of steps (repetitions x time steps) per block
+BLOCK_SIZE = 2**18
+
+
+def mulSU2(a1, b1, a2, b2):
+    # product U1*U2 of SU(2) operators given as (a, b) pairs
+    return (a1*a2 - b1*np.conj(b2), a1*b2 + b1*np.conj(a2))
+
+
+def reduceWindows(mA, mB):
+    # product of all steps along the last axis, later steps to the left
+    while mA.shape[-1] > 1:
+        nPair = mA.shape[-1] // 2
+        (mA2, mB2) = mulSU2(mA[...,1:2*nPair:2], mB[...,1:2*nPair:2],
+                            mA[...,0:2*nPair:2], mB[...,0:2*nPair:2])
+        if mA.shape[-1] % 2:
+            # odd number of steps, keep last step for next level
+            mA2 = np.concatenate((mA2, mA[...,-1:]), axis=-1)
+            mB2 = np.concatenate((mB2, mB[...,-1:]), axis=-1)
+        (mA, mB) = (mA2, mB2)
+    return (mA[...,0], mB[...,0])
+
+
+def scanWindows(mA, mB):
+    # inclusive prefix products along the last axis, later steps to the left
+    n = 1
+    while n < mA.shape[-1]:
+        (mA2, mB2) = mulSU2(mA[...,n:], mB[...,n:], mA[...,:-n], mB[...,:-n])
+        mA = np.concatenate((mA[...,:n], mA2), axis=-1)
+        mB = np.concatenate((mB[...,:n], mB2), axis=-1)
+        n *= 2
+    return (mA, mB)
+
+
+def getSteps(vDTime, mDelta, mDetuning, mY):
+    # calculate SU(2) step operators, same definition as the Cython kernel
+    mEnergy = 0.5 * np.sqrt(mDelta**2 + mDetuning**2 + mY**2)
+    mAngle = 2*np.pi*mEnergy*vDTime
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mSinEn = np.sin(mAngle) / mEnergy
+    # take care of sin(x)/x division by zero
+    mSinEn = np.where(mEnergy == 0, 2 * np.pi * vDTime, mSinEn)
+    mA = np.cos(mAngle) + 0.5j*mDetuning*mSinEn
+    mB = (mY + 1j*mDelta) * 0.5 * mSinEn
+    return (mA, mB)
+
+
+def integrateHyBatchScan(mStart, vDTime, mDelta, mDetuning, mY, nReshape,
+                         nWorker=None):
+    # simulate the time evolution for a batch of start states (nRep, 2), with
+    # mDelta, mDetuning and mY of shape (nRep, nStep), or (1, nStep) if shared
+    # by all repetitions.  Output has shape (nRep, 2, nOut), keeping every
+    # nReshape:th state, same as integrateHyBatch
+    nReshape = max(1, int(nReshape))
+    nRep = len(mStart)
+    nStep = len(vDTime)
+    nWin = nStep // nReshape
+    nOut = nWin + 1
+    mState = np.zeros((nRep, 2, nOut), dtype='complex128')
+    mState[:,:,0] = mStart
+    if nWin == 0:
+        return mState
+    # split windows in blocks of bounded size
+    nWinBlock = max(1, BLOCK_SIZE // (nRep * nReshape))
+    lBlock = [(n1, min(n1 + nWinBlock, nWin))
+              for n1 in range(0, nWin, nWinBlock)]
+
+    def scanBlock(block):
+        # prefix products of windows in block, shape (nRep, nWinInBlock)
+        (n1, n2) = block
+        (k1, k2) = (n1*nReshape, n2*nReshape)
+        (mA, mB) = getSteps(vDTime[k1:k2], mDelta[:,k1:k2],
+                            mDetuning[:,k1:k2], mY[:,k1:k2])
+        mA = np.broadcast_to(mA, (nRep, k2 - k1))
+        mB = np.broadcast_to(mB, (nRep, k2 - k1))
+        shape = (nRep, n2 - n1, nReshape)
+        (mA, mB) = reduceWindows(mA.reshape(shape), mB.reshape(shape))
+        return scanWindows(mA, mB)
+
+    if nWorker is None:
+        nWorker = os.cpu_count() or 1
+    if nWorker > 1 and len(lBlock) > 1:
+        with ThreadPoolExecutor(max_workers=nWorker) as executor:
+            lScan = list(executor.map(scanBlock, lBlock))
+    else:
+        lScan = [scanBlock(block) for block in lBlock]
+
+    # propagate start states from block to block and apply local prefixes
+    vX = mState[:,0,0].copy()
+    vY = mState[:,1,0].copy()
+    for (n1, n2), (mA, mB) in zip(lBlock, lScan):
+        mState[:,0,n1+1:n2+1] = mA*vX[:,np.newaxis] + mB*vY[:,np.newaxis]
+        mState[:,1,n1+1:n2+1] = (-np.conj(mB)*vX[:,np.newaxis] +
+                                 np.conj(mA)*vY[:,np.newaxis])
+        vX = mState[:,0,n2].copy()
+        vY = mState[:,1,n2].copy()
+    return mState
+
+
+if __name__ == '__main__':
+    pass
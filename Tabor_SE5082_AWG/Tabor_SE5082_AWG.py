@@ -37,8 +37,10 @@ class Driver(VISA_Driver):
         self.timeout_ms = int(1000 * self.dComCfg['Timeout'])
         self.nCh = 2
         self.lWaveUpdated = [False] * self.nCh
+        self.lInUse = [False] * self.nCh
         # clear all waveforms
         self.writeAndLog(':TRAC:DEL:ALL')
+        self.lOldU16 = [np.array([], dtype=np.uint16) for n in range(self.nCh)]
 
 
     def initSetConfig(self):
@@ -52,6 +54,7 @@ class Driver(VISA_Driver):
             self.setValue('Ch %d - Marker 2' % channel, [])
             # clear all
             self.writeAndLog(':INST %d;:TRAC:DEL:ALL' % channel)
+            self.lOldU16[n] = np.array([], dtype=np.uint16)
 
 
     def performSetValue(self, quant, value, sweepRate=0.0, options={}):
@@ -162,13 +165,21 @@ class Driver(VISA_Driver):
         return vU16
 
 
+    def clearWaveformOnAWG(self, channel):
+        """Turn off output and clear old traces, if any"""
+        n = channel - 1
+        self.lInUse[n] = False
+        if len(self.lOldU16[n]) > 0:
+            self.writeAndLog(':INST %d;:OUTP 0' % channel)
+            self.writeAndLog(':TRAC:DEL:ALL')
+            self.lOldU16[n] = np.array([], dtype=np.uint16)
+
+
     def sendWaveformToAWG(self, channel, vData, vMark1, vMark2):
-        """Send waveform to Tek"""
-        # turn off output and clear old traces
-        self.writeAndLog(':INST %d;:OUTP 0' % channel)
-        self.writeAndLog(':TRAC:DEL:ALL')
+        """Send waveform to AWG, returns True if data was sent"""
         # if output is disabled, stop here
         if not self.getValue('Ch%d - Enabled' % channel):
+            self.clearWaveformOnAWG(channel)
             return False
 
         # channels are named 1-2
@@ -176,7 +187,7 @@ class Driver(VISA_Driver):
         if len(vData) == 0:
             if len(vMark1) == 0 and len(vMark2) == 0:
                 # turn off, clear, go to next channel
-                self.lInUse[n] = False
+                self.clearWaveformOnAWG(channel)
                 return False
             else:
                 # no data, but markers exist, output zeros for data
@@ -204,10 +215,24 @@ class Driver(VISA_Driver):
             vU16 = np.pad(vU16, (0, 32 - (len(vU16) % 32)), 'constant',
                           constant_values=2047)
 
-        self.writeAndLog(':TRAC:DEF 1, %d' % len(vU16))
+        # compare to previous trace, unchanged channels are not re-sent
+        if np.array_equal(vU16, self.lOldU16[n]):
+            return False
+        # turn off output, only re-define trace if length changed
+        self.writeAndLog(':INST %d;:OUTP 0' % channel)
+        if len(vU16) != len(self.lOldU16[n]):
+            self.writeAndLog(':TRAC:DEL:ALL')
+            self.writeAndLog(':TRAC:DEF 1, %d' % len(vU16))
         self.writeAndLog(':TRAC:SEL 1')
-        download_binary_data(self.com, 'TRAC:DATA', vU16, len(vU16) * 2,
-                             paranoia_level=0)
+        # mark trace as unknown until data is sent
+        self.lOldU16[n] = np.zeros(len(vU16), dtype=np.uint16) + 2**15
+        count = download_binary_data(
+            self.com, 'TRAC:DATA', vU16, len(vU16) * 2, paranoia_level=0,
+            max_chunk_size=int(self.getValue('Transfer chunk size')))
+        if count < 0:
+            raise Error('Failed to send waveform to channel %d' % channel)
+        # store new waveform for next call
+        self.lOldU16[n] = vU16
         return True
 
 
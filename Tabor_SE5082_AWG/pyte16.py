@@ -450,7 +450,7 @@ def write_raw_string(vi, wr_str):
 
     return ret_count
 
-def write_raw_bin_dat(vi, bin_dat, dat_size, max_chunk_size = 1024):
+def write_raw_bin_dat(vi, bin_dat, dat_size, max_chunk_size = 2**20):
     """Write raw binary data to device.
 
     The binary data is sent in chunks of up to `max_chunk_size` bytes
@@ -537,18 +537,22 @@ def send_cmd(vi, cmd_str, paranoia_level=1):
     else:
         vi.write(cmd_str)
 
-def _pre_download_binary_data(vi, bin_dat_size=None):
+def _pre_download_binary_data(vi, bin_dat_size=None, max_chunk_size=None):
     '''Pre-Download Binary-Data
 
     :param vi: `pyvisa` instrument.
     :param bin_dat_size: the binary-data-size in bytes (can be omitted)
+    :param max_chunk_size: the max write-chunk size in bytes (default: the write-buffer size, at most 256000)
     :returns: the max write-chunk size (in bytes) and the original time-out (in msec)
     '''
     orig_timeout = vi.timeout
-    max_chunk_size = 4096
+    chunk_size_limit = max_chunk_size
+    if max_chunk_size is None:
+        max_chunk_size = 4096
 
     try:
-        max_chunk_size = vi.__dict__.get('write_buff_size', default=max_chunk_size)
+        if chunk_size_limit is None:
+            max_chunk_size = vi.__dict__.get('write_buff_size', max_chunk_size)
         intf_type = vi.get_visa_attribute(vc.VI_ATTR_INTF_TYPE)
         if intf_type == vc.VI_INTF_GPIB:
             _ = vi.write("*OPC?")
@@ -560,7 +564,7 @@ def _pre_download_binary_data(vi, bin_dat_size=None):
             max_chunk_size = min(max_chunk_size, 30000)
             if bin_dat_size is not None and orig_timeout < bin_dat_size / 20:
                 vi.timeout = int(bin_dat_size / 20)
-        else:
+        elif chunk_size_limit is None:
             max_chunk_size = min(max_chunk_size, 256000)
     except:
         pass
@@ -577,7 +581,7 @@ def _post_download_binary_data(vi, orig_timeout):
     if orig_timeout is not None and vi.timeout != orig_timeout:
         vi.timeout = orig_timeout
 
-def download_binary_data(vi, pref, bin_dat, dat_size, paranoia_level=1):
+def download_binary_data(vi, pref, bin_dat, dat_size, paranoia_level=1, max_chunk_size=None):
     """Download binary data to instrument.
 
     Notes:
@@ -589,6 +593,7 @@ def download_binary_data(vi, pref, bin_dat, dat_size, paranoia_level=1):
     :param bin_dat: the binary data buffer.
     :param dat_size: the data-size in bytes.
     :param paranoia_level: paranoia-level (0:low, 1:normal, 2:high)
+    :param max_chunk_size: the max write-chunk size in bytes (can be omitted)
     :returns: written-bytes count.
 
     Example:
@@ -612,7 +617,7 @@ def download_binary_data(vi, pref, bin_dat, dat_size, paranoia_level=1):
     ret_count = 0
 
     try:
-        orig_timeout, max_chunk_size = _pre_download_binary_data(vi, dat_size)
+        orig_timeout, max_chunk_size = _pre_download_binary_data(vi, dat_size, max_chunk_size)
 
         try:
             dat_header = make_bin_dat_header(dat_size, pref)
@@ -1248,6 +1253,28 @@ def add_markers(dat_buff, marker_pos, marker_width, marker_bit1, marker_bit2, da
             if seg_pos % 16 == 0:
                 seg_pos += 8
 
+def _interleave_wave(wav, dest_array, wr_offs, quantum):
+    '''Write `wav` to every other `quantum`-chunk of `dest_array`, starting at `wr_offs`.
+
+    Points that do not fit in `dest_array` are dropped.
+    '''
+    avail = len(dest_array) - wr_offs
+    if avail <= 0:
+        return
+    # number of points that fit, a full quantum per 2*quantum block
+    num_blocks, rem = divmod(avail, 2 * quantum)
+    num_pts = min(len(wav), num_blocks * quantum + min(rem, quantum))
+    # complete blocks as a reshaped view, the rest is at most one quantum
+    num_full = min(num_pts // quantum, num_blocks)
+    if num_full > 0:
+        dest_blocks = dest_array[wr_offs : wr_offs + num_full * 2 * quantum]
+        dest_blocks = dest_blocks.reshape(num_full, 2 * quantum)
+        dest_blocks[:, :quantum] = np.reshape(wav[:num_full * quantum], (num_full, quantum))
+    tail = num_pts - num_full * quantum
+    if tail > 0:
+        wr_offs = wr_offs + num_full * 2 * quantum
+        dest_array[wr_offs : wr_offs + tail] = wav[num_full * quantum : num_pts]
+
 def make_combined_wave(wav1, wav2, dest_array, dest_array_offset=0, add_idle_pts=False, quantum=16):
     '''Make 2-channels combined wave from the 2 given waves
 
@@ -1288,43 +1315,21 @@ def make_combined_wave(wav1, wav2, dest_array, dest_array_offset=0, add_idle_pts
 
     dest_len = len(dest_array)
 
-    if min(quantum, len2) > 0:
-        rd_offs = 0
-        wr_offs = dest_array_offset
-        if add_idle_pts:
-            wr_offs = wr_offs + 2 * quantum
-
-        while rd_offs < len2 and wr_offs < dest_len:
-            chunk_len = min((quantum, len2 - rd_offs, dest_len - wr_offs))
-            dest_array[wr_offs : wr_offs + chunk_len] = wav2[rd_offs : rd_offs + chunk_len]
-            rd_offs = rd_offs + chunk_len
-            wr_offs = wr_offs + chunk_len + quantum
-
-        if add_idle_pts:
-            rd_offs = 0
-            wr_offs = dest_array_offset
-            chunk_len = min(quantum, dest_len - wr_offs)
-            if chunk_len > 0:
-                dest_array[wr_offs : wr_offs + chunk_len] = wav2[0]
+    # wave 2 goes to the first quantum of each 2*quantum block, wave 1 to the second
+    for wav, wav_len, chan_offs in ((wav2, len2, 0), (wav1, len1, quantum)):
+        if min(quantum, wav_len) <= 0:
+            continue
 
-    if min(quantum, len1) > 0:
-        rd_offs = 0
-        wr_offs = dest_array_offset + quantum
+        wr_offs = dest_array_offset + chan_offs
         if add_idle_pts:
             wr_offs = wr_offs + 2 * quantum
-
-        while rd_offs < len1 and wr_offs < dest_len:
-            chunk_len = min((quantum, len1 - rd_offs, dest_len - wr_offs))
-            dest_array[wr_offs : wr_offs + chunk_len] = wav1[rd_offs : rd_offs + chunk_len]
-            rd_offs = rd_offs + chunk_len
-            wr_offs = wr_offs + chunk_len + quantum
+        _interleave_wave(wav, dest_array, wr_offs, quantum)
 
         if add_idle_pts:
-            rd_offs = 0
-            wr_offs = dest_array_offset + quantum
+            wr_offs = dest_array_offset + chan_offs
             chunk_len = min(quantum, dest_len - wr_offs)
             if chunk_len > 0:
-                dest_array[wr_offs : wr_offs + chunk_len] = wav1[0]
+                dest_array[wr_offs : wr_offs + chunk_len] = wav[0]
 
     return dest_array_offset + tot_len
 
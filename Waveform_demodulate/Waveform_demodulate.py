@@ -8,10 +8,15 @@ from scipy.optimize import leastsq
 from numpy.fft import fft, fftshift, fftfreq
 import h5py
 
+import demodulation
+
 
 class Driver(InstrumentDriver.InstrumentWorker):
     """ This class implements a Single-qubit pulse generator"""
 
+    # max number of samples per chunk of periods when demodulating
+    BLOCK_SIZE = 2**20
+
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
         # init variables
@@ -55,42 +60,49 @@ class Driver(InstrumentDriver.InstrumentWorker):
             value = quant.getValue()
         return value
         
-    def demodulate(self, vWaveform):   
-      
-        #demodulate
+    def demodulate(self, vWaveform):
+        """Demodulate waveform, integrating over each modulation period.
+
+        The trace is only resampled if the sample rate is not an integer
+        multiple of the modulation frequency. Periods are integrated in
+        chunks, to limit the size of temporary arrays for long traces.
+        """
         nModFreq = self.getValue('Modulation Freq')
         nSampleRate = self.getValue('Sample Rate')
         nWavLength = len(vWaveform)
-        vTvals = np.linspace(0,nWavLength/nSampleRate, nWavLength, endpoint = False)
-        
-        
-        
         mod_period = 1/nModFreq
-        #period_num = int(np.floor((self.vRTime[-1]+dt)/mod_period))
-        response_int = []
-        t_int = []
-        
-        period_num = (vTvals[-1] - vTvals[0]) * nModFreq
-        samples_period = int(nSampleRate/nModFreq)
-        
-        vWaveform = resample(vWaveform, int(period_num*samples_period))#sinc function interpolation
-        
-        vTvals = np.linspace(0, nWavLength/nSampleRate, len(vWaveform), endpoint = False)
-
+        dRatio = nSampleRate/nModFreq
+        samples_period = int(round(dRatio))
+        if samples_period < 1 or abs(dRatio - samples_period) > 1E-9*dRatio:
+            # sinc function interpolation to an integer number of samples
+            # per period
+            period_num = (nWavLength - 1)/nSampleRate * nModFreq
+            samples_period = int(dRatio)
+            if samples_period < 1:
+                return mod_period, np.array([], dtype=complex)
+            vWaveform = resample(vWaveform, int(period_num*samples_period))
+        dt = nWavLength/nSampleRate/len(vWaveform)
         avg = np.mean(vWaveform)
-        demod = 2*(vWaveform-avg)*np.exp(-1j*(2*np.pi*(nModFreq)*vTvals))
 
-        #integrate over each modulation period
-        vResponse = np.array([], dtype = complex)
-        t_int = []
-        for n in range(0,int(np.floor(period_num))):
-            start = n*samples_period
-            end = (n+1)*samples_period
-            vResponse = np.append(vResponse, np.mean(demod[start:end]))
-            t_int.append(np.mean(vTvals[start:end]))
+        # integrate over each modulation period, periods are demodulated
+        # with the phase of the first period, then rotated by the phase of
+        # the start of the period
+        nPeriod = len(vWaveform) // samples_period
+        vResponse = np.zeros(nPeriod, dtype=complex)
+        dPeriodPhase = 2*np.pi*nModFreq*dt*samples_period
+        nChunk = max(1, self.BLOCK_SIZE // samples_period)
+        for n1 in range(0, nPeriod, nChunk):
+            n2 = min(n1 + nChunk, nPeriod)
+            vPeriods = np.reshape(
+                vWaveform[n1*samples_period:n2*samples_period] - avg,
+                (n2 - n1, samples_period))
+            # mean of 2*signal*exp(-i 2 pi f t) over each period
+            vValues = demodulation.demodulate(vPeriods, dt, [nModFreq],
+                                              window='mean')[0]
+            vResponse[n1:n2] = np.conj(vValues) * np.exp(
+                -1j*dPeriodPhase*np.arange(n1, n2))
+        return mod_period, vResponse
 
-        return mod_period, vResponse      
-      
 
 if __name__ == '__main__':
     pass
\ No newline at end of file